@@ -0,0 +1,254 @@
+"""ASGI entry point for the metrics API, for asyncio servers such as uvicorn.
+
+    python serve.py --server uvicorn --workers 2 --threads 8
+    uvicorn asgi_app:app --workers 2
+
+Serves the same Flask routes: every request is handed to metrics_api.app on a
+bounded thread pool (METRICS_ASGI_THREADS threads per process), so the event
+loop only parses HTTP and holds idle connections, and no more than that many
+SQLite queries run at once however many sessions are connected.
+
+Identical GET requests that arrive while the first one is still running are
+coalesced: they wait for that execution and get a copy of its response
+instead of running the same queries again.  Requests match on method, path,
+query string and the headers a response depends on (conditional and Accept
+headers).  Streamed responses (ndjson, exports) are never shared; a request
+that was waiting on one runs on its own.
+
+A streamed body is read from the WSGI iterable on the same pool thread that
+produced the response (its cursor belongs to that thread's connection) and
+handed to the event loop through a small queue, so slow clients hold back the
+query instead of buffering the result.
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics_api import app as wsgi_app
+
+ASGI_THREADS = int(os.environ.get('METRICS_ASGI_THREADS', 8))
+ASGI_COALESCE = os.environ.get('METRICS_ASGI_COALESCE', '1') == '1'
+# Streamed chunks buffered between the pool thread and a slow client
+STREAM_QUEUE_SIZE = 8
+# Request headers a response may depend on; part of the coalescing key
+VARYING_HEADERS = ('if-none-match', 'if-modified-since', 'accept', 'accept-encoding')
+
+
+def wsgi_environ(scope, body):
+    """PEP 3333 environ for an ASGI http scope."""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class Exchange:
+    """One WSGI call, produced on a pool thread and consumed on the event loop.
+
+    head resolves to (status, headers, body); body is None for a streamed
+    response, whose chunks then arrive on the queue (None ends it).
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.head = loop.create_future()
+        self.chunks = asyncio.Queue(STREAM_QUEUE_SIZE)
+        self.cancelled = False
+
+    def resolve(self, value=None, error=None):
+        def set_head():
+            if self.head.done():
+                return
+            if error is not None:
+                self.head.set_exception(error)
+            else:
+                self.head.set_result(value)
+        self.loop.call_soon_threadsafe(set_head)
+
+    def put(self, chunk):
+        # Blocks the pool thread while the queue is full
+        asyncio.run_coroutine_threadsafe(self.chunks.put(chunk), self.loop).result()
+
+
+class MetricsASGI:
+    """ASGI application running a WSGI app on a bounded thread pool, with request coalescing."""
+
+    def __init__(self, wsgi, threads=ASGI_THREADS, coalesce=ASGI_COALESCE):
+        self.wsgi = wsgi
+        self.threads = threads
+        self.coalesce = coalesce
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='metrics-asgi')
+        self._in_flight = {}
+        self.stats = {'requests': 0, 'executed': 0, 'coalesced': 0}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # --- requests ---------------------------------------------------------
+
+    async def _http(self, scope, receive, send):
+        body = b''
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        self.stats['requests'] += 1
+        key = self._coalescing_key(scope, body)
+
+        if key is not None:
+            shared = self._in_flight.get(key)
+            if shared is not None:
+                try:
+                    head = await asyncio.shield(shared.head)
+                except Exception:
+                    head = None
+                if head is not None and head[2] is not None:
+                    self.stats['coalesced'] += 1
+                    await self._send_head(send, head, more_body=False)
+                    return
+
+        exchange = self._start(wsgi_environ(scope, body))
+        if key is not None and key not in self._in_flight:
+            self._in_flight[key] = exchange
+            exchange.head.add_done_callback(lambda _: self._release(key, exchange))
+        try:
+            head = await exchange.head
+        except Exception as e:
+            print(f"Error in {scope['path']}: {e}")
+            await self._send_head(send, (500, [(b'content-type', b'text/plain')], b'Internal Server Error'), False)
+            return
+        if head[2] is not None:
+            await self._send_head(send, head, more_body=False)
+            return
+        await self._stream(send, head, exchange)
+
+    def _coalescing_key(self, scope, body):
+        if not self.coalesce or scope['method'] not in ('GET', 'HEAD') or body:
+            return None
+        headers = dict(scope['headers'])
+        return (
+            scope['method'], scope['path'], scope['query_string'],
+            tuple(headers.get(name.encode('latin-1')) for name in VARYING_HEADERS),
+        )
+
+    def _release(self, key, exchange):
+        if self._in_flight.get(key) is exchange:
+            del self._in_flight[key]
+
+    def _start(self, environ):
+        exchange = Exchange(asyncio.get_running_loop())
+        self.stats['executed'] += 1
+        self.executor.submit(self._run_wsgi, environ, exchange)
+        return exchange
+
+    def _run_wsgi(self, environ, exchange):
+        """Pool thread: call the app, then hand over the whole body or stream it chunk by chunk."""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+            ]
+            return lambda data: None
+
+        streaming = False
+        try:
+            iterable = self.wsgi(environ, start_response)
+            try:
+                if any(name == b'content-length' for name, _ in response['headers']):
+                    body = b''.join(iterable)
+                    exchange.resolve((response['status'], response['headers'], body))
+                    return
+                streaming = True
+                exchange.resolve((response['status'], response['headers'], None))
+                for chunk in iterable:
+                    if exchange.cancelled:
+                        break
+                    if chunk:
+                        exchange.put(chunk)
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        except Exception as e:
+            if streaming:
+                print(f"Error while streaming {environ['PATH_INFO']}: {e}")
+            exchange.resolve(error=e)
+        finally:
+            if streaming:
+                exchange.put(None)
+
+    # --- responses --------------------------------------------------------
+
+    async def _send_head(self, send, head, more_body):
+        status, headers, body = head
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body or b'', 'more_body': more_body})
+
+    async def _stream(self, send, head, exchange):
+        try:
+            await self._send_head(send, head, more_body=True)
+            while True:
+                chunk = await exchange.chunks.get()
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except (OSError, asyncio.CancelledError):
+            # Client went away: stop the pool thread and drain what it still puts
+            exchange.cancelled = True
+            while await exchange.chunks.get() is not None:
+                pass
+            raise
+
+
+app = MetricsASGI(wsgi_app)
@@ -0,0 +1,70 @@
+"""Compare per-request sqlite3.connect() against the pooled connections.
+
+Usage:
+    python benchmarks/bench_connections.py path/to/mydata.db [--iterations 2000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool
+
+# Representative request: the Leads tab KPI count for one project
+QUERY = (
+    "SELECT COUNT(*) FROM ActivityRelationshipView "
+    "WHERE Relationship_Status = 'Incomplete' AND Lag < 0"
+)
+
+
+def run_per_request(db_path, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        conn = sqlite3.connect(db_path)
+        conn.execute(QUERY).fetchone()
+        conn.close()
+    return time.perf_counter() - start
+
+
+def run_pooled(db_path, iterations):
+    pool = ConnectionPool(db_path)
+    pool.connection().execute(QUERY).fetchone()  # warm-up, as a live worker would be
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pool.connection().execute(QUERY).fetchone()
+    elapsed = time.perf_counter() - start
+    pool.discard()
+    return elapsed
+
+
+def run_overhead_only(db_path, iterations):
+    # Connection setup + schema load without any query work
+    start = time.perf_counter()
+    for _ in range(iterations):
+        conn = sqlite3.connect(db_path)
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+        conn.close()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db_path')
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    results = [
+        ('connect per request', run_per_request(args.db_path, args.iterations)),
+        ('pooled connection', run_pooled(args.db_path, args.iterations)),
+        ('connect overhead only', run_overhead_only(args.db_path, args.iterations)),
+    ]
+    print(f"{'mode':<24}{'total (s)':>12}{'per request (ms)':>20}")
+    for name, elapsed in results:
+        print(f"{name:<24}{elapsed:>12.3f}{elapsed * 1000 / args.iterations:>20.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""Latency, throughput and memory of every /api/* route under the dashboard's filter mixes.
+
+Runs the Flask app in-process (no HTTP) against a database, e.g. one made by
+generate_schedule.py.  Every /api/* GET route (each metric family for the
+/api/<family>/... routes) is requested with each filter mix in FILTER_MIXES:
+
+  latency      p50 / p95 / max over --repeat timed requests after a warm-up
+  throughput   requests per second with --threads concurrent clients
+  memory       peak Python allocation of one request (tracemalloc; SQLite's
+               own page cache is not included) and the process's peak RSS
+
+The response cache is off unless --cache is given, so every request runs its
+queries.  --output writes the results as JSON; --compare BASELINE.json prints
+the p50 change per route against an earlier run and exits with status 1 when
+any route got slower by more than --threshold percent and --min-delta-ms
+milliseconds, or stopped returning 200.
+
+Usage:
+    python benchmarks/bench_endpoints.py path/to/mydata.db [--engine sqlite|numpy|bitmap]
+        [--repeat 20] [--threads 4] [--routes kpi,bundle] [--output results.json]
+        [--compare baseline.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_serving import percentile
+from materialize import relationship_source
+from xer_to_sqlite import peak_memory_mb
+
+# Filter mixes the dashboard sends; {project} is the median-sized project
+FILTER_MIXES = {
+    'all': '',
+    'project': 'project_id={project}',
+    'project+type': 'project_id={project}&relationship_type=PR_SS',
+    'lag+float': 'lag=0&free_float=0',
+    'driving': 'driving=Y',
+}
+# Row routes page like the dashboard does
+PAGE = 'limit=100&format=columnar'
+# Exports return every matching row, so they only run for one project
+EXPORT_ROUTE = '/export'
+EXPORT_FORMAT = 'format=csv'
+
+
+def route_urls(app, families):
+    """Every GET /api/* URL, with <family> expanded."""
+    urls = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if not rule.rule.startswith('/api/') or 'GET' not in rule.methods:
+            continue
+        if '<family>' in rule.rule:
+            urls.extend(rule.rule.replace('<family>', family) for family in families)
+        elif '<' not in rule.rule:
+            urls.append(rule.rule)
+    return urls
+
+
+def median_project(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        counts = conn.execute(
+            f"SELECT Project_ID, COUNT(*) FROM {relationship_source(conn)} GROUP BY Project_ID ORDER BY 2"
+        ).fetchall()
+    finally:
+        conn.close()
+    return counts[len(counts) // 2][0] if counts else ''
+
+
+def cases(urls, project):
+    for url in urls:
+        mixes, extra = FILTER_MIXES, PAGE
+        if url.endswith(EXPORT_ROUTE):
+            mixes, extra = {'project': FILTER_MIXES['project']}, EXPORT_FORMAT
+        for mix, query in mixes.items():
+            query = '&'.join(part for part in (query.format(project=project), extra) if part)
+            yield url, mix, query
+
+
+def measure(client, url, query, repeat, threads):
+    path = f"{url}?{query}"
+    response = client.get(path)  # warm-up: plans, page cache, engine snapshots
+    status, size = response.status_code, len(response.get_data())
+
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        client.get(path).get_data()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    # Throughput: threads clients sharing repeat * threads requests
+    def worker():
+        for _ in range(repeat):
+            client.get(path).get_data()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    throughput = repeat * threads / (time.perf_counter() - started)
+
+    tracemalloc.start()
+    client.get(path).get_data()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'status': status,
+        'bytes': size,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'req_per_s': throughput,
+        'peak_alloc_mb': peak / (1024 * 1024),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold, min_delta_ms):
+    """Print p50 changes against a baseline run; returns the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = {(r['route'], r['mix']): r for r in json.load(f)['results']}
+    regressions = 0
+    print(f"\n{'route':<44}{'mix':<14}{'base p50':>10}{'p50':>10}{'change':>9}")
+    for result in results:
+        before = baseline.get((result['route'], result['mix']))
+        if before is None or before['p50_ms'] <= 0:
+            continue
+        change = (result['p50_ms'] - before['p50_ms']) * 100 / before['p50_ms']
+        flag = ''
+        if result['status'] != before['status']:
+            flag = f"  HTTP {before['status']} -> {result['status']}"
+            regressions += result['status'] != 200
+        elif change > threshold and result['p50_ms'] - before['p50_ms'] > min_delta_ms:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{result['route']:<44}{result['mix']:<14}{before['p50_ms']:>10.2f}"
+              f"{result['p50_ms']:>10.2f}{change:>+8.0f}%{flag}")
+    print(f"{regressions} regressions (over {threshold:.0f}% and {min_delta_ms:g} ms)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db_path')
+    parser.add_argument('--engine', default=None, help="METRICS_ENGINE for this run")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=4, help="concurrent clients for throughput")
+    parser.add_argument('--routes', default=None, help="only routes containing one of these comma-separated words")
+    parser.add_argument('--cache', action='store_true', help="keep the response cache enabled")
+    parser.add_argument('--output', default=None, help="write results as JSON")
+    parser.add_argument('--compare', default=None, help="baseline JSON from an earlier --output")
+    parser.add_argument('--threshold', type=float, default=15, help="regression threshold in percent")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help="ignore p50 changes smaller than this (timer noise on fast routes)")
+    args = parser.parse_args()
+
+    # Read by metrics_api at import
+    os.environ['METRICS_DB_PATH'] = os.path.abspath(args.db_path)
+    if args.engine:
+        os.environ['METRICS_ENGINE'] = args.engine
+    if not args.cache:
+        os.environ['METRICS_CACHE_MAX_ENTRIES'] = '0'
+    import metrics_api
+    from metric_registry import FAMILIES
+
+    client = metrics_api.app.test_client()
+    urls = route_urls(metrics_api.app, FAMILIES)
+    if args.routes:
+        words = args.routes.split(',')
+        urls = [url for url in urls if any(word in url for word in words)]
+    project = median_project(args.db_path)
+
+    results = []
+    print(f"{'route':<44}{'mix':<14}{'p50 ms':>9}{'p95 ms':>9}{'req/s':>9}{'KB':>9}{'alloc MB':>10}")
+    for url, mix, query in cases(urls, project):
+        result = dict(route=url, mix=mix, query=query, **measure(client, url, query, args.repeat, args.threads))
+        results.append(result)
+        status = '' if result['status'] == 200 else f"  HTTP {result['status']}"
+        print(f"{url:<44}{mix:<14}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+              f"{result['req_per_s']:>9.1f}{result['bytes'] / 1024:>9.1f}{result['peak_alloc_mb']:>10.2f}{status}")
+
+    conn = sqlite3.connect(args.db_path)
+    try:
+        source = relationship_source(conn)
+        relationships = conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+    finally:
+        conn.close()
+    run = {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'database': os.path.abspath(args.db_path),
+        'relationships': relationships,
+        'source': source,
+        'engine': metrics_api.ENGINE,
+        'cache': args.cache,
+        'repeat': args.repeat,
+        'threads': args.threads,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'peak_rss_mb': peak_memory_mb(),
+        'results': results,
+    }
+    print(f"\n{len(results)} cases, {relationships} relationships ({source}), engine {run['engine']}, "
+          f"peak RSS {run['peak_rss_mb'] or 0:.0f} MB")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=1)
+        print(f"Results written to {args.output}")
+    if args.compare and compare(results, args.compare, args.threshold, args.min_delta_ms):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Load-test serve.py with the dashboard's request mix at increasing worker counts.
+
+Starts the production server once per --workers value, drives it with keep-alive
+HTTP clients for --duration seconds and prints throughput and latency.  Each
+simulated tab view requests what the dashboard does: the tab's bundle and
+facets for a random project, /api/bootstrap, then one sorted table page.
+
+The response cache is disabled by default so every request runs its queries;
+pass --cache to measure with it.
+
+Usage:
+    python benchmarks/bench_serving.py path/to/mydata.db [--workers 1,2,4] [--threads 4]
+        [--clients 32] [--duration 10] [--server gunicorn|waitress]
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FAMILIES = {
+    'fs0d': 'typical-fs0d',
+    'non-fs0d': 'typical-non-fs0d',
+    'leads': 'leads',
+    'lags': 'lags',
+    'excessive-lags': 'excessive-lags',
+}
+PAGE = 'limit=100&format=columnar'
+
+
+def tab_view(projects, rng):
+    """URLs of one dashboard tab view."""
+    family = rng.choice(list(FAMILIES))
+    query = f"project_id={rng.choice(projects)}" if projects and rng.random() < 0.8 else ''
+    return [
+        f"/api/{family}/bundle?{query}&{PAGE}",
+        f"/api/{family}/facets?{query}",
+        "/api/bootstrap",
+        f"/api/{FAMILIES[family]}?{query}&{PAGE}&sort=Lag&order=desc",
+    ]
+
+
+def _get(conn, url):
+    conn.request('GET', url)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def _client_process(port, projects, threads, deadline, seed, results):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def client(index):
+        rng = random.Random(seed * 1000 + index)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        own = []
+        failed = 0
+        while time.time() < deadline:
+            for url in tab_view(projects, rng):
+                started = time.perf_counter()
+                try:
+                    status = _get(conn, url)
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                    status = None
+                own.append(time.perf_counter() - started)
+                if status != 200:
+                    failed += 1
+        conn.close()
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+
+    pool = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put((latencies, errors[0]))
+
+
+def wait_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            if _get(conn, '/api/health') == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def run_load(port, projects, clients, duration):
+    """(requests, errors, latencies) from clients keep-alive connections over duration seconds."""
+    # Several client processes, so the load generator isn't limited by one GIL
+    processes = max(1, min(os.cpu_count() or 1, clients // 8 or 1))
+    per_process = [clients // processes + (1 if i < clients % processes else 0) for i in range(processes)]
+    deadline = time.time() + duration
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_client_process, args=(port, projects, count, deadline, i, results))
+        for i, count in enumerate(per_process)
+    ]
+    for worker in workers:
+        worker.start()
+    latencies, errors = [], 0
+    for _ in workers:
+        part, failed = results.get()
+        latencies.extend(part)
+        errors += failed
+    for worker in workers:
+        worker.join()
+    return len(latencies), errors, sorted(latencies)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db_path')
+    cores = os.cpu_count() or 1
+    default_workers = sorted({w for w in (1, 2, 4, cores) if w <= cores})
+    parser.add_argument('--workers', default=','.join(str(w) for w in default_workers),
+                        help="comma-separated worker counts (default: 1,2,4 up to the CPU count)")
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=32, help="concurrent keep-alive connections")
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=5077)
+    parser.add_argument('--server', default=None, help="gunicorn or waitress (default: serve.py's)")
+    parser.add_argument('--cache', action='store_true', help="keep the response cache enabled")
+    args = parser.parse_args()
+
+    env = dict(os.environ, METRICS_DB_PATH=os.path.abspath(args.db_path))
+    if not args.cache:
+        env['METRICS_CACHE_MAX_ENTRIES'] = '0'
+
+    print(f"{'workers':>8}{'threads':>9}{'req/s':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'errors':>8}")
+    projects = None
+    for workers in [int(w) for w in args.workers.split(',')]:
+        command = [
+            sys.executable, os.path.join(ROOT, 'serve.py'), '--port', str(args.port),
+            '--workers', str(workers), '--threads', str(args.threads),
+        ]
+        if args.server:
+            command += ['--server', args.server]
+        server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not wait_ready(args.port):
+                sys.exit("server did not start")
+            if projects is None:
+                conn = http.client.HTTPConnection('127.0.0.1', args.port, timeout=60)
+                conn.request('GET', '/api/project-options')
+                projects = [project['id'] for project in json.loads(conn.getresponse().read())]
+            # Warm-up: connections, page cache and in-memory engine snapshots in every worker
+            run_load(args.port, projects, args.clients, min(2.0, args.duration))
+            count, errors, latencies = run_load(args.port, projects, args.clients, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{workers:>8}{args.threads:>9}{count / args.duration:>10.1f}"
+              f"{percentile(latencies, 0.50) * 1000:>10.1f}{percentile(latencies, 0.95) * 1000:>10.1f}"
+              f"{percentile(latencies, 0.99) * 1000:>10.1f}{errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""Generate a synthetic mydata.db for benchmarks, from 10k to 10M relationships.
+
+Creates the XER tables the importer would (PROJECT, PROJWBS, CALENDAR, TASK,
+TASKPRED; TEXT columns, same indexes) filled with schedule-like data, an
+ActivityRelationshipView over them, and then runs materialize.refresh() so
+the database looks like one produced by xer_to_sqlite.py.
+
+The shape follows typical P6 schedules: about two relationships per activity,
+predecessors drawn from nearby earlier activities, mostly FS with zero lag,
+a few percent leads and excessive lags, and the early part of each schedule
+complete.  Projects get a power-law-ish spread of sizes.  The same --seed
+always produces the same database.
+
+Usage:
+    python benchmarks/generate_schedule.py path/to/mydata.db --relationships 1M [--projects 50]
+"""
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import materialize
+from xer_to_sqlite import XER_INDEXES
+
+BATCH_SIZE = 50000
+HOURS_PER_DAY = 8
+RELATIONSHIPS_PER_TASK = 2
+TASKS_PER_WBS = 40
+# Lags above this many days are classified as excessive
+EXCESSIVE_LAG_DAYS = 20
+
+TABLES = {
+    'PROJECT': ('proj_id', 'proj_short_name', 'last_recalc_date', 'clndr_id'),
+    'PROJWBS': ('wbs_id', 'proj_id', 'wbs_short_name', 'wbs_name'),
+    'CALENDAR': ('clndr_id', 'clndr_name', 'day_hr_cnt', 'proj_id'),
+    'TASK': (
+        'task_id', 'proj_id', 'wbs_id', 'clndr_id', 'task_code', 'task_name', 'status_code',
+        'total_float_hr_cnt', 'free_float_hr_cnt',
+    ),
+    'TASKPRED': ('task_pred_id', 'task_id', 'pred_task_id', 'proj_id', 'pred_proj_id', 'pred_type', 'lag_hr_cnt'),
+}
+
+# (value, weight)
+PRED_TYPES = [('PR_FS', 84), ('PR_SS', 9), ('PR_FF', 5), ('PR_SF', 1), ('PR_FS1', 1)]
+LAG_DAYS = [(0, 70), ('positive', 14), ('excessive', 4), ('lead', 6), (None, 6)]
+FREE_FLOAT_DAYS = [(0, 55), ('small', 30), ('large', 15)]
+VERBS = ['Install', 'Pour', 'Inspect', 'Procure', 'Design', 'Test', 'Commission', 'Erect', 'Excavate', 'Paint']
+OBJECTS = ['foundation', 'steel', 'ductwork', 'cabling', 'pumps', 'roof', 'slab', 'walls', 'piping', 'panels']
+
+# Mirrors the column semantics the dashboard expects (see README "Key Columns")
+VIEW_SQL = f"""
+CREATE VIEW {materialize.SOURCE_VIEW} AS
+SELECT
+    tp.proj_id AS Project_ID,
+    p.task_code AS Activity_ID,
+    s.task_code AS Activity_ID2,
+    p.task_name AS Activity_Name,
+    s.task_name AS Activity_Name2,
+    tp.pred_type AS RelationshipType,
+    ROUND(CAST(tp.lag_hr_cnt AS REAL) / COALESCE(c.day_hr_cnt, {HOURS_PER_DAY}), 1) AS Lag,
+    CASE WHEN CAST(p.free_float_hr_cnt AS REAL) = 0 THEN 'Y' ELSE 'N' END AS Driving,
+    ROUND(CAST(p.free_float_hr_cnt AS REAL) / COALESCE(c.day_hr_cnt, {HOURS_PER_DAY}), 1) AS FreeFloat,
+    CASE WHEN CAST(tp.lag_hr_cnt AS REAL) < 0 THEN '1' ELSE '0' END AS Lead,
+    CASE WHEN CAST(tp.lag_hr_cnt AS REAL) > {EXCESSIVE_LAG_DAYS} * COALESCE(c.day_hr_cnt, {HOURS_PER_DAY})
+         THEN 'Excessive Lag' ELSE 'Normal' END AS ExcessiveLag,
+    CASE WHEN s.status_code = 'TK_Complete' THEN 'Complete' ELSE 'Incomplete' END AS Relationship_Status
+FROM TASKPRED tp
+JOIN TASK s ON s.task_id = tp.task_id
+JOIN TASK p ON p.task_id = tp.pred_task_id
+LEFT JOIN CALENDAR c ON c.clndr_id = s.clndr_id
+"""
+
+
+def parse_count(text):
+    """'10k', '2.5M', '10000' -> int."""
+    text = text.strip().lower()
+    scale = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def project_sizes(relationships, projects, rng):
+    """Relationship count per project: a few large schedules and many small ones."""
+    weights = [1 / (rank + 1) ** 0.8 * rng.uniform(0.7, 1.3) for rank in range(projects)]
+    total = sum(weights)
+    sizes = [max(RELATIONSHIPS_PER_TASK, int(relationships * w / total)) for w in weights]
+    sizes[0] += relationships - sum(sizes)
+    return sizes
+
+
+def _lag_hours(rng):
+    kind = _weighted(rng, LAG_DAYS)
+    if kind == 'positive':
+        return rng.randint(1, EXCESSIVE_LAG_DAYS) * HOURS_PER_DAY
+    if kind == 'excessive':
+        return rng.randint(EXCESSIVE_LAG_DAYS + 1, 120) * HOURS_PER_DAY
+    if kind == 'lead':
+        return -rng.randint(1, 10) * HOURS_PER_DAY
+    return kind
+
+
+def _float_hours(rng):
+    kind = _weighted(rng, FREE_FLOAT_DAYS)
+    if kind == 'small':
+        return rng.randint(1, 10) * HOURS_PER_DAY
+    if kind == 'large':
+        return rng.randint(11, 200) * HOURS_PER_DAY
+    return 0
+
+
+def project_rows(index, relationships, rng, next_ids):
+    """Yield (table, row) for one project; ids continue from next_ids (updated in place)."""
+    proj_id = str(1000 + index)
+    clndr_id = str(index + 1)
+    data_date = datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randint(0, 540))
+    tasks = max(2, relationships // RELATIONSHIPS_PER_TASK)
+    complete_share = rng.uniform(0.1, 0.7)
+
+    yield 'PROJECT', (proj_id, f"PRJ-{index + 1:04d}", f"{data_date.isoformat()} 08:00", clndr_id)
+    yield 'CALENDAR', (clndr_id, f"{proj_id} 5x8", str(HOURS_PER_DAY), proj_id)
+
+    first_wbs = next_ids['wbs']
+    packages = (tasks + TASKS_PER_WBS - 1) // TASKS_PER_WBS
+    for number in range(packages):
+        yield 'PROJWBS', (str(first_wbs + number), proj_id, f"W{number + 1}", f"Work package {number + 1}")
+    next_ids['wbs'] += packages
+
+    first_task = next_ids['task']
+    for number in range(tasks):
+        progress = number / tasks
+        if progress < complete_share:
+            status = 'TK_Complete'
+        elif progress < complete_share + 0.1:
+            status = 'TK_Active'
+        else:
+            status = 'TK_NotStart'
+        free_float = _float_hours(rng)
+        yield 'TASK', (
+            str(first_task + number), proj_id, str(first_wbs + number // TASKS_PER_WBS), clndr_id,
+            f"A{number + 1:06d}", f"{rng.choice(VERBS)} {rng.choice(OBJECTS)} {number + 1}", status,
+            str(free_float + rng.choice((0, 0, 8, 40))), str(free_float),
+        )
+    next_ids['task'] += tasks
+
+    for number in range(relationships):
+        successor = 1 + number % (tasks - 1)
+        predecessor = rng.randrange(max(0, successor - 60), successor)
+        lag = _lag_hours(rng)
+        yield 'TASKPRED', (
+            str(next_ids['pred'] + number), str(first_task + successor), str(first_task + predecessor),
+            proj_id, proj_id, _weighted(rng, PRED_TYPES), None if lag is None else str(lag),
+        )
+    next_ids['pred'] += relationships
+
+
+def generate(db_path, relationships, projects=None, seed=1, refresh=True):
+    started = time.perf_counter()
+    projects = projects or max(5, min(2000, relationships // 20000))
+    rng = random.Random(seed)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("BEGIN")
+    for table, fields in TABLES.items():
+        conn.execute(f"CREATE TABLE {table} ({', '.join(f'{field} TEXT' for field in fields)})")
+    inserts = {
+        table: f"INSERT INTO {table} VALUES ({', '.join('?' for _ in fields)})"
+        for table, fields in TABLES.items()
+    }
+
+    next_ids = {'wbs': 1, 'task': 1, 'pred': 1}
+    pending = {table: [] for table in TABLES}
+    for index, size in enumerate(project_sizes(relationships, projects, rng)):
+        for table, row in project_rows(index, size, rng, next_ids):
+            pending[table].append(row)
+            if len(pending[table]) >= BATCH_SIZE:
+                conn.executemany(inserts[table], pending[table])
+                pending[table] = []
+    for table, rows in pending.items():
+        conn.executemany(inserts[table], rows)
+
+    for table, fields in TABLES.items():
+        for column in dict.fromkeys(fields[:1] + XER_INDEXES.get(table, ())):
+            conn.execute(f"CREATE INDEX idx_{table.lower()}_{column} ON {table} ({column})")
+    conn.execute(VIEW_SQL)
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    conn.close()
+    print(f"Generated {relationships} relationships, {next_ids['task'] - 1} activities in {projects} projects "
+          f"into {db_path} in {time.perf_counter() - started:.1f}s")
+
+    if refresh:
+        materialize.refresh(db_path)
+    print(f"Database size: {os.path.getsize(db_path) / (1024 * 1024):.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db_path')
+    parser.add_argument('--relationships', type=parse_count, default=parse_count('100k'),
+                        help="e.g. 10k, 250k, 1M, 10M (default: 100k)")
+    parser.add_argument('--projects', type=int, default=None,
+                        help="default: one per 20k relationships, at least 5")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-materialize', action='store_true',
+                        help="leave only the view (benchmarks the unmaterialized path)")
+    args = parser.parse_args()
+    generate(args.db_path, args.relationships, args.projects, args.seed, not args.no_materialize)
+
+
+if __name__ == '__main__':
+    main()
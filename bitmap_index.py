@@ -0,0 +1,191 @@
+"""Bitmap indexes for KPI and chart counts.
+
+Keeps one bitmap of row positions per distinct value of every column the
+metric predicates test (the dashboard filters, Relationship_Status and
+ExcessiveLag).  A predicate's bitmap is the OR of the value bitmaps it
+accepts, cached for the family base predicates; a KPI count is then the AND
+of its predicates' bitmaps plus a popcount, with no row scan at all.
+
+Bitmaps are split into CHUNK_BITS-row chunks stored as Python ints and empty
+chunks are left out, so values clustered in a few projects stay small.
+
+Select it with METRICS_ENGINE=bitmap.  Row lists keep coming from SQLite.
+"""
+from kpi_engine import chart_columns, format_kpis, shape_chart
+from metric_registry import (
+    FAMILIES, FILTER_COLUMNS, chart_predicates, kpi_predicates,
+)
+from snapshot_store import SnapshotStore, sqlite_rank, value_matches
+
+INDEX_COLUMNS = list(FILTER_COLUMNS.values()) + ['Relationship_Status', 'ExcessiveLag']
+CHUNK_BITS = 1 << 16
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(bits):
+        return bin(bits).count('1')
+
+
+class Bitmap:
+    """Set of row positions as {chunk number: int bitset}; empty chunks are omitted."""
+
+    __slots__ = ('chunks',)
+
+    def __init__(self, chunks=None):
+        self.chunks = chunks if chunks is not None else {}
+
+    def __and__(self, other):
+        small, large = sorted((self.chunks, other.chunks), key=len)
+        chunks = {}
+        for key, bits in small.items():
+            both = bits & large.get(key, 0)
+            if both:
+                chunks[key] = both
+        return Bitmap(chunks)
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for key, bits in other.chunks.items():
+            chunks[key] = chunks.get(key, 0) | bits
+        return Bitmap(chunks)
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def __len__(self):
+        return sum(_popcount(bits) for bits in self.chunks.values())
+
+
+def _chunk_bits(values):
+    """{value: chunk int} for up to CHUNK_BITS values of one column, in row order."""
+    chunk_bytes = CHUNK_BITS // 8
+    buffers = {}
+    for offset, value in enumerate(values):
+        buffer = buffers.get(value)
+        if buffer is None:
+            buffer = buffers[value] = bytearray(chunk_bytes)
+        buffer[offset >> 3] |= 1 << (offset & 7)
+    return {value: int.from_bytes(buffer, 'little') for value, buffer in buffers.items()}
+
+
+def _row_chunks(batches):
+    # Regroups load batches into CHUNK_BITS rows (the store loads exactly that many)
+    pending = []
+    for batch in batches:
+        pending.extend(batch)
+        while len(pending) >= CHUNK_BITS:
+            yield pending[:CHUNK_BITS]
+            del pending[:CHUNK_BITS]
+    if pending:
+        yield pending
+
+
+class BitmapIndex:
+    """Value bitmaps of one database version, built from batches of rows."""
+
+    def __init__(self, batches):
+        chunks_of = {column: {} for column in INDEX_COLUMNS}
+        self.length = 0
+        for key, rows in enumerate(_row_chunks(batches)):
+            for index, column in enumerate(INDEX_COLUMNS):
+                for value, bits in _chunk_bits([row[index] for row in rows]).items():
+                    chunks_of[column].setdefault(value, {})[key] = bits
+            self.length += len(rows)
+        self.all_rows = Bitmap({
+            key: (1 << min(CHUNK_BITS, self.length - key * CHUNK_BITS)) - 1
+            for key in range((self.length + CHUNK_BITS - 1) // CHUNK_BITS)
+        })
+        # {column: {value: Bitmap}}, values in SQLite order
+        self.values = {
+            column: {value: Bitmap(chunks[value]) for value in sorted(chunks, key=sqlite_rank)}
+            for column, chunks in chunks_of.items()
+        }
+        # Base predicates of every family (filter values vary per request and are
+        # looked up directly, so only these are cached)
+        self._cached = {}
+        for family in FAMILIES:
+            base = list(chart_predicates(family, {}))
+            for predicates in kpi_predicates(family, {}).values():
+                base.extend(predicates)
+            for predicate in base:
+                self._cached[predicate] = self._predicate_bitmap(predicate)
+
+    def _predicate_bitmap(self, predicate):
+        column, op, value = predicate
+        if op == 'or':
+            parts = [self.bitmap(alternative) for alternative in value]
+        else:
+            parts = [
+                bitmap for stored, bitmap in self.values[column].items()
+                if value_matches(column, op, value, stored)
+            ]
+        result = Bitmap()
+        for part in parts:
+            result = result | part
+        return result
+
+    def bitmap(self, predicate):
+        cached = self._cached.get(predicate)
+        return cached if cached is not None else self._predicate_bitmap(predicate)
+
+    def select(self, predicates):
+        # Most selective first, so later ANDs touch fewer chunks
+        bitmaps = sorted((self.bitmap(p) for p in predicates), key=lambda b: len(b.chunks))
+        result = self.all_rows
+        for bitmap in bitmaps:
+            result = result & bitmap
+            if not result:
+                break
+        return result
+
+    def count_many(self, counters):
+        counts = {}
+        selected = {}
+        for name, predicates in counters.items():
+            key = tuple(predicates)
+            if key not in selected:
+                selected[key] = len(self.select(predicates))
+            counts[name] = selected[key]
+        return counts
+
+    def group_counts(self, predicates, columns):
+        """[(value, ..., count)] like kpi_engine.group_counts, by splitting the selection per value."""
+        groups = []
+
+        def split(selection, prefix, remaining):
+            for value, bitmap in self.values[remaining[0]].items():
+                part = selection & bitmap
+                if not part:
+                    continue
+                if len(remaining) == 1:
+                    groups.append(prefix + (value, len(part)))
+                else:
+                    split(part, prefix + (value,), remaining[1:])
+
+        split(self.select(predicates), (), list(columns))
+        return groups
+
+
+indexes = SnapshotStore(BitmapIndex, INDEX_COLUMNS, batch_size=CHUNK_BITS)
+
+
+def family_kpis(conn, source, family, filters):
+    counts = indexes.get(conn, source).count_many(kpi_predicates(family, filters))
+    return format_kpis(family, counts)
+
+
+def kpi_summary(conn, source, filters):
+    index = indexes.get(conn, source)
+    return {
+        family: format_kpis(family, index.count_many(kpi_predicates(family, filters)))
+        for family in FAMILIES
+    }
+
+
+def chart_data(conn, source, family, filters):
+    shape = FAMILIES[family]['chart']['shape']
+    groups = indexes.get(conn, source).group_counts(
+        chart_predicates(family, filters), chart_columns(shape)
+    )
+    return shape_chart(shape, groups)
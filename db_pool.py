@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import threading
+import time
+from urllib.request import pathname2url
+
+
+class ConnectionPool:
+    """Per-thread, read-only SQLite connections shared by every API route.
+
+    Each worker thread keeps one long-lived connection so the schema is parsed
+    once and the page cache / mmap stay warm between requests.  Connections are
+    re-opened when the database file is replaced (e.g. after a fresh XER import)
+    or when a periodic health check fails.
+
+    Every query is built from the metric registry with bound parameters, so its
+    SQL text repeats across requests and is served from the connection's
+    prepared-statement cache (statement_cache_size entries) without re-planning.
+
+    factory is the sqlite3.Connection subclass to open (e.g. the timed
+    connections of request_metrics.py).
+    """
+
+    def __init__(self, db_path, cache_size_kb=65536, mmap_size=268435456,
+                 immutable=False, health_check_interval=30.0, statement_cache_size=512,
+                 factory=sqlite3.Connection):
+        self.db_path = db_path
+        self.factory = factory
+        self.statement_cache_size = statement_cache_size
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.immutable = immutable
+        self.health_check_interval = health_check_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._wal_checked = False
+
+    def _uri(self, mode='ro'):
+        path = pathname2url(os.path.abspath(self.db_path))
+        uri = f"file:{path}?mode={mode}"
+        if self.immutable:
+            uri += "&immutable=1"
+        return uri
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.db_path)
+        except OSError:
+            return None
+        if self.immutable:
+            # SQLite never re-reads an immutable file, so any change means reopen
+            return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        return (st.st_dev, st.st_ino)
+
+    def data_version(self):
+        """Signature that changes whenever the database content may have changed.
+
+        Covers the WAL file too: commits land there until a checkpoint copies
+        them into the main file.  An empty WAL (just created by opening the
+        database) counts as no WAL.
+        """
+        signature = []
+        for path in (self.db_path, self.db_path + '-wal'):
+            try:
+                st = os.stat(path)
+            except OSError:
+                signature.append(None)
+                continue
+            signature.append((st.st_ino, st.st_size, st.st_mtime_ns) if st.st_size else None)
+        return tuple(signature)
+
+    def _ensure_wal(self):
+        # journal_mode is persistent in the file but can't be set through a
+        # read-only connection, so switch it once with a short-lived writer
+        # (mode=rw: it must never create the database).
+        if self._wal_checked or self.immutable:
+            return
+        self._wal_checked = True
+        try:
+            writer = sqlite3.connect(self._uri('rw'), uri=True, timeout=1)
+            try:
+                writer.execute("PRAGMA journal_mode=WAL")
+            finally:
+                writer.close()
+        except sqlite3.Error as e:
+            print(f"Could not enable WAL on {self.db_path}: {e}")
+
+    def _open(self):
+        # Fail instead of serving an empty database from a wrong path
+        if not os.path.isfile(self.db_path):
+            raise sqlite3.OperationalError(f"database not found: {self.db_path}")
+        self._ensure_wal()
+        conn = sqlite3.connect(
+            self._uri(), uri=True, check_same_thread=False,
+            cached_statements=self.statement_cache_size, factory=self.factory,
+        )
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA query_only = 1")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def connection(self):
+        """Return the calling thread's connection, (re)opening it if needed."""
+        state = getattr(self._local, 'state', None)
+        signature = self._file_signature()
+        now = time.monotonic()
+
+        if state is not None:
+            if state['signature'] != signature:
+                self.discard()
+                state = None
+            elif now - state['checked_at'] >= self.health_check_interval:
+                try:
+                    state['conn'].execute("SELECT 1").fetchone()
+                    state['checked_at'] = now
+                except sqlite3.Error as e:
+                    print(f"Pooled connection failed health check, reopening: {e}")
+                    self.discard()
+                    state = None
+
+        if state is None:
+            conn = self._open()
+            state = {
+                'conn': conn,
+                'signature': signature,
+                'checked_at': now,
+            }
+            self._local.state = state
+            with self._lock:
+                self._connections[threading.get_ident()] = conn
+        return state['conn']
+
+    def discard(self):
+        """Drop the calling thread's connection; the next checkout reopens it."""
+        state = getattr(self._local, 'state', None)
+        if state is None:
+            return
+        self._local.state = None
+        with self._lock:
+            self._connections.pop(threading.get_ident(), None)
+        self._close_quietly(state['conn'])
+
+    def health(self, sources=()):
+        """Run a health check on the calling thread's connection.
+
+        With sources, the database must also contain one of these tables or
+        views; the first one found is reported as 'source'.
+        """
+        status = {
+            'db_path': self.db_path,
+            'open_connections': len(self._connections),
+            'cache_size_kb': self.cache_size_kb,
+            'mmap_size': self.mmap_size,
+            'immutable': self.immutable,
+        }
+        try:
+            conn = self.connection()
+            conn.execute("SELECT 1").fetchone()
+            status['journal_mode'] = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            status['ok'] = True
+            if sources:
+                found = [
+                    name for name in sources
+                    if conn.execute(
+                        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (name,)
+                    ).fetchone()
+                ]
+                status['source'] = found[0] if found else None
+                if not found:
+                    status['ok'] = False
+                    status['error'] = f"none of {', '.join(sources)} in the database"
+        except sqlite3.Error as e:
+            self.discard()
+            status['ok'] = False
+            status['error'] = str(e)
+        return status
@@ -0,0 +1,165 @@
+"""Filter dropdown values for every dashboard tab, from one grouped scan.
+
+Each tab's option lists are DISTINCT values of a column under that tab's
+scope predicates (see metric_registry.FILTER_OPTIONS).  Instead of one
+DISTINCT query per list, a single GROUP BY over every column the lists use
+returns the distinct combinations (a few hundred on real schedules) with
+each scope evaluated once per group, and the lists are split out in Python.
+"""
+from materialize import numeric_sort_key
+from metric_registry import (
+    FAMILIES, FILTER_COLUMNS, FILTER_OPTIONS, NUMERIC_FILTERS, OPTION_GROUP_COLUMNS,
+    predicate_sql, where_sql,
+)
+
+
+def _sqlite_order(value):
+    # NULLs, then numbers, then text: the order SQLite's ORDER BY uses
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, value)
+
+
+def option_lists(conn, source):
+    """{family: {filter name: [values in the order the option routes return them]}}"""
+    names = []
+    scopes = []
+    lists = []
+    for family, spec in FILTER_OPTIONS.items():
+        for name, predicates in spec.items():
+            if name not in names:
+                names.append(name)
+            if tuple(predicates) not in scopes:
+                scopes.append(tuple(predicates))
+            lists.append((family, name, names.index(name), scopes.index(tuple(predicates))))
+
+    params = []
+    scope_columns = []
+    for predicates in scopes:
+        if predicates:
+            condition = ' AND '.join(predicate_sql(p, params) for p in predicates)
+            scope_columns.append(f"CASE WHEN {condition} THEN 1 ELSE 0 END")
+        else:
+            scope_columns.append("1")
+    value_columns = [FILTER_COLUMNS[name] for name in names]
+    # Numeric lists are ordered like the old routes, by numeric_sort_key rather than raw value
+    sort_columns = [
+        numeric_sort_key(source, column) if name in NUMERIC_FILTERS else column
+        for name, column in zip(names, value_columns)
+    ]
+    # Every selected expression only reads grouped columns, so it is evaluated per group
+    groups = conn.execute(
+        f"SELECT {', '.join(value_columns + sort_columns + scope_columns)} "
+        f"FROM {source} GROUP BY {', '.join(OPTION_GROUP_COLUMNS)}",
+        params
+    ).fetchall()
+
+    found = {(family, name): {} for family, name, _, _ in lists}
+    for row in groups:
+        flags = row[2 * len(names):]
+        for family, name, column, scope in lists:
+            if flags[scope]:
+                found[(family, name)].setdefault(row[column], row[len(names) + column])
+
+    options = {family: {} for family in FILTER_OPTIONS}
+    for (family, name), values in found.items():
+        ordered = sorted(values.items(), key=lambda item: _sqlite_order(item[1]))
+        options[family][name] = [value for value, _ in ordered]
+    return options
+
+
+def distinct_options(conn, source, family, name):
+    """One dropdown list: DISTINCT values of a filter column under the tab's scope."""
+    column = FILTER_COLUMNS[name]
+    order = numeric_sort_key(source, column) if name in NUMERIC_FILTERS else column
+    params = []
+    where_clause = where_sql(FILTER_OPTIONS[family][name], params)
+    rows = conn.execute(
+        f"SELECT DISTINCT {column} FROM {source} {where_clause} ORDER BY {order}", params
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def project_options(conn):
+    rows = conn.execute("SELECT proj_id, proj_short_name FROM PROJECT ORDER BY proj_short_name").fetchall()
+    return [{"id": proj_id, "name": name} for proj_id, name in rows]
+
+
+def _flag_sql(predicate, params):
+    if predicate is None:
+        return "1"
+    return f"CASE WHEN {predicate_sql(predicate, params)} THEN 1 ELSE 0 END"
+
+
+def facet_counts(conn, source, family, filters):
+    """Cross-filtered value counts of every filter dimension of a family's rows.
+
+    Each dimension is counted under all the *other* selections (and its own
+    default, e.g. FS types only on the FS+0d tab), so the counts say how many
+    rows each alternative value would return.  One GROUP BY over the
+    dimension columns; the per-dimension selections become 0/1 flags that are
+    combined in Python.
+    """
+    spec = FAMILIES[family]
+    names = list(FILTER_COLUMNS)
+    columns = [FILTER_COLUMNS[name] for name in names]
+    sort_columns = [
+        numeric_sort_key(source, column) if name in NUMERIC_FILTERS else column
+        for name, column in zip(names, columns)
+    ]
+
+    # Per dimension: does the group pass its selection (or default), and may its value
+    # be listed at all (the default, plus a selection made outside the default)
+    params = []
+    flag_columns = []
+    for name, column in zip(names, columns):
+        default = spec['defaults'].get(name)
+        selected = (column, '=', filters[name]) if name in filters else default
+        listed = default
+        if default is not None and name in filters:
+            listed = (None, 'or', (default, selected))
+        flag_columns.append(_flag_sql(selected, params))
+        flag_columns.append(_flag_sql(listed, params))
+
+    where_clause = where_sql(spec['rows'], params)
+    groups = conn.execute(
+        f"SELECT {', '.join(columns + sort_columns + flag_columns)}, COUNT(*) "
+        f"FROM {source} {where_clause} GROUP BY {', '.join(columns)}",
+        params
+    ).fetchall()
+
+    count = len(names)
+    total = 0
+    found = {name: {} for name in names}
+    for row in groups:
+        selected = row[2 * count:-1:2]
+        listed = row[2 * count + 1:-1:2]
+        rows = row[-1]
+        if all(selected):
+            total += rows
+        for index, name in enumerate(names):
+            if not listed[index]:
+                continue
+            if all(flag for other, flag in enumerate(selected) if other != index):
+                value = row[index]
+                entry = found[name].setdefault(value, [row[count + index], 0])
+                entry[1] += rows
+
+    facets = {}
+    for name in names:
+        values = found[name]
+        # Keep the current selection listed even when nothing matches it
+        if name in filters and not any(_same_value(value, filters[name]) for value in values):
+            values[filters[name]] = [filters[name], 0]
+        ordered = sorted(values.items(), key=lambda item: _sqlite_order(item[1][0]))
+        facets[name] = [{"value": value, "count": entry[1]} for value, entry in ordered]
+    return {"total": total, "facets": facets}
+
+
+def _same_value(value, selected):
+    # Project IDs arrive as strings but may be stored as integers
+    return value == selected or str(value) == str(selected)
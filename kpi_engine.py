@@ -0,0 +1,200 @@
+"""Single-pass KPI and chart counts for the metric families.
+
+Every counter a tab needs is evaluated in one scan using conditional
+aggregation: predicates shared by all counters go into the WHERE clause and
+the rest become ``COUNT(CASE WHEN ... THEN 1 END)`` columns.
+
+When the materialized table's rollup cube exists and covers every predicate
+column, the same queries run over the cube and sum its counts instead.
+"""
+from collections import Counter
+
+from materialize import (
+    MATERIALIZED_TABLE, ROLLUP_COUNT, ROLLUP_DIMENSIONS, ROLLUP_TABLE, has_rollup,
+)
+from metric_registry import (
+    FAMILIES, ROW_COLUMNS, chart_predicates, kpi_predicates, predicate_columns,
+    predicate_sql, where_sql,
+)
+
+ROW_INDEX = {column: index for index, (column, _) in enumerate(ROW_COLUMNS)}
+
+
+def counted_source(conn, source, columns):
+    """(table, weight column) for a count touching columns: the rollup cube when
+    it has them all, otherwise source with a weight of None (one per row)."""
+    if source == MATERIALIZED_TABLE and set(columns) <= set(ROLLUP_DIMENSIONS) and has_rollup(conn):
+        return ROLLUP_TABLE, ROLLUP_COUNT
+    return source, None
+
+
+def _count_sql(weight, condition=None):
+    if weight is None:
+        return f"COUNT(CASE WHEN {condition} THEN 1 END)" if condition else "COUNT(*)"
+    return f"SUM(CASE WHEN {condition} THEN {weight} END)" if condition else f"SUM({weight})"
+
+
+def count_many(conn, source, counters):
+    """Evaluate {name: predicates} counters over source in a single query."""
+    # Counters with identical predicates (e.g. Non FS+0d Total/Remaining) share a column
+    unique = []
+    column_of = {}
+    for name, predicates in counters.items():
+        key = tuple(predicates)
+        if key not in unique:
+            unique.append(key)
+        column_of[name] = unique.index(key)
+
+    common = [p for p in unique[0] if all(p in other for other in unique[1:])] if unique else []
+    source, weight = counted_source(
+        conn, source, predicate_columns([p for predicates in unique for p in predicates])
+    )
+
+    select_params = []
+    columns = []
+    for predicates in unique:
+        rest = [p for p in predicates if p not in common]
+        condition = ' AND '.join(predicate_sql(p, select_params) for p in rest)
+        columns.append(_count_sql(weight, condition))
+
+    where_params = []
+    where_clause = where_sql(common, where_params)
+    row = conn.execute(
+        f"SELECT {', '.join(columns)} FROM {source} {where_clause}",
+        select_params + where_params
+    ).fetchone()
+    return {name: int(row[index] or 0) for name, index in column_of.items()}
+
+
+def count_many_by(conn, source, counters, column, values=None):
+    """{value of column: {name: count}}: count_many for every value of column, in one grouped scan.
+
+    values limits the scan to those values of column.
+    """
+    names = list(counters)
+    source, weight = counted_source(
+        conn, source, predicate_columns([p for name in names for p in counters[name]]) | {column}
+    )
+    params = []
+    columns = [
+        _count_sql(weight, ' AND '.join(predicate_sql(p, params) for p in counters[name]))
+        for name in names
+    ]
+    where = ''
+    if values is not None:
+        where = f" WHERE {predicate_sql((column, 'in', tuple(values)), params)}"
+    rows = conn.execute(
+        f"SELECT {column}, {', '.join(columns)} FROM {source}{where} GROUP BY {column}", params
+    ).fetchall()
+    return {row[0]: {name: int(row[i + 1] or 0) for i, name in enumerate(names)} for row in rows}
+
+
+def format_kpis(family, counts):
+    """Add the family's percentage KPI to its raw counters."""
+    name, numerator, denominator, digits = FAMILIES[family]['percentage']
+    kpis = dict(counts)
+    percentage = 0.0
+    if counts[denominator] > 0:
+        percentage = counts[numerator] * 100.0 / counts[denominator]
+    kpis[name] = float(round(percentage, digits))
+    return kpis
+
+
+def empty_kpis(family):
+    return format_kpis(family, {name: 0 for name in FAMILIES[family]['kpis']})
+
+
+def family_kpis(conn, source, family, filters):
+    """KPIs for one metric tab, from one scan."""
+    counts = count_many(conn, source, kpi_predicates(family, filters))
+    return format_kpis(family, counts)
+
+
+def kpi_summary(conn, source, filters):
+    """KPIs for every metric tab under one filter set, from one scan."""
+    counters = {}
+    for family in FAMILIES:
+        for name, predicates in kpi_predicates(family, filters).items():
+            counters[(family, name)] = predicates
+    counts = count_many(conn, source, counters)
+
+    summary = {}
+    for family in FAMILIES:
+        family_counts = {name: counts[(family, name)] for name in FAMILIES[family]['kpis']}
+        summary[family] = format_kpis(family, family_counts)
+    return summary
+
+
+def portfolio_kpis(conn, source, filters, project_ids=None):
+    """{Project_ID: {family: KPIs}} for every metric tab, from one GROUP BY Project_ID scan.
+
+    project_ids limits the scan to those projects.  Projects without
+    relationships are left out.
+    """
+    counters = {}
+    for family in FAMILIES:
+        for name, predicates in kpi_predicates(family, filters).items():
+            counters[(family, name)] = predicates
+    portfolio = {}
+    for project_id, counts in count_many_by(conn, source, counters, 'Project_ID', project_ids).items():
+        portfolio[project_id] = {
+            family: format_kpis(family, {name: counts[(family, name)] for name in FAMILIES[family]['kpis']})
+            for family in FAMILIES
+        }
+    return portfolio
+
+
+def group_counts(conn, source, predicates, columns):
+    """[(value, ..., count)] grouped by columns under predicates."""
+    source, weight = counted_source(conn, source, predicate_columns(predicates) | set(columns))
+    params = []
+    where_clause = where_sql(predicates, params)
+    group_by = ', '.join(columns)
+    return conn.execute(
+        f"SELECT {group_by}, {_count_sql(weight)} FROM {source} {where_clause} GROUP BY {group_by}",
+        params
+    ).fetchall()
+
+
+def _lag_sort_key(value):
+    try:
+        return (value is None, float(value), '')
+    except (TypeError, ValueError):
+        return (value is None, float('inf'), str(value))
+
+
+def shape_chart(shape, groups):
+    """Format grouped counts the way each dashboard chart consumes them."""
+    if shape == 'type_counts':
+        return {relationship_type: count for relationship_type, count in groups}
+
+    groups = sorted(groups, key=lambda g: (_lag_sort_key(g[0]), str(g[1])))
+    if shape == 'lag_type_list':
+        return [
+            {"lag": lag, "relationship_type": relationship_type, "count": count}
+            for lag, relationship_type, count in groups
+        ]
+    # lag_type_map: {lag: {relationship type: count}} for stacked columns
+    chart = {}
+    for lag, relationship_type, count in groups:
+        chart.setdefault(str(lag), {})[relationship_type] = count
+    return chart
+
+
+def chart_columns(shape):
+    """Columns a chart of this shape groups by."""
+    return ['RelationshipType'] if shape == 'type_counts' else ['Lag', 'RelationshipType']
+
+
+def chart_data(conn, source, family, filters):
+    shape = FAMILIES[family]['chart']['shape']
+    groups = group_counts(conn, source, chart_predicates(family, filters), chart_columns(shape))
+    return shape_chart(shape, groups)
+
+
+def chart_from_rows(family, rows):
+    """Chart series from already-fetched table rows, when the chart covers exactly those rows."""
+    shape = FAMILIES[family]['chart']['shape']
+    indexes = [ROW_INDEX[column] for column in chart_columns(shape)]
+    counts = Counter(tuple(row[i] for i in indexes) for row in rows)
+    return shape_chart(shape, [key + (count,) for key, count in counts.items()])
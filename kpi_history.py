@@ -0,0 +1,139 @@
+"""Per-import KPI snapshots behind the percentage history charts.
+
+materialize.refresh() calls record_snapshots() after every import: the raw KPI
+counters of every family are counted per project in one grouped scan (over
+the rollup cube) and stored in KPISnapshot under the project's data date.
+Only the projects of the new import are written, so earlier snapshots are
+never recomputed; re-importing the same data date replaces its rows.
+
+Counters rather than percentages are stored, so history across projects is
+the sum of their counters with the percentage recomputed from it.
+"""
+import datetime
+
+from kpi_engine import count_many_by, format_kpis
+from materialize import table_exists
+from metric_registry import FAMILIES, kpi_predicates
+
+SNAPSHOT_TABLE = 'KPISnapshot'
+# XER PROJECT column holding the schedule's data date
+DATA_DATE_COLUMN = 'last_recalc_date'
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def _data_dates(conn):
+    """{proj_id: 'YYYY-MM-DD'} from PROJECT, or {} when it has no data date column."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(PROJECT)")]
+    if DATA_DATE_COLUMN not in columns:
+        return {}
+    dates = {}
+    for proj_id, data_date in conn.execute(f"SELECT proj_id, {DATA_DATE_COLUMN} FROM PROJECT"):
+        try:
+            dates[str(proj_id)] = datetime.date.fromisoformat(str(data_date)[:10]).isoformat()
+        except ValueError:
+            print(f"Ignoring data date {data_date!r} of project {proj_id}")
+    return dates
+
+
+def record_snapshots(conn, source, project_type='', project_ids=None):
+    """Store every family's KPI counters per project at its data date; returns rows written.
+
+    Runs inside the caller's write transaction.  Projects without a data date
+    are recorded under today's date; project_ids limits it to those projects.
+    """
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {SNAPSHOT_TABLE} ("
+        f"Family TEXT NOT NULL, Project_ID {project_type}, Data_Date TEXT NOT NULL, "
+        f"Metric TEXT NOT NULL, Value INTEGER NOT NULL, Recorded_At TEXT NOT NULL, "
+        f"PRIMARY KEY (Family, Project_ID, Data_Date, Metric)) WITHOUT ROWID"
+    )
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_kpi_snapshot_date ON {SNAPSHOT_TABLE} (Family, Data_Date)"
+    )
+
+    counters = {}
+    for family in FAMILIES:
+        for name, predicates in kpi_predicates(family, {}).items():
+            counters[(family, name)] = predicates
+    counts = count_many_by(conn, source, counters, 'Project_ID', project_ids)
+
+    data_dates = _data_dates(conn)
+    today = datetime.date.today().isoformat()
+    recorded_at = datetime.datetime.now().isoformat(timespec='seconds')
+    rows = [
+        (family, project_id, data_dates.get(str(project_id), today), name, value, recorded_at)
+        for project_id, project_counts in counts.items()
+        for (family, name), value in project_counts.items()
+    ]
+    conn.executemany(f"INSERT OR REPLACE INTO {SNAPSHOT_TABLE} VALUES (?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+
+def history(conn, family, project_id=None, metric=None, start=None, end=None):
+    """[{"data_date": ..., <kpi>: value, ...}] oldest first, from an indexed range read.
+
+    Without project_id each point sums every project's latest snapshot as of
+    that date.  metric limits each point to that KPI.
+    """
+    if not table_exists(conn, SNAPSHOT_TABLE):
+        return []
+    conditions = ["Family = ?"]
+    params = [family]
+    if project_id is not None:
+        conditions.append("Project_ID = ?")
+        params.append(project_id)
+    if end:
+        conditions.append("Data_Date <= ?")
+        params.append(end)
+    # Snapshots before start are still read: they carry into the first point
+    rows = conn.execute(
+        f"SELECT Data_Date, Project_ID, Metric, Value FROM {SNAPSHOT_TABLE} "
+        f"WHERE {' AND '.join(conditions)} ORDER BY Data_Date",
+        params
+    ).fetchall()
+
+    latest = {}
+    points = []
+    for index, (data_date, project, name, value) in enumerate(rows):
+        latest.setdefault(project, {})[name] = value
+        if index + 1 < len(rows) and rows[index + 1][0] == data_date:
+            continue
+        if start and data_date < start:
+            continue
+        # Counters added to the registry after a snapshot was taken count as 0
+        counts = {
+            name: sum(project_counts.get(name, 0) for project_counts in latest.values())
+            for name in FAMILIES[family]['kpis']
+        }
+        kpis = format_kpis(family, counts)
+        if metric is not None:
+            kpis = {metric: kpis.get(metric)}
+        points.append(dict(kpis, data_date=data_date))
+    return points
+
+
+def percentage_history(conn, family, project_id=None):
+    """A family's percentage KPI per month, in the shape its dashboard chart reads.
+
+    Each month shows its latest data date, so several imports within a month
+    do not repeat its label.
+    """
+    name = FAMILIES[family]['percentage'][0]
+    # history() is oldest first: later points of a month replace earlier ones
+    months = {}
+    for point in history(conn, family, project_id, name):
+        months[point['data_date'][:7]] = point
+    points = []
+    for point in months.values():
+        year, month = int(point['data_date'][:4]), int(point['data_date'][5:7])
+        points.append((MONTHS[month - 1], year, point[name], point['data_date']))
+    if family == 'fs0d':
+        return {
+            "labels": [f"{month} {year}" for month, year, _, _ in points],
+            "data": [percentage for _, _, percentage, _ in points],
+        }
+    return [
+        {"month": month, "year": year, "percentage": percentage, "data_date": data_date}
+        for month, year, percentage, data_date in points
+    ]
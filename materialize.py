@@ -0,0 +1,237 @@
+"""Build an indexed table copy of ActivityRelationshipView.
+
+The API reads from ActivityRelationshipMat when it exists, so the joins behind
+the view run once per import instead of on every COUNT(*) / DISTINCT.
+
+Usage:
+    python materialize.py [path/to/mydata.db]
+
+Run it again after every XER import to refresh the copy.  xer_to_sqlite.py
+does that itself, and after an incremental import only rewrites the changed
+projects' rows (refresh_projects()).
+
+The same refresh builds ActivityRelationshipCube, a rollup of relationship
+counts per combination of the low-cardinality metric dimensions, which the
+KPI and chart queries read instead of the row table whenever every predicate
+they need is on one of those dimensions, and records the import's KPI
+snapshots for the history charts (see kpi_history.py).
+"""
+import os
+import sqlite3
+import sys
+import time
+
+from metric_registry import FILTER_COLUMNS, OPTION_GROUP_COLUMNS
+
+SOURCE_VIEW = 'ActivityRelationshipView'
+MATERIALIZED_TABLE = 'ActivityRelationshipMat'
+ROLLUP_TABLE = 'ActivityRelationshipCube'
+ROLLUP_DIMENSIONS = (
+    'Project_ID', 'Relationship_Status', 'RelationshipType', 'Driving', 'Lag', 'FreeFloat', 'ExcessiveLag',
+)
+ROLLUP_COUNT = 'Relationship_Count'
+
+# Stored as REAL so comparisons and ORDER BY need no CAST.  Not NUMERIC:
+# that affinity stores -1.0 as the integer -1, which would change the values
+# (and chart keys) the API returns compared with the view
+NUMERIC_COLUMNS = ('Lag', 'FreeFloat')
+
+# Composite indexes matching the metric filter patterns:
+# status + family predicate first, then the optional dashboard filters.
+INDEXES = {
+    'idx_arm_project_status_type': ('Project_ID', 'Relationship_Status', 'RelationshipType', 'Driving'),
+    'idx_arm_status_type_lag': ('Relationship_Status', 'RelationshipType', 'Lag'),
+    'idx_arm_status_lag_type': ('Relationship_Status', 'Lag', 'RelationshipType'),
+    'idx_arm_status_excessive_lag': ('Relationship_Status', 'ExcessiveLag', 'Lag'),
+    'idx_arm_status_freefloat': ('Relationship_Status', 'FreeFloat'),
+}
+# Covering index for the one-pass filter option scan (/api/bootstrap)
+INDEXES['idx_arm_filter_options'] = OPTION_GROUP_COLUMNS
+# Covering index for the facet scan: status first (every family's rows test it),
+# then the filter dimensions in GROUP BY order
+INDEXES['idx_arm_facets'] = ('Relationship_Status',) + tuple(FILTER_COLUMNS.values()) + ('ExcessiveLag',)
+# Single-column indexes (rowid is implied) so server-side sorted pages can
+# walk (column, Rel_Key) in index order instead of sorting the result
+INDEXES.update({
+    f'idx_arm_sort_{column.lower()}': (column,)
+    for column in (
+        'Activity_ID', 'Activity_ID2', 'Activity_Name', 'Activity_Name2', 'RelationshipType',
+        'Lag', 'Driving', 'FreeFloat', 'Lead', 'ExcessiveLag', 'Relationship_Status',
+    )
+})
+
+
+def table_exists(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def relationship_source(conn):
+    """Name of the table/view the API should query on this connection."""
+    return MATERIALIZED_TABLE if table_exists(conn, MATERIALIZED_TABLE) else SOURCE_VIEW
+
+
+def has_rollup(conn):
+    return table_exists(conn, ROLLUP_TABLE)
+
+
+def numeric_sort_key(source, column):
+    """ORDER BY expression for a numeric column of the given source."""
+    if source == MATERIALIZED_TABLE and column in NUMERIC_COLUMNS:
+        return column
+    return f"CAST({column} AS REAL)"
+
+
+def _column_definitions(conn):
+    columns = conn.execute(f"PRAGMA table_info({SOURCE_VIEW})").fetchall()
+    if not columns:
+        raise sqlite3.OperationalError(f"no such view: {SOURCE_VIEW}")
+    definitions = []
+    select_exprs = []
+    for _, name, declared_type, _, _, _ in columns:
+        if name in NUMERIC_COLUMNS:
+            definitions.append(f'"{name}" REAL')
+            select_exprs.append(f'CAST(NULLIF(TRIM("{name}"), \'\') AS REAL)')
+        else:
+            # Keep the view's affinity so Project_ID etc. compare exactly as before
+            definitions.append(f'"{name}" {declared_type}'.rstrip())
+            select_exprs.append(f'"{name}"')
+    return definitions, select_exprs
+
+
+def _declared_types(conn):
+    return {
+        name: declared_type
+        for _, name, declared_type, _, _, _ in conn.execute(f"PRAGMA table_info({MATERIALIZED_TABLE})")
+    }
+
+
+def _build_rollup(conn):
+    """Recreate ActivityRelationshipCube from the new table; runs inside refresh()'s transaction."""
+    declared = _declared_types(conn)
+    dimensions = ', '.join(ROLLUP_DIMENSIONS)
+    definitions = ', '.join(f'"{name}" {declared[name]}'.rstrip() for name in ROLLUP_DIMENSIONS)
+    conn.execute(f"DROP TABLE IF EXISTS {ROLLUP_TABLE}")
+    conn.execute(f"CREATE TABLE {ROLLUP_TABLE} ({definitions}, {ROLLUP_COUNT} INTEGER NOT NULL)")
+    conn.execute(
+        f"INSERT INTO {ROLLUP_TABLE} SELECT {dimensions}, COUNT(*) "
+        f"FROM {MATERIALIZED_TABLE} GROUP BY {dimensions}"
+    )
+    return conn.execute(f"SELECT COUNT(*) FROM {ROLLUP_TABLE}").fetchone()[0]
+
+
+def refresh(db_path):
+    """Rebuild ActivityRelationshipMat (and its rollup cube) from the view and swap it in atomically."""
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        definitions, select_exprs = _column_definitions(conn)
+        staging = f"{MATERIALIZED_TABLE}_new"
+
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"DROP TABLE IF EXISTS {staging}")
+        conn.execute(
+            f"CREATE TABLE {staging} (Rel_Key INTEGER PRIMARY KEY, {', '.join(definitions)})"
+        )
+        conn.execute(
+            f"INSERT INTO {staging} SELECT NULL, {', '.join(select_exprs)} FROM {SOURCE_VIEW}"
+        )
+        row_count = conn.execute(f"SELECT COUNT(*) FROM {staging}").fetchone()[0]
+
+        # Readers keep their WAL snapshot of the old table until this commits
+        conn.execute(f"DROP TABLE IF EXISTS {MATERIALIZED_TABLE}")
+        conn.execute(f"ALTER TABLE {staging} RENAME TO {MATERIALIZED_TABLE}")
+        for index_name, index_columns in INDEXES.items():
+            conn.execute(
+                f"CREATE INDEX {index_name} ON {MATERIALIZED_TABLE} ({', '.join(index_columns)})"
+            )
+        conn.execute(f"ANALYZE {MATERIALIZED_TABLE}")
+        rollup_count = _build_rollup(conn)
+        # Imported here: kpi_history reads the constants above through kpi_engine
+        from kpi_history import record_snapshots
+        snapshot_count = record_snapshots(conn, MATERIALIZED_TABLE, _declared_types(conn)['Project_ID'])
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Materialized {row_count} relationships into {MATERIALIZED_TABLE} "
+          f"({rollup_count} {ROLLUP_TABLE} rows, {snapshot_count} KPI snapshot values) in {elapsed:.2f}s")
+    return row_count
+
+
+def refresh_projects(db_path, project_ids):
+    """Re-materialize only project_ids' rows, cube rows and KPI snapshots, in one transaction.
+
+    Falls back to refresh() when there is no materialized table yet or its
+    columns no longer match the view's (or their types, e.g. a table built
+    before Lag/FreeFloat were stored as REAL).
+    """
+    project_ids = sorted({str(project_id) for project_id in project_ids})
+    if not project_ids:
+        return 0
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        definitions, _ = _column_definitions(conn)
+        built = [f'"{name}" {declared_type}'.rstrip() for name, declared_type in _declared_types(conn).items()]
+        current = has_rollup(conn) and built[1:] == definitions
+    finally:
+        conn.close()
+    if not current:
+        return refresh(db_path)
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Deletes and inserts touch every index of the table; keep their pages cached
+        conn.execute("PRAGMA cache_size=-262144")
+        _, select_exprs = _column_definitions(conn)
+        placeholders = ', '.join('?' for _ in project_ids)
+        in_projects = f"WHERE Project_ID IN ({placeholders})"
+        dimensions = ', '.join(ROLLUP_DIMENSIONS)
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"DELETE FROM {MATERIALIZED_TABLE} {in_projects}", project_ids)
+        conn.execute(
+            f"INSERT INTO {MATERIALIZED_TABLE} SELECT NULL, {', '.join(select_exprs)} "
+            f"FROM {SOURCE_VIEW} {in_projects}",
+            project_ids
+        )
+        row_count = conn.execute(
+            f"SELECT COUNT(*) FROM {MATERIALIZED_TABLE} {in_projects}", project_ids
+        ).fetchone()[0]
+        conn.execute(f"DELETE FROM {ROLLUP_TABLE} {in_projects}", project_ids)
+        conn.execute(
+            f"INSERT INTO {ROLLUP_TABLE} SELECT {dimensions}, COUNT(*) "
+            f"FROM {MATERIALIZED_TABLE} {in_projects} GROUP BY {dimensions}",
+            project_ids
+        )
+        from kpi_history import record_snapshots
+        snapshot_count = record_snapshots(
+            conn, MATERIALIZED_TABLE, _declared_types(conn)['Project_ID'], project_ids
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Re-materialized {row_count} relationships of {len(project_ids)} projects "
+          f"({snapshot_count} KPI snapshot values) in {elapsed:.2f}s")
+    return row_count
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('METRICS_DB_PATH')
+    if not db_path:
+        sys.exit("usage: python materialize.py path/to/mydata.db")
+    refresh(db_path)
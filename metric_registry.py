@@ -0,0 +1,220 @@
+"""Declarative description of the five metric families.
+
+Predicates are plain ``(column, op, value)`` tuples so the same definitions can
+be compiled to bound-parameter SQL (``where_sql``) or evaluated by other
+engines.  ``(None, 'or', (p1, p2, ...))`` groups alternatives.
+"""
+
+INCOMPLETE = ('Relationship_Status', '=', 'Incomplete')
+FS_TYPES = ('PR_FS', 'PR_FS1')
+NOT_FS = ('RelationshipType', 'not in', FS_TYPES)
+LAG_NULL_OR_NONZERO = (None, 'or', (('Lag', 'is null', None), ('Lag', '!=', 0)))
+LEADS = [INCOMPLETE, ('Lag', '<', 0)]
+LAGS = [INCOMPLETE, ('Lag', '!=', 0), ('Lag', 'is not null', None)]
+EXCESSIVE_LAGS = [INCOMPLETE, ('ExcessiveLag', '=', 'Excessive Lag')]
+
+# Dashboard filter parameter -> column, in the order predicates are emitted
+FILTER_COLUMNS = {
+    'relationship_type': 'RelationshipType',
+    'driving': 'Driving',
+    'lag': 'Lag',
+    'free_float': 'FreeFloat',
+    'project_id': 'Project_ID',
+}
+NUMERIC_FILTERS = ('lag', 'free_float')
+
+# Table columns and the keys the dashboard expects for them
+ROW_COLUMNS = [
+    ('Activity_ID', 'Pred. ID'),
+    ('Activity_ID2', 'Succ. ID'),
+    ('Activity_Name', 'Pred. Name'),
+    ('Activity_Name2', 'Succ. Name'),
+    ('RelationshipType', 'Relationship type'),
+    ('Lag', 'Lag'),
+    ('Driving', 'Driving'),
+    ('FreeFloat', 'FreeFloat'),
+    ('Lead', 'Lead'),
+    ('ExcessiveLag', 'ExcessiveLag'),
+    ('Relationship_Status', 'Relationship_Status'),
+]
+
+FAMILIES = {
+    'fs0d': {
+        'title': 'FS+0d Lag',
+        'defaults': {'relationship_type': ('RelationshipType', 'in', FS_TYPES)},
+        'rows': [INCOMPLETE],
+        'kpis': {
+            'Total_Relationship_Count': {'where': []},
+            'Remaining_Relationship_Count': {'where': [INCOMPLETE]},
+            # A selected Lag value replaces the Lag > 0 condition
+            'Lag_Count': {'where': [INCOMPLETE], 'defaults': {'lag': ('Lag', '>', 0)}},
+        },
+        'percentage': ('Relationship_Percentage', 'Total_Relationship_Count', 'Remaining_Relationship_Count', 2),
+        # Donut of relationship types across all statuses
+        'chart': {'shape': 'type_counts', 'where': []},
+    },
+    'non-fs0d': {
+        'title': 'Non FS+0d Lag',
+        'defaults': {'relationship_type': NOT_FS},
+        'rows': [INCOMPLETE, LAG_NULL_OR_NONZERO],
+        'kpis': {
+            'Total_Relationship_Count': {'where': 'rows'},
+            'Remaining_Relationship_Count': {'where': 'rows'},
+            'Lag_Count': {'where': 'rows', 'extra': [('Lag', '!=', 0), ('Lag', 'is not null', None)]},
+        },
+        'percentage': ('Lag_Percentage', 'Lag_Count', 'Remaining_Relationship_Count', 2),
+        'chart': {'shape': 'type_counts', 'where': 'rows'},
+    },
+    'leads': {
+        'title': 'Leads',
+        'defaults': {},
+        'rows': LEADS,
+        'kpis': {
+            # Project-wide denominator: ignores every filter except the project
+            'Total_Relationship_Count': {'where': [], 'filters': ('project_id',)},
+            'Remaining_Relationship_Count': {'where': [INCOMPLETE]},
+            'Leads_Count': {'where': 'rows'},
+        },
+        'percentage': ('Lead_Percentage', 'Leads_Count', 'Remaining_Relationship_Count', 2),
+        'chart': {'shape': 'lag_type_list', 'where': 'rows'},
+    },
+    'lags': {
+        'title': 'Lags',
+        'defaults': {},
+        'rows': LAGS,
+        'kpis': {
+            'Lag_Count': {'where': 'rows'},
+            'Remaining_Relationships': {'where': [INCOMPLETE]},
+        },
+        'percentage': ('Lag_Percentage', 'Lag_Count', 'Remaining_Relationships', 1),
+        'chart': {'shape': 'lag_type_map', 'where': 'rows'},
+    },
+    'excessive-lags': {
+        'title': 'Excessive Lags',
+        'defaults': {},
+        'rows': EXCESSIVE_LAGS,
+        'kpis': {
+            'Lag_Count': {'where': 'rows'},
+            'Remaining_Relationships': {
+                'where': [INCOMPLETE],
+                'filters': ('relationship_type', 'driving', 'free_float', 'project_id'),
+            },
+        },
+        'percentage': ('Lag_Percentage', 'Lag_Count', 'Remaining_Relationships', 1),
+        'chart': {'shape': 'lag_type_map', 'where': 'rows'},
+    },
+}
+
+# Filter dropdown lists of each tab: {filter name: predicates scoping its DISTINCT values}.
+# The FS+0d tab hardcodes its relationship types and driving values in the dashboard.
+FILTER_OPTIONS = {
+    'fs0d': {'lag': [], 'free_float': []},
+    'non-fs0d': {
+        'relationship_type': [NOT_FS],
+        'lag': [NOT_FS, LAG_NULL_OR_NONZERO],
+        'free_float': [NOT_FS, LAG_NULL_OR_NONZERO],
+        'driving': [NOT_FS, LAG_NULL_OR_NONZERO],
+    },
+    'leads': {name: LEADS for name in ('relationship_type', 'lag', 'free_float', 'driving')},
+    'lags': {name: LAGS for name in ('relationship_type', 'lag', 'free_float', 'driving')},
+    'excessive-lags': {name: EXCESSIVE_LAGS for name in ('relationship_type', 'lag', 'free_float', 'driving')},
+}
+# Every column FILTER_OPTIONS lists or tests; option_lists groups by these, and the
+# materialized table has a covering index in this order so the GROUP BY needs no sort.
+OPTION_GROUP_COLUMNS = ('RelationshipType', 'Lag', 'FreeFloat', 'Driving', 'Relationship_Status', 'ExcessiveLag')
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return value
+    return int(number) if number.is_integer() else number
+
+
+def parse_filters(args):
+    """Dashboard filter values from request args, dropping unset/'All' ones."""
+    filters = {}
+    for name in FILTER_COLUMNS:
+        value = args.get(name)
+        if value and value != 'All':
+            filters[name] = _number(value) if name in NUMERIC_FILTERS else value
+    return filters
+
+
+def filter_predicates(filters, defaults, dimensions=None):
+    predicates = []
+    for name, column in FILTER_COLUMNS.items():
+        if dimensions is not None and name not in dimensions:
+            continue
+        if name in filters:
+            predicates.append((column, '=', filters[name]))
+        elif name in defaults:
+            predicates.append(defaults[name])
+    return predicates
+
+
+def row_predicates(family, filters):
+    """Predicates selecting the rows shown in a family's table."""
+    spec = FAMILIES[family]
+    return spec['rows'] + filter_predicates(filters, spec['defaults'])
+
+
+def chart_predicates(family, filters):
+    """Predicates for a family's stacked/donut chart."""
+    spec = FAMILIES[family]
+    where = spec['chart']['where']
+    base = spec['rows'] if where == 'rows' else where
+    return base + filter_predicates(filters, spec['defaults'])
+
+
+def kpi_predicates(family, filters):
+    """{kpi name: predicates} for every counter of a family."""
+    spec = FAMILIES[family]
+    counters = {}
+    for name, kpi in spec['kpis'].items():
+        if kpi['where'] == 'rows':
+            base = list(spec['rows'])
+        else:
+            base = list(kpi['where'])
+        defaults = dict(spec['defaults'])
+        defaults.update(kpi.get('defaults', {}))
+        counters[name] = (
+            base
+            + filter_predicates(filters, defaults, kpi.get('filters'))
+            + kpi.get('extra', [])
+        )
+    return counters
+
+
+def predicate_columns(predicates):
+    """Set of columns a predicate list tests."""
+    columns = set()
+    for column, op, value in predicates:
+        if op == 'or':
+            columns |= predicate_columns(value)
+        else:
+            columns.add(column)
+    return columns
+
+
+def predicate_sql(predicate, params):
+    """Compile one predicate to SQL, appending its bound values to params."""
+    column, op, value = predicate
+    if op == 'or':
+        return '(' + ' OR '.join(predicate_sql(p, params) for p in value) + ')'
+    if op in ('is null', 'is not null'):
+        return f"{column} {op.upper()}"
+    if op in ('in', 'not in'):
+        params.extend(value)
+        placeholders = ', '.join('?' for _ in value)
+        return f"{column} {op.upper()} ({placeholders})"
+    params.append(value)
+    return f"{column} {op} ?"
+
+
+def where_sql(predicates, params):
+    """'WHERE a AND b' (or '') for a predicate list."""
+    if not predicates:
+        return ''
+    return 'WHERE ' + ' AND '.join(predicate_sql(p, params) for p in predicates)
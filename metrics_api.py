@@ -1,1231 +1,650 @@
-from flask import Flask, jsonify, send_from_directory, request
+from flask import Flask, Response, g, jsonify, send_from_directory, request, stream_with_context
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import sqlite3
 import os
+import time
+
+import request_metrics
+from db_pool import ConnectionPool
+from slow_queries import SlowQueryLog
+from result_cache import ResultCache
+from materialize import MATERIALIZED_TABLE, SOURCE_VIEW, relationship_source
+from metric_registry import FAMILIES, FILTER_COLUMNS, parse_filters
+from filter_options import distinct_options, facet_counts, option_lists, project_options as project_options_for
+from kpi_engine import family_kpis, kpi_summary, empty_kpis, chart_data, chart_from_rows, portfolio_kpis
+from kpi_history import history, percentage_history
+from row_queries import (
+    fetch_rows, fetch_page, stream_rows, open_cursor, InvalidPageRequest,
+    DEFAULT_PAGE_SIZE, STREAM_FORMATS, ROW_FORMATS,
+)
+from table_export import EXPORT_FORMATS, export_chunks
 
 app = Flask(__name__)
-DB_PATH = r'C:\Users\kvsha\Desktop\sample_project\mydata.db'
+DB_PATH = os.environ.get('METRICS_DB_PATH', r'C:\Users\kvsha\Desktop\sample_project\mydata.db')
+
+# Connection tuning (see README "Performance tuning")
+DB_CACHE_SIZE_KB = int(os.environ.get('METRICS_DB_CACHE_SIZE_KB', 65536))
+DB_MMAP_SIZE = int(os.environ.get('METRICS_DB_MMAP_SIZE', 268435456))
+DB_IMMUTABLE = os.environ.get('METRICS_DB_IMMUTABLE', '0') == '1'
+DB_HEALTH_CHECK_INTERVAL = float(os.environ.get('METRICS_DB_HEALTH_CHECK_INTERVAL', 30))
+
+# Per-request phase timings: Server-Timing headers and /metrics (see request_metrics.py)
+INSTRUMENTATION = os.environ.get('METRICS_INSTRUMENTATION', '1') == '1'
+STATS_DIR = os.environ.get('METRICS_STATS_DIR') or None
+
+pool = ConnectionPool(
+    DB_PATH,
+    cache_size_kb=DB_CACHE_SIZE_KB,
+    mmap_size=DB_MMAP_SIZE,
+    immutable=DB_IMMUTABLE,
+    health_check_interval=DB_HEALTH_CHECK_INTERVAL,
+    factory=request_metrics.TimedConnection if INSTRUMENTATION else sqlite3.Connection,
+)
+if not os.path.isfile(DB_PATH):
+    print(f"Database not found: {DB_PATH} (set METRICS_DB_PATH); API requests will fail until it exists")
+route_metrics = request_metrics.RequestMetrics(STATS_DIR)
+
+# Statements slower than this many ms are logged with their query plan (see
+# slow_queries.py); 0 disables the log.  Needs METRICS_INSTRUMENTATION.
+SLOW_QUERY_MS = float(os.environ.get('METRICS_SLOW_QUERY_MS', 500))
+SLOW_QUERY_LOG = os.environ.get(
+    'METRICS_SLOW_QUERY_LOG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'slow_queries.log')
+)
+SLOW_QUERY_LOG_BYTES = int(os.environ.get('METRICS_SLOW_QUERY_LOG_BYTES', 10 * 1024 * 1024))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get('METRICS_SLOW_QUERY_LOG_BACKUPS', 5))
+if INSTRUMENTATION and SLOW_QUERY_MS > 0:
+    request_metrics.TimedConnection.slow_log = SlowQueryLog(
+        SLOW_QUERY_LOG, SLOW_QUERY_MS, SLOW_QUERY_LOG_BYTES, SLOW_QUERY_LOG_BACKUPS,
+    )
+if INSTRUMENTATION:
+    app.json = request_metrics.TimedJSONProvider(app)
+
+# Response cache (see README "Performance tuning"); 0 entries disables it
+CACHE_MAX_ENTRIES = int(os.environ.get('METRICS_CACHE_MAX_ENTRIES', 512))
+CACHE_MAX_BYTES = int(os.environ.get('METRICS_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_TTL = float(os.environ.get('METRICS_CACHE_TTL', 300))
+
+result_cache = ResultCache(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL)
+bootstrap_cache = ResultCache(max_entries=1, ttl=float('inf'))
+
+# Query engine for KPIs, charts and table rows: 'sqlite' (default), 'numpy',
+# which answers them from in-memory column arrays (see numpy_engine.py), or
+# 'bitmap', which counts KPIs and charts with bitmap indexes (see bitmap_index.py)
+ENGINE = os.environ.get('METRICS_ENGINE', 'sqlite')
+if ENGINE == 'numpy':
+    try:
+        import numpy_engine
+    except ImportError as e:
+        print(f"NumPy engine unavailable ({e}); using SQLite")
+        ENGINE = 'sqlite'
+    else:
+        numpy_engine.snapshots.version = pool.data_version
+        family_kpis = numpy_engine.family_kpis
+        kpi_summary = numpy_engine.kpi_summary
+        chart_data = numpy_engine.chart_data
+        fetch_rows = numpy_engine.fetch_rows
+elif ENGINE == 'bitmap':
+    import bitmap_index
+    bitmap_index.indexes.version = pool.data_version
+    family_kpis = bitmap_index.family_kpis
+    kpi_summary = bitmap_index.kpi_summary
+    chart_data = bitmap_index.chart_data
+
+# /api/portfolio-kpi splits its grouped pass over this many threads (each with
+# its own pooled connection; SQLite runs them in parallel); 0 or 1 runs it inline
+PORTFOLIO_WORKERS = int(os.environ.get('METRICS_PORTFOLIO_WORKERS', 0))
+portfolio_executor = (
+    ThreadPoolExecutor(PORTFOLIO_WORKERS, thread_name_prefix='portfolio') if PORTFOLIO_WORKERS > 1 else None
+)
+
+# Families with a percentage history chart (recorded per import by kpi_history.py)
+HISTORY_FAMILIES = ('fs0d', 'leads', 'lags', 'excessive-lags')
+
+def get_db():
+    # Per-thread pooled read-only connection; never close it in a route
+    with request_metrics.phase('connect'):
+        return pool.connection()
+
+@app.teardown_appcontext
+def release_db(exc):
+    # A failed query may leave the connection unusable, so let the pool reopen it
+    if isinstance(exc, sqlite3.DatabaseError):
+        pool.discard()
+
+def route_label():
+    # The URL rule with the family filled in: one series per route and tab
+    if request.url_rule is None:
+        return 'unmatched'
+    family = (request.view_args or {}).get('family')
+    if family in FAMILIES:
+        return request.url_rule.rule.replace('<family>', family)
+    return request.url_rule.rule
+
+# Registered before the cache hooks, so the timer covers them and the
+# response is recorded after they have run
+@app.before_request
+def start_timer():
+    if INSTRUMENTATION:
+        request_metrics.start(request.full_path.rstrip('?'))
+
+@app.after_request
+def record_timing(response):
+    timer = request_metrics.current()
+    if timer is None:
+        return response
+    timer.cache_hit = g.get('cache_hit', False)
+    response.headers['Server-Timing'] = timer.server_timing()
+    route, status = route_label(), response.status_code
+    if response.is_streamed:
+        # Recorded once the last chunk is out; the header only covers the query
+        def done(size):
+            route_metrics.observe(route, status, timer, timer.elapsed(), size)
+        response.response = request_metrics.CountedBody(response.response, timer, done)
+    else:
+        route_metrics.observe(route, status, timer, timer.elapsed(), response.content_length or 0)
+    request_metrics.stop()
+    return response
+
+def cache_key():
+    # Filters are normalized ('All' dropped, numbers parsed) so equivalent URLs share an entry
+    filters = parse_filters(request.args)
+    others = sorted(
+        (name, value) for name, value in request.args.items(multi=True)
+        if name not in FILTER_COLUMNS
+    )
+    return (request.path, tuple(sorted(filters.items(), key=lambda item: item[0])), tuple(others))
+
+def conditional_request():
+    # Responses that depend only on the database content and the query string
+    if request.method != 'GET' or not request.path.startswith('/api/'):
+        return False
+    return request.endpoint not in ('health', 'cache_stats')
+
+def cacheable_request():
+    if request.endpoint == 'metric_export':
+        return False
+    return request.args.get('format') not in STREAM_FORMATS
+
+def skip_cache():
+    # For fallback responses (e.g. zeroed KPIs after an error) that must not be reused
+    g.skip_cache = True
+
+def validators(version, key):
+    """ETag and Last-Modified for a query against one database version."""
+    etag = hashlib.sha1(repr((version, key)).encode('utf-8')).hexdigest()
+    mtimes = [signature[2] for signature in version if signature]
+    last_modified = max(mtimes) // 1_000_000_000 if mtimes else None
+    # HTTP dates have whole seconds: until the second of the last write is over,
+    # another write could keep the same Last-Modified, so only the ETag is sent
+    if last_modified is not None and last_modified >= int(time.time()):
+        last_modified = None
+    return etag, last_modified
+
+@app.before_request
+def check_not_modified():
+    # Answered from a stat() of the database files; SQLite is never opened for a 304
+    if not conditional_request():
+        return None
+    g.cache_version = pool.data_version()
+    g.cache_key = cache_key()
+    g.etag, g.last_modified = validators(g.cache_version, g.cache_key)
+    # If-None-Match takes precedence; If-Modified-Since only counts without it (RFC 9110)
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(g.etag)
+    else:
+        not_modified = (
+            request.if_modified_since is not None and g.last_modified is not None
+            and request.if_modified_since.timestamp() >= g.last_modified
+        )
+    if not not_modified:
+        return None
+    response = app.response_class(status=304)
+    response.set_etag(g.etag)
+    if g.last_modified is not None:
+        response.last_modified = g.last_modified  # werkzeug would send the current time for None
+    response.cache_control.no_cache = True
+    return response
+
+@app.before_request
+def serve_cached():
+    if CACHE_MAX_ENTRIES <= 0 or 'cache_key' not in g or not cacheable_request():
+        return None
+    hit = result_cache.get(g.cache_key, g.cache_version)
+    if hit is None:
+        return None
+    body, mimetype = hit
+    g.cache_hit = True
+    return app.response_class(body, mimetype=mimetype)
+
+@app.after_request
+def store_cached(response):
+    key = g.pop('cache_key', None)
+    if key is None or response.status_code != 200 or g.get('skip_cache'):
+        return response
+    # Browsers keep the body but revalidate with If-None-Match on every use
+    response.set_etag(g.etag)
+    if g.last_modified is not None:
+        response.last_modified = g.last_modified
+    response.cache_control.no_cache = True
+    if CACHE_MAX_ENTRIES > 0 and cacheable_request() and not response.is_streamed:
+        body = response.get_data()
+        result_cache.set(key, (body, response.mimetype), len(body), g.cache_version)
+    return response
+
+@app.route('/api/cache-stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Per-route latency, phase, row count and payload histograms (Prometheus text format)
+    return Response(route_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/')
 def serve_dashboard():
     return send_from_directory(os.path.dirname(__file__), 'metrics_dashboard.html')
 
+@app.route('/api/health')
+def health():
+    status = pool.health(sources=(MATERIALIZED_TABLE, SOURCE_VIEW))
+    status['engine'] = ENGINE
+    return jsonify(status), (200 if status['ok'] else 503)
+
+def kpi_response(family):
+    conn = get_db()
+    filters = parse_filters(request.args)
+    try:
+        kpi_data = family_kpis(conn, relationship_source(conn), family, filters)
+    except Exception as e:
+        print(f"Error in {family} KPI: {e}")
+        skip_cache()
+        kpi_data = empty_kpis(family)
+    return jsonify(kpi_data)
+
+def page_args():
+    # Paging is opt-in: without limit/cursor the row routes return the full list
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return None
+    return {
+        'limit': request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+        'sort': request.args.get('sort'),
+        'descending': request.args.get('order') == 'desc',
+        'cursor': request.args.get('cursor'),
+    }
+
+def rows_response(family):
+    conn = get_db()
+    source = relationship_source(conn)
+    filters = parse_filters(request.args)
+    paging = page_args()
+    fmt = request.args.get('format', 'json')
+    try:
+        if fmt not in ROW_FORMATS:
+            # Streamed straight from the cursor; nothing is built up in memory
+            chunks = stream_rows(conn, source, family, filters, fmt,
+                                 request.args.get('sort'), request.args.get('order') == 'desc')
+            return Response(stream_with_context(chunks), mimetype=STREAM_FORMATS[fmt])
+        encode = ROW_FORMATS[fmt]
+        if paging is not None:
+            return jsonify(fetch_page(conn, source, family, filters, encode=encode, **paging))
+        rows = fetch_rows(conn, source, family, filters,
+                          request.args.get('sort'), request.args.get('order') == 'desc')
+    except InvalidPageRequest as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(encode(rows))
+
+def history_response(family):
+    # Only the project filter applies: snapshots are recorded per project
+    conn = get_db()
+    filters = parse_filters(request.args)
+    return jsonify(percentage_history(conn, family, filters.get('project_id')))
+
+def options_response(family, name):
+    conn = get_db()
+    return jsonify(distinct_options(conn, relationship_source(conn), family, name))
+
+def chart_response(family):
+    conn = get_db()
+    filters = parse_filters(request.args)
+    return jsonify(chart_data(conn, relationship_source(conn), family, filters))
+
+@app.route('/api/<family>/bundle')
+def metric_bundle(family):
+    # Everything one tab renders, from one request: the table rows are fetched once
+    # and the chart is derived from them whenever it covers the same rows.
+    if family not in FAMILIES:
+        return jsonify({"error": f"Unknown metric family: {family}"}), 404
+    conn = get_db()
+    source = relationship_source(conn)
+    filters = parse_filters(request.args)
+
+    encode = ROW_FORMATS.get(request.args.get('format', 'json'))
+    if encode is None:
+        return jsonify({"error": "Bundles support format=json or format=columnar"}), 400
+    paging = page_args()
+    page = None
+    if paging is not None:
+        # Only the first page of rows is sent, so the chart needs its own GROUP BY
+        try:
+            page = fetch_page(conn, source, family, filters, encode=encode, **paging)
+        except InvalidPageRequest as e:
+            return jsonify({"error": str(e)}), 400
+        rows = page.pop('rows')
+        chart = chart_data(conn, source, family, filters)
+    else:
+        fetched = fetch_rows(conn, source, family, filters)
+        rows = encode(fetched)
+        if FAMILIES[family]['chart']['where'] == 'rows':
+            chart = chart_from_rows(family, fetched)
+        else:
+            chart = chart_data(conn, source, family, filters)
+    try:
+        kpi_data = family_kpis(conn, source, family, filters)
+    except Exception as e:
+        print(f"Error in {family} KPI: {e}")
+        skip_cache()
+        kpi_data = empty_kpis(family)
+
+    bundle = {
+        "rows": rows,
+        "kpis": kpi_data,
+        "chart": chart,
+        "history": percentage_history(conn, family, filters.get('project_id'))
+        if family in HISTORY_FAMILIES else None,
+    }
+    if page is not None:
+        bundle["page"] = page
+    return jsonify(bundle)
+
+@app.route('/api/<family>/export')
+def metric_export(family):
+    # Whole filtered table as a download, streamed from the cursor in batches
+    if family not in FAMILIES:
+        return jsonify({"error": f"Unknown metric family: {family}"}), 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown export format: {fmt}"}), 400
+    conn = get_db()
+    filters = parse_filters(request.args)
+    try:
+        cursor = open_cursor(conn, relationship_source(conn), family, filters,
+                             request.args.get('sort'), request.args.get('order') == 'desc')
+    except InvalidPageRequest as e:
+        return jsonify({"error": str(e)}), 400
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"{family.replace('-', '_')}_data.{extension}"
+    chunks = export_chunks(cursor, fmt, FAMILIES[family]['title'])
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+@app.route('/api/<family>/facets')
+def metric_facets(family):
+    # Values and row counts of each filter dimension under the other current selections
+    if family not in FAMILIES:
+        return jsonify({"error": f"Unknown metric family: {family}"}), 404
+    conn = get_db()
+    filters = parse_filters(request.args)
+    return jsonify(facet_counts(conn, relationship_source(conn), family, filters))
+
+@app.route('/api/bootstrap')
+def bootstrap():
+    # Every tab's filter options and the project list from one grouped scan.
+    # Kept until the database changes (no TTL): options only change on import.
+    version = g.get('cache_version') or pool.data_version()
+    body = bootstrap_cache.get('bootstrap', version)
+    if body is None:
+        conn = get_db()
+        options = option_lists(conn, relationship_source(conn))
+        try:
+            projects = project_options_for(conn)
+        except sqlite3.Error as e:
+            print(f"Error fetching project options: {e}")
+            skip_cache()
+            projects = []
+        body = {"projects": projects, "options": options}
+        if not g.get('skip_cache'):
+            bootstrap_cache.set('bootstrap', body, 1, version)
+    return jsonify(body)
+
+@app.route('/api/kpi-history')
+def kpi_history_route():
+    # Recorded KPIs of one family over time: ?family=leads&project_id=..&metric=..&from=..&to=..
+    family = request.args.get('family', 'fs0d')
+    if family not in FAMILIES:
+        return jsonify({"error": f"Unknown metric family: {family}"}), 404
+    metric = request.args.get('metric')
+    if metric is not None and metric not in FAMILIES[family]['kpis'] and metric != FAMILIES[family]['percentage'][0]:
+        return jsonify({"error": f"Unknown metric for {family}: {metric}"}), 400
+    conn = get_db()
+    filters = parse_filters(request.args)
+    return jsonify(history(
+        conn, family, filters.get('project_id'), metric,
+        request.args.get('from'), request.args.get('to'),
+    ))
+
+def portfolio_counts(conn, source, filters, project_ids):
+    if portfolio_executor is None or len(project_ids) < 2:
+        return portfolio_kpis(conn, source, filters)
+    chunks = [project_ids[i::PORTFOLIO_WORKERS] for i in range(PORTFOLIO_WORKERS)]
+    portfolio = {}
+    # The workers' queries are not timed themselves; waiting for them counts as sql
+    with request_metrics.phase('sql'):
+        for part in portfolio_executor.map(
+            lambda chunk: portfolio_kpis(pool.connection(), source, filters, chunk), [c for c in chunks if c]
+        ):
+            portfolio.update(part)
+    return portfolio
+
+def portfolio_sort_key(sort):
+    """Sort key for ?sort=name|id|<family>.<kpi>, or None when sort is unknown."""
+    if sort in ('name', 'id'):
+        return lambda project: (project[sort] is None, str(project[sort] or ''))
+    family, _, metric = sort.partition('.')
+    if family in FAMILIES and (metric in FAMILIES[family]['kpis'] or metric == FAMILIES[family]['percentage'][0]):
+        return lambda project: project[family][metric]
+    return None
+
+@app.route('/api/portfolio-kpi')
+def portfolio_kpi():
+    # Every family's KPIs for every project: ?sort=lags.Lag_Percentage&order=desc plus the usual filters
+    sort = request.args.get('sort', 'name')
+    key = portfolio_sort_key(sort)
+    if key is None:
+        return jsonify({"error": f"Unknown sort: {sort}"}), 400
+    conn = get_db()
+    filters = parse_filters(request.args)
+    try:
+        projects = project_options_for(conn)
+        if 'project_id' in filters:
+            projects = [p for p in projects if str(p['id']) == str(filters['project_id'])]
+        counts = portfolio_counts(conn, relationship_source(conn), filters, [p['id'] for p in projects])
+    except sqlite3.OperationalError as e:
+        print(f"Error in portfolio KPI: {e}")
+        skip_cache()
+        projects, counts = [], {}
+    counts = {str(project_id): kpis for project_id, kpis in counts.items()}
+    portfolio = []
+    for project in projects:
+        kpis = counts.get(str(project['id'])) or {family: empty_kpis(family) for family in FAMILIES}
+        portfolio.append(dict(project, **kpis))
+    portfolio.sort(key=key, reverse=request.args.get('order') == 'desc')
+    return jsonify(portfolio)
+
+@app.route('/api/kpi-summary')
+def kpi_summary_route():
+    # KPIs of all five tabs for one filter set, computed in a single scan
+    conn = get_db()
+    filters = parse_filters(request.args)
+    return jsonify(kpi_summary(conn, relationship_source(conn), filters))
+
 @app.route('/api/lag-options')
 def get_lag_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT Lag FROM ActivityRelationshipView ORDER BY CAST(Lag AS REAL)")
-    lags = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(lags)
+    return options_response('fs0d', 'lag')
 
 @app.route('/api/free-float-options')
 def get_free_float_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT FreeFloat FROM ActivityRelationshipView ORDER BY CAST(FreeFloat AS REAL)")
-    free_floats = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(free_floats)
+    return options_response('fs0d', 'free_float')
 
 @app.route('/api/project-options')
 def get_project_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    conn = get_db()
     try:
         # Get project options using proj_short_name from PROJECT table
-        cursor.execute("SELECT proj_id, proj_short_name FROM PROJECT ORDER BY proj_short_name")
-        projects = cursor.fetchall()
-        # Return as list of dictionaries with both ID and name
-        project_options = [{"id": proj[0], "name": proj[1]} for proj in projects]
+        project_options = project_options_for(conn)
     except sqlite3.OperationalError as e:
         print(f"Error fetching project options: {e}")
+        skip_cache()
         project_options = []
     except Exception as e:
         print(f"Unexpected error in project options: {e}")
+        skip_cache()
         project_options = []
-    conn.close()
     return jsonify(project_options)
 
 @app.route('/api/typical-fs0d')
 def typical_fs0d():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id') # Re-added filter parameter
-
-    filters = []
-
-    # Apply base filter for Relationship_Status
-    filters.append("Relationship_Status = 'Incomplete'")
-
-    # Removed hardcoded Lag = 0, now dynamic filter is applied below
-
-    # Apply RelationshipType filter
-    if relationship_type and relationship_type != 'All':
-        filters.append(f"RelationshipType = '{relationship_type}'")
-    else:
-        filters.append("RelationshipType IN ('PR_FS', 'PR_FS1')") # Default behavior
-
-    # Apply Driving filter
-    if driving and driving != 'All':
-        filters.append(f"Driving = '{driving}'")
-
-    # Apply Lag filter
-    if lag and lag != 'All':
-        filters.append(f"Lag = {lag}")
-
-    # Apply FreeFloat filter
-    if free_float and free_float != 'All':
-        filters.append(f"FreeFloat = {free_float}")
-
-    # Project filter
-    if project_id and project_id != 'All':
-        filters.append(f"Project_ID = '{project_id}'") 
-
-    where_clause = " AND ".join(filters)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
-
-    query = f'''
-        SELECT 
-            Activity_ID, Activity_ID2, Activity_Name, Activity_Name2, RelationshipType, Lag, Driving, FreeFloat, Lead, ExcessiveLag, Relationship_Status
-        FROM ActivityRelationshipView
-        {where_clause}
-    '''
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    conn.close()
-    # Map to dicts for JSON
-    data = [
-        {
-            "Pred. ID": row[0],
-            "Succ. ID": row[1],
-            "Pred. Name": row[2],
-            "Succ. Name": row[3],
-            "Relationship type": row[4],
-            "Lag": row[5],
-            "Driving": row[6],
-            "FreeFloat": row[7],
-            "Lead": row[8],
-            "ExcessiveLag": row[9],
-            "Relationship_Status": row[10]
-        }
-        for row in rows
-    ]
-    return jsonify(data)
+    return rows_response('fs0d')
 
 @app.route('/api/finalactivitykpi')
 def get_final_activity_kpi():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id') # Re-added filter parameter
-
-    # Base filters for both Total and Remaining relationships
-    base_filters = []
-    
-    if relationship_type and relationship_type != 'All':
-        base_filters.append(f"RelationshipType = '{relationship_type}'")
-    else:
-        base_filters.append("RelationshipType IN ('PR_FS', 'PR_FS1')")
-
-    if driving and driving != 'All':
-        base_filters.append(f"Driving = '{driving}'")
-
-    if lag and lag != 'All':
-        base_filters.append(f"Lag = {lag}")
-
-    if free_float and free_float != 'All':
-        base_filters.append(f"FreeFloat = {free_float}")
-
-    # Project filter
-    if project_id and project_id != 'All':
-        base_filters.append(f"Project_ID = '{project_id}'")
-
-    # Total Relationships (all relationships matching base filters, regardless of status)
-    total_filters = base_filters.copy()
-    total_where_clause = " AND ".join(total_filters)
-    if total_where_clause:
-        total_where_clause = "WHERE " + total_where_clause
-
-    cursor.execute(f'SELECT COUNT(*) FROM ActivityRelationshipView {total_where_clause}')
-    total_relationships = cursor.fetchone()[0]
-
-    # Remaining Relationships (only incomplete relationships)
-    remaining_filters = base_filters.copy()
-    remaining_filters.append("Relationship_Status = 'Incomplete'")
-    remaining_where_clause = " AND ".join(remaining_filters)
-    if remaining_where_clause:
-        remaining_where_clause = "WHERE " + remaining_where_clause
-
-    cursor.execute(f'SELECT COUNT(*) FROM ActivityRelationshipView {remaining_where_clause}')
-    remaining_relationships = cursor.fetchone()[0]
-
-    # Lag Count (Lag > 0 and Relationship_Status = 'Incomplete' with current RelationshipType and Driving filters)
-    lag_count_filters = []
-    lag_count_filters.append("Lag > 0") # Specific for Lag_Count, not conflicting with general Lag filter
-    lag_count_filters.append("Relationship_Status = 'Incomplete'")
-
-    if relationship_type and relationship_type != 'All':
-        lag_count_filters.append(f"RelationshipType = '{relationship_type}'")
-    else:
-        lag_count_filters.append("RelationshipType IN ('PR_FS', 'PR_FS1')")
-
-    if driving and driving != 'All':
-        lag_count_filters.append(f"Driving = '{driving}'")
-
-    # For Lag Count, if a general 'Lag' filter is applied, it takes precedence over 'Lag > 0'
-    # This ensures that if user selects 'Lag = 0', Lag Count becomes 0 and is not affected by 'Lag > 0'
-    if lag and lag != 'All':
-        # If a specific lag is selected, override the 'Lag > 0' condition for lag_count_filters
-        # This handles cases where user selects Lag=0, and we shouldn't count any Lag > 0
-        if "Lag > 0" in lag_count_filters:
-            lag_count_filters.remove("Lag > 0")
-        lag_count_filters.append(f"Lag = {lag}")
-    
-    if free_float and free_float != 'All':
-        lag_count_filters.append(f"FreeFloat = {free_float}")
-
-    # Project filter
-    if project_id and project_id != 'All':
-        lag_count_filters.append(f"Project_ID = '{project_id}'")
-
-    lag_count_where_clause = " AND ".join(lag_count_filters)
-    if lag_count_where_clause:
-        lag_count_where_clause = "WHERE " + lag_count_where_clause
-
-    cursor.execute(f'SELECT COUNT(*) FROM ActivityRelationshipView {lag_count_where_clause}')
-    lag_count = cursor.fetchone()[0]
-
-    # Relationship (%)
-    relationship_percentage = 0
-    if remaining_relationships > 0:
-        relationship_percentage = (float(total_relationships) / remaining_relationships) * 100
-
-    conn.close()
-
-    kpi_data = {
-        "Total_Relationship_Count": total_relationships,
-        "Remaining_Relationship_Count": remaining_relationships,
-        "Lag_Count": lag_count,
-        "Relationship_Percentage": round(relationship_percentage, 2)
-    }
-    return jsonify(kpi_data)
+    return kpi_response('fs0d')
 
 @app.route('/api/relationship-type-counts')
 def get_relationship_type_counts():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type_param = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id') # Re-added filter parameter
-
-    filters = []
-    # Removed hardcoded Lag = 0 and Relationship_Status = 'Incomplete'
-    # Filters will now come from dynamic selection
-
-    # Apply RelationshipType filter based on selection
-    if relationship_type_param and relationship_type_param != 'All':
-        filters.append(f"RelationshipType = '{relationship_type_param}'")
-    else:
-        filters.append("RelationshipType IN ('PR_FS', 'PR_FS1')") # Default for the donut chart
-
-    if driving and driving != 'All':
-        filters.append(f"Driving = '{driving}'")
-
-    if lag and lag != 'All':
-        filters.append(f"Lag = {lag}")
-
-    if free_float and free_float != 'All':
-        filters.append(f"FreeFloat = {free_float}")
-
-    # Project filter
-    if project_id and project_id != 'All':
-        filters.append(f"Project_ID = '{project_id}'")
-
-    where_clause = " AND ".join(filters)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
-
-    # Query the database for actual relationship type counts
-    cursor.execute(f"SELECT RelationshipType, COUNT(*) FROM ActivityRelationshipView {where_clause} GROUP BY RelationshipType")
-    counts = {row[0]: row[1] for row in cursor.fetchall()}
-    conn.close()
-    return jsonify(counts)
+    return chart_response('fs0d')
 
 @app.route('/api/relationship-percentage-history')
 def get_relationship_percentage_history():
-    # This is dummy historical data, updated to reflect filtered data.
-    # For simplicity, we are not applying filters to this dummy data as historical filtering would require
-    # a more complex data structure and backend.
-    history_data = {
-        "labels": ["Mar 2019", "Aug 2019", "Dec 2019", "Apr 2020", "Aug 2020", "Dec 2020", "Apr 2021"],
-        "data": [80, 81, 90, 70, 85, 94, 90]
-    }
-    return jsonify(history_data)
+    return history_response('fs0d')
 
 @app.route('/api/typical-non-fs0d')
 def typical_non_fs0d():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id')
-
-    filters = [
-        "Relationship_Status = 'Incomplete'",
-        "(Lag IS NULL OR Lag != 0)"
-    ]
-    if relationship_type and relationship_type != 'All':
-        filters.append(f"RelationshipType = '{relationship_type}'")
-    else:
-        filters.append("RelationshipType NOT IN ('PR_FS', 'PR_FS1')")
-    if driving and driving != 'All':
-        filters.append(f"Driving = '{driving}'")
-    if lag and lag != 'All':
-        filters.append(f"Lag = {lag}")
-    if free_float and free_float != 'All':
-        filters.append(f"FreeFloat = {free_float}")
-    # Project filter
-    if project_id and project_id != 'All':
-        filters.append(f"Project_ID = '{project_id}'")
-    where_clause = " AND ".join(filters)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
-    query = f'''
-        SELECT 
-            Activity_ID, Activity_ID2, Activity_Name, Activity_Name2, RelationshipType, Lag, Driving, FreeFloat, Lead, ExcessiveLag, Relationship_Status
-        FROM ActivityRelationshipView
-        {where_clause}
-    '''
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    conn.close()
-    data = [
-        {
-            "Pred. ID": row[0],
-            "Succ. ID": row[1],
-            "Pred. Name": row[2],
-            "Succ. Name": row[3],
-            "Relationship type": row[4],
-            "Lag": row[5],
-            "Driving": row[6],
-            "FreeFloat": row[7],
-            "Lead": row[8],
-            "ExcessiveLag": row[9],
-            "Relationship_Status": row[10]
-        }
-        for row in rows
-    ]
-    return jsonify(data)
+    return rows_response('non-fs0d')
 
 @app.route('/api/nonfs-relationship-type-options')
 def get_nonfs_relationship_type_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT RelationshipType FROM ActivityRelationshipView WHERE RelationshipType NOT IN ('PR_FS', 'PR_FS1') ORDER BY RelationshipType")
-    types = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(types)
+    return options_response('non-fs0d', 'relationship_type')
 
 @app.route('/api/nonfs-lag-options')
 def get_nonfs_lag_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT Lag FROM ActivityRelationshipView WHERE RelationshipType NOT IN ('PR_FS', 'PR_FS1') AND (Lag IS NULL OR Lag != 0) ORDER BY CAST(Lag AS REAL)")
-    lags = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(lags)
+    return options_response('non-fs0d', 'lag')
 
 @app.route('/api/nonfs-free-float-options')
 def get_nonfs_free_float_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT FreeFloat FROM ActivityRelationshipView WHERE RelationshipType NOT IN ('PR_FS', 'PR_FS1') AND (Lag IS NULL OR Lag != 0) ORDER BY CAST(FreeFloat AS REAL)")
-    free_floats = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(free_floats)
+    return options_response('non-fs0d', 'free_float')
 
 @app.route('/api/nonfs-driving-options')
 def get_nonfs_driving_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT Driving FROM ActivityRelationshipView WHERE RelationshipType NOT IN ('PR_FS', 'PR_FS1') AND (Lag IS NULL OR Lag != 0) ORDER BY Driving")
-    drivings = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(drivings)
+    return options_response('non-fs0d', 'driving')
 
 @app.route('/api/non-fs0d-kpi')
 def non_fs0d_kpi():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id')
-
-    try:
-        # Build base filters for Non FS+0d page: ALL THREE FILTERS APPLIED CONSISTENTLY
-        # 1. RelationshipType NOT IN ('PR_FS', 'PR_FS1')
-        # 2. Lag IS NULL OR Lag != 0
-        # 3. Relationship_Status = 'Incomplete'
-        base_filters = [
-            "Relationship_Status = 'Incomplete'",
-            "(Lag IS NULL OR Lag != 0)"
-        ]
-        
-        if relationship_type and relationship_type != 'All':
-            base_filters.append(f"RelationshipType = '{relationship_type}'")
-        else:
-            base_filters.append("RelationshipType NOT IN ('PR_FS', 'PR_FS1')")
-        
-        if driving and driving != 'All':
-            base_filters.append(f"Driving = '{driving}'")
-        if lag and lag != 'All':
-            base_filters.append(f"Lag = {lag}")
-        if free_float and free_float != 'All':
-            base_filters.append(f"FreeFloat = {free_float}")
-        if project_id and project_id != 'All':
-            base_filters.append(f"Project_ID = '{project_id}'")
-        
-        base_where_clause = " AND ".join(base_filters)
-        if base_where_clause:
-            base_where_clause = "WHERE " + base_where_clause
-
-        # Total Relationships - relationships matching all three Non FS+0d filters
-        cursor.execute(f'''
-            SELECT COUNT(*) as Total_Relationship_Count
-            FROM ActivityRelationshipView
-            {base_where_clause}
-        ''')
-        total_relationships = cursor.fetchone()[0]
-
-        # Remaining Relationships - same as Total since we're already filtering by 'Incomplete'
-        remaining_relationships = total_relationships
-
-        # Lag Count - incomplete relationships with actual lag issues (Lag != 0 AND Lag IS NOT NULL)
-        lag_filters = base_filters.copy()
-        lag_filters.append("Lag != 0")
-        lag_filters.append("Lag IS NOT NULL")
-        
-        lag_where_clause = " AND ".join(lag_filters)
-        if lag_where_clause:
-            lag_where_clause = "WHERE " + lag_where_clause
-
-        cursor.execute(f'''
-            SELECT COUNT(*) as Lag_Count
-            FROM ActivityRelationshipView
-            {lag_where_clause}
-        ''')
-        lag_count = cursor.fetchone()[0]
-
-        # Calculate lag percentage
-        lag_percentage = (lag_count / remaining_relationships * 100) if remaining_relationships > 0 else 0
-
-        conn.close()
-        return jsonify({
-            'Total_Relationship_Count': int(total_relationships),
-            'Remaining_Relationship_Count': int(remaining_relationships), 
-            'Lag_Count': int(lag_count),
-            'Lag_Percentage': float(round(lag_percentage, 2))
-        })
-        
-    except Exception as e:
-        print(f"Error in non_fs0d_kpi: {e}")
-        conn.close()
-        return jsonify({
-            'Total_Relationship_Count': 0,
-            'Remaining_Relationship_Count': 0,
-            'Lag_Count': 0,
-            'Lag_Percentage': 0.0
-        })
+    return kpi_response('non-fs0d')
 
 @app.route('/api/leads')
 def leads():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id')
-
-    filters = [
-        "Relationship_Status = 'Incomplete'",
-        "Lag < 0"
-    ]
-    if relationship_type and relationship_type != 'All':
-        filters.append(f"RelationshipType = '{relationship_type}'")
-    if driving and driving != 'All':
-        filters.append(f"Driving = '{driving}'")
-    if lag and lag != 'All':
-        filters.append(f"Lag = {lag}")
-    if free_float and free_float != 'All':
-        filters.append(f"FreeFloat = {free_float}")
-    # Project filter
-    if project_id and project_id != 'All':
-        filters.append(f"Project_ID = '{project_id}'")
-    where_clause = " AND ".join(filters)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
-    query = f'''
-        SELECT 
-            Activity_ID, Activity_ID2, Activity_Name, Activity_Name2, RelationshipType, Lag, Driving, FreeFloat, Lead, ExcessiveLag, Relationship_Status
-        FROM ActivityRelationshipView
-        {where_clause}
-    '''
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    conn.close()
-    data = [
-        {
-            "Pred. ID": row[0],
-            "Succ. ID": row[1],
-            "Pred. Name": row[2],
-            "Succ. Name": row[3],
-            "Relationship type": row[4],
-            "Lag": row[5],
-            "Driving": row[6],
-            "FreeFloat": row[7],
-            "Lead": row[8],
-            "ExcessiveLag": row[9],
-            "Relationship_Status": row[10]
-        }
-        for row in rows
-    ]
-    return jsonify(data)
+    return rows_response('leads')
 
 @app.route('/api/leads-relationship-type-options')
 def get_leads_relationship_type_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT RelationshipType FROM ActivityRelationshipView WHERE Relationship_Status = 'Incomplete' AND Lag < 0 ORDER BY RelationshipType")
-    types = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(types)
+    return options_response('leads', 'relationship_type')
 
 @app.route('/api/leads-lag-options')
 def get_leads_lag_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT Lag FROM ActivityRelationshipView WHERE Relationship_Status = 'Incomplete' AND Lag < 0 ORDER BY CAST(Lag AS REAL)")
-    lags = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(lags)
+    return options_response('leads', 'lag')
 
 @app.route('/api/leads-free-float-options')
 def get_leads_free_float_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT FreeFloat FROM ActivityRelationshipView WHERE Relationship_Status = 'Incomplete' AND Lag < 0 ORDER BY CAST(FreeFloat AS REAL)")
-    free_floats = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(free_floats)
+    return options_response('leads', 'free_float')
 
 @app.route('/api/leads-driving-options')
 def get_leads_driving_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT Driving FROM ActivityRelationshipView WHERE Relationship_Status = 'Incomplete' AND Lag < 0 ORDER BY Driving")
-    drivings = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(drivings)
+    return options_response('leads', 'driving')
 
 @app.route('/api/leads-kpi')
 def leads_kpi():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id')
-
-    try:
-        # Always calculate from ActivityRelationshipView with proper Leads filters
-        # Build filters for leads calculation (Lag < 0 and Relationship_Status = 'Incomplete')
-        leads_filters = [
-            "Relationship_Status = 'Incomplete'",
-            "Lag < 0"
-        ]
-        if relationship_type and relationship_type != 'All':
-            leads_filters.append(f"RelationshipType = '{relationship_type}'")
-        if driving and driving != 'All':
-            leads_filters.append(f"Driving = '{driving}'")
-        if lag and lag != 'All':
-            leads_filters.append(f"Lag = {lag}")
-        if free_float and free_float != 'All':
-            leads_filters.append(f"FreeFloat = {free_float}")
-        if project_id and project_id != 'All':
-            leads_filters.append(f"Project_ID = '{project_id}'")
-        
-        leads_where_clause = " AND ".join(leads_filters)
-        if leads_where_clause:
-            leads_where_clause = "WHERE " + leads_where_clause
-
-        # Calculate leads count
-        cursor.execute(f'''
-            SELECT COUNT(*) as Leads_Count
-            FROM ActivityRelationshipView
-            {leads_where_clause}
-        ''')
-        leads_count = cursor.fetchone()[0]
-
-        # Build filters for remaining relationships calculation (only Relationship_Status = 'Incomplete')
-        remaining_filters = ["Relationship_Status = 'Incomplete'"]
-        if relationship_type and relationship_type != 'All':
-            remaining_filters.append(f"RelationshipType = '{relationship_type}'")
-        if driving and driving != 'All':
-            remaining_filters.append(f"Driving = '{driving}'")
-        if lag and lag != 'All':
-            remaining_filters.append(f"Lag = {lag}")
-        if free_float and free_float != 'All':
-            remaining_filters.append(f"FreeFloat = {free_float}")
-        if project_id and project_id != 'All':
-            remaining_filters.append(f"Project_ID = '{project_id}'")
-        
-        remaining_where_clause = " AND ".join(remaining_filters)
-        if remaining_where_clause:
-            remaining_where_clause = "WHERE " + remaining_where_clause
-
-        # Calculate remaining relationships count
-        cursor.execute(f'''
-            SELECT COUNT(*) as Remaining_Relationship_Count
-            FROM ActivityRelationshipView
-            {remaining_where_clause}
-        ''')
-        remaining_count = cursor.fetchone()[0]
-
-        # Calculate total relationships for the project (for percentage calculation)
-        total_filters = []
-        if project_id and project_id != 'All':
-            total_filters.append(f"Project_ID = '{project_id}'")
-        
-        total_where_clause = ""
-        if total_filters:
-            total_where_clause = "WHERE " + " AND ".join(total_filters)
-
-        cursor.execute(f'''
-            SELECT COUNT(*) as Total_Relationship_Count
-            FROM ActivityRelationshipView
-            {total_where_clause}
-        ''')
-        total_count = cursor.fetchone()[0]
-
-        # Calculate lead percentage
-        lead_percentage = 0
-        if remaining_count > 0:
-            lead_percentage = round((leads_count * 100.0) / remaining_count, 2)
-
-        kpi_data = {
-            "Total_Relationship_Count": int(total_count) if total_count is not None else 0,
-            "Remaining_Relationship_Count": int(remaining_count) if remaining_count is not None else 0,
-            "Leads_Count": int(leads_count) if leads_count is not None else 0,
-            "Lead_Percentage": float(lead_percentage) if lead_percentage is not None else 0.0
-        }
-    except Exception as e:
-        print(f"Error in leads-kpi: {e}")
-        kpi_data = {
-            "Total_Relationship_Count": 0,
-            "Remaining_Relationship_Count": 0,
-            "Leads_Count": 0,
-            "Lead_Percentage": 0
-        }
-    finally:
-        conn.close()
-    
-    return jsonify(kpi_data)
+    return kpi_response('leads')
 
 @app.route('/api/leads-chart-data')
 def leads_chart_data():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id')
-
-    filters = [
-        "Relationship_Status = 'Incomplete'",
-        "Lag < 0"
-    ]
-    if relationship_type and relationship_type != 'All':
-        filters.append(f"RelationshipType = '{relationship_type}'")
-    if driving and driving != 'All':
-        filters.append(f"Driving = '{driving}'")
-    if lag and lag != 'All':
-        filters.append(f"Lag = {lag}")
-    if free_float and free_float != 'All':
-        filters.append(f"FreeFloat = {free_float}")
-    # Project filter
-    if project_id and project_id != 'All':
-        filters.append(f"Project_ID = '{project_id}'")
-    where_clause = " AND ".join(filters)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
-
-    # Get stacked column chart data (Lag vs Count by Relationship Type)
-    cursor.execute(f'''
-        SELECT 
-            Lag,
-            RelationshipType,
-            COUNT(*) as Count
-        FROM ActivityRelationshipView
-        {where_clause}
-        GROUP BY Lag, RelationshipType
-        ORDER BY Lag, RelationshipType
-    ''')
-    
-    chart_data = []
-    for row in cursor.fetchall():
-        chart_data.append({
-            "lag": row[0],
-            "relationship_type": row[1],
-            "count": row[2]
-        })
-    
-    conn.close()
-    return jsonify(chart_data)
+    return chart_response('leads')
 
 @app.route('/api/leads-percentage-history')
 def leads_percentage_history():
-    # This is dummy historical data for leads percentage
-    # In a real implementation, this would query historical data from the database
-    return jsonify([
-        {"month": "Jan", "year": 2024, "percentage": 8.5},
-        {"month": "Feb", "year": 2024, "percentage": 7.2},
-        {"month": "Mar", "year": 2024, "percentage": 6.8},
-        {"month": "Apr", "year": 2024, "percentage": 5.9},
-        {"month": "May", "year": 2024, "percentage": 4.3},
-        {"month": "Jun", "year": 2024, "percentage": 3.7}
-    ])
+    return history_response('leads')
 
 # === LAGS METRIC ENDPOINTS ===
 
 @app.route('/api/lags')
 def lags():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id')
-
-    filters = []
-
-    # Apply base filters for Lags metric
-    filters.append("Relationship_Status = 'Incomplete'")
-    filters.append("Lag != 0")  # Lag is not 0
-    filters.append("Lag IS NOT NULL")  # Lag is not blank
-
-    # Apply RelationshipType filter
-    if relationship_type and relationship_type != 'All':
-        filters.append(f"RelationshipType = '{relationship_type}'")
-
-    # Apply Driving filter
-    if driving and driving != 'All':
-        filters.append(f"Driving = '{driving}'")
-
-    # Apply Lag filter
-    if lag and lag != 'All':
-        filters.append(f"Lag = {lag}")
-
-    # Apply FreeFloat filter
-    if free_float and free_float != 'All':
-        filters.append(f"FreeFloat = {free_float}")
-
-    # Apply Project filter
-    if project_id and project_id != 'All':
-        filters.append(f"Project_ID = '{project_id}'")
-
-    where_clause = " AND ".join(filters)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
-
-    query = f'''
-        SELECT 
-            Activity_ID, Activity_ID2, Activity_Name, Activity_Name2, RelationshipType, Lag, Driving, FreeFloat, Lead, ExcessiveLag, Relationship_Status
-        FROM ActivityRelationshipView
-        {where_clause}
-    '''
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    conn.close()
-    
-    # Map to dicts for JSON
-    data = [
-        {
-            "Pred. ID": row[0],
-            "Succ. ID": row[1],
-            "Pred. Name": row[2],
-            "Succ. Name": row[3],
-            "Relationship type": row[4],
-            "Lag": row[5],
-            "Driving": row[6],
-            "FreeFloat": row[7],
-            "Lead": row[8],
-            "ExcessiveLag": row[9],
-            "Relationship_Status": row[10]
-        }
-        for row in rows
-    ]
-    return jsonify(data)
+    return rows_response('lags')
 
 @app.route('/api/lags-relationship-type-options')
 def get_lags_relationship_type_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT RelationshipType FROM ActivityRelationshipView WHERE Relationship_Status = 'Incomplete' AND Lag != 0 AND Lag IS NOT NULL ORDER BY RelationshipType")
-    relationship_types = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(relationship_types)
+    return options_response('lags', 'relationship_type')
 
 @app.route('/api/lags-lag-options')
 def get_lags_lag_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT Lag FROM ActivityRelationshipView WHERE Relationship_Status = 'Incomplete' AND Lag != 0 AND Lag IS NOT NULL ORDER BY CAST(Lag AS REAL)")
-    lags = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(lags)
+    return options_response('lags', 'lag')
 
 @app.route('/api/lags-free-float-options')
 def get_lags_free_float_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT FreeFloat FROM ActivityRelationshipView WHERE Relationship_Status = 'Incomplete' AND Lag != 0 AND Lag IS NOT NULL ORDER BY CAST(FreeFloat AS REAL)")
-    free_floats = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(free_floats)
+    return options_response('lags', 'free_float')
 
 @app.route('/api/lags-driving-options')
 def get_lags_driving_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT Driving FROM ActivityRelationshipView WHERE Relationship_Status = 'Incomplete' AND Lag != 0 AND Lag IS NOT NULL ORDER BY Driving")
-    driving_options = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(driving_options)
+    return options_response('lags', 'driving')
 
 @app.route('/api/lags-kpi')
 def lags_kpi():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id')
-
-    try:
-        # Always calculate from ActivityRelationshipView with proper Lags filters
-        # Build filters for lags calculation (Lag != 0, Lag IS NOT NULL, and Relationship_Status = 'Incomplete')
-        lags_filters = [
-            "Relationship_Status = 'Incomplete'",
-            "Lag != 0",
-            "Lag IS NOT NULL"
-        ]
-        if relationship_type and relationship_type != 'All':
-            lags_filters.append(f"RelationshipType = '{relationship_type}'")
-        if driving and driving != 'All':
-            lags_filters.append(f"Driving = '{driving}'")
-        if lag and lag != 'All':
-            lags_filters.append(f"Lag = {lag}")
-        if free_float and free_float != 'All':
-            lags_filters.append(f"FreeFloat = {free_float}")
-        if project_id and project_id != 'All':
-            lags_filters.append(f"Project_ID = '{project_id}'")
-        
-        lags_where_clause = " AND ".join(lags_filters)
-        if lags_where_clause:
-            lags_where_clause = "WHERE " + lags_where_clause
-
-        # Calculate lags count
-        cursor.execute(f'''
-            SELECT COUNT(*) as Lag_Count
-            FROM ActivityRelationshipView
-            {lags_where_clause}
-        ''')
-        lag_count = cursor.fetchone()[0]
-
-        # Build filters for remaining relationships calculation (only Relationship_Status = 'Incomplete')
-        remaining_filters = ["Relationship_Status = 'Incomplete'"]
-        if relationship_type and relationship_type != 'All':
-            remaining_filters.append(f"RelationshipType = '{relationship_type}'")
-        if driving and driving != 'All':
-            remaining_filters.append(f"Driving = '{driving}'")
-        if lag and lag != 'All':
-            remaining_filters.append(f"Lag = {lag}")
-        if free_float and free_float != 'All':
-            remaining_filters.append(f"FreeFloat = {free_float}")
-        if project_id and project_id != 'All':
-            remaining_filters.append(f"Project_ID = '{project_id}'")
-        
-        remaining_where_clause = " AND ".join(remaining_filters)
-        if remaining_where_clause:
-            remaining_where_clause = "WHERE " + remaining_where_clause
-
-        # Calculate remaining relationships count
-        cursor.execute(f'''
-            SELECT COUNT(*) as Remaining_Relationships
-            FROM ActivityRelationshipView
-            {remaining_where_clause}
-        ''')
-        remaining_relationships = cursor.fetchone()[0]
-
-        # Calculate lag percentage
-        lag_percentage = 0
-        if remaining_relationships > 0:
-            lag_percentage = round((lag_count * 100.0) / remaining_relationships, 1)
-
-        kpi_data = {
-            "Lag_Count": int(lag_count) if lag_count is not None else 0,
-            "Remaining_Relationships": int(remaining_relationships) if remaining_relationships is not None else 0,
-            "Lag_Percentage": float(lag_percentage) if lag_percentage is not None else 0.0
-        }
-    except Exception as e:
-        print(f"Error in lags-kpi: {e}")
-        kpi_data = {
-            "Lag_Count": 0,
-            "Remaining_Relationships": 0,
-            "Lag_Percentage": 0.0
-        }
-    finally:
-        conn.close()
-    
-    return jsonify(kpi_data)
+    return kpi_response('lags')
 
 @app.route('/api/lags-chart-data')
 def lags_chart_data():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id')
-
-    filters = []
-    filters.append("Relationship_Status = 'Incomplete'")
-    filters.append("Lag != 0")
-    filters.append("Lag IS NOT NULL")
-
-    if relationship_type and relationship_type != 'All':
-        filters.append(f"RelationshipType = '{relationship_type}'")
-    if driving and driving != 'All':
-        filters.append(f"Driving = '{driving}'")
-    if lag and lag != 'All':
-        filters.append(f"Lag = {lag}")
-    if free_float and free_float != 'All':
-        filters.append(f"FreeFloat = {free_float}")
-    if project_id and project_id != 'All':
-        filters.append(f"Project_ID = '{project_id}'")
-
-    where_clause = " AND ".join(filters)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
-
-    query = f'''
-        SELECT Lag, RelationshipType, COUNT(*) as count
-        FROM ActivityRelationshipView
-        {where_clause}
-        GROUP BY Lag, RelationshipType
-        ORDER BY CAST(Lag AS REAL), RelationshipType
-    '''
-    
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    conn.close()
-
-    # Structure data for stacked column chart
-    chart_data = {}
-    for row in rows:
-        lag_value = str(row[0])
-        relationship_type = row[1]
-        count = row[2]
-        
-        if lag_value not in chart_data:
-            chart_data[lag_value] = {}
-        chart_data[lag_value][relationship_type] = count
-
-    return jsonify(chart_data)
+    return chart_response('lags')
 
 @app.route('/api/lags-percentage-history')
 def lags_percentage_history():
-    # This is dummy historical data for lags percentage
-    # In a real implementation, this would query historical data from the database
-    return jsonify([
-        {"month": "Jan", "year": 2024, "percentage": 12.3},
-        {"month": "Feb", "year": 2024, "percentage": 11.8},
-        {"month": "Mar", "year": 2024, "percentage": 10.5},
-        {"month": "Apr", "year": 2024, "percentage": 9.7},
-        {"month": "May", "year": 2024, "percentage": 8.9},
-        {"month": "Jun", "year": 2024, "percentage": 8.2}
-    ])
+    return history_response('lags')
 
 # === EXCESSIVE LAGS METRIC ENDPOINTS ===
 
 @app.route('/api/excessive-lags')
 def excessive_lags():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id')
-
-    filters = []
-
-    # Apply base filters for Excessive Lags metric
-    filters.append("Relationship_Status = 'Incomplete'")
-    filters.append("ExcessiveLag = 'Excessive Lag'")  # Filter for excessive lag
-
-    # Apply RelationshipType filter
-    if relationship_type and relationship_type != 'All':
-        filters.append(f"RelationshipType = '{relationship_type}'")
-
-    # Apply Driving filter
-    if driving and driving != 'All':
-        filters.append(f"Driving = '{driving}'")
-
-    # Apply Lag filter
-    if lag and lag != 'All':
-        filters.append(f"Lag = {lag}")
-
-    # Apply FreeFloat filter
-    if free_float and free_float != 'All':
-        filters.append(f"FreeFloat = {free_float}")
-
-    # Apply Project filter
-    if project_id and project_id != 'All':
-        filters.append(f"Project_ID = '{project_id}'")
-
-    where_clause = " AND ".join(filters)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
-
-    query = f'''
-        SELECT 
-            Activity_ID, Activity_ID2, Activity_Name, Activity_Name2, RelationshipType, Lag, Driving, FreeFloat, Lead, ExcessiveLag, Relationship_Status
-        FROM ActivityRelationshipView
-        {where_clause}
-    '''
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    conn.close()
-    
-    # Map to dicts for JSON
-    data = [
-        {
-            "Pred. ID": row[0],
-            "Succ. ID": row[1],
-            "Pred. Name": row[2],
-            "Succ. Name": row[3],
-            "Relationship type": row[4],
-            "Lag": row[5],
-            "Driving": row[6],
-            "FreeFloat": row[7],
-            "Lead": row[8],
-            "ExcessiveLag": row[9],
-            "Relationship_Status": row[10]
-        }
-        for row in rows
-    ]
-    return jsonify(data)
+    return rows_response('excessive-lags')
 
 @app.route('/api/excessive-lags-relationship-type-options')
 def get_excessive_lags_relationship_type_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT RelationshipType FROM ActivityRelationshipView WHERE Relationship_Status = 'Incomplete' AND ExcessiveLag = 'Excessive Lag' ORDER BY RelationshipType")
-    relationship_types = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(relationship_types)
+    return options_response('excessive-lags', 'relationship_type')
 
 @app.route('/api/excessive-lags-lag-options')
 def get_excessive_lags_lag_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT Lag FROM ActivityRelationshipView WHERE Relationship_Status = 'Incomplete' AND ExcessiveLag = 'Excessive Lag' ORDER BY CAST(Lag AS REAL)")
-    lags = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(lags)
+    return options_response('excessive-lags', 'lag')
 
 @app.route('/api/excessive-lags-free-float-options')
 def get_excessive_lags_free_float_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT FreeFloat FROM ActivityRelationshipView WHERE Relationship_Status = 'Incomplete' AND ExcessiveLag = 'Excessive Lag' ORDER BY CAST(FreeFloat AS REAL)")
-    free_floats = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(free_floats)
+    return options_response('excessive-lags', 'free_float')
 
 @app.route('/api/excessive-lags-driving-options')
 def get_excessive_lags_driving_options():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT Driving FROM ActivityRelationshipView WHERE Relationship_Status = 'Incomplete' AND ExcessiveLag = 'Excessive Lag' ORDER BY Driving")
-    driving_options = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(driving_options)
+    return options_response('excessive-lags', 'driving')
 
 @app.route('/api/excessive-lags-kpi')
 def excessive_lags_kpi():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id')
-
-    # Always calculate from ActivityRelationshipView with proper filtering
-    filters = []
-    filters.append("Relationship_Status = 'Incomplete'")
-    filters.append("ExcessiveLag = 'Excessive Lag'")
-
-    if relationship_type and relationship_type != 'All':
-        filters.append(f"RelationshipType = '{relationship_type}'")
-    if driving and driving != 'All':
-        filters.append(f"Driving = '{driving}'")
-    if lag and lag != 'All':
-        filters.append(f"Lag = {lag}")
-    if free_float and free_float != 'All':
-        filters.append(f"FreeFloat = {free_float}")
-    if project_id and project_id != 'All':
-        filters.append(f"Project_ID = '{project_id}'")
-
-    where_clause = " AND ".join(filters)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
-
-    # Excessive Lag Count
-    cursor.execute(f'SELECT COUNT(*) FROM ActivityRelationshipView {where_clause}')
-    lag_count = cursor.fetchone()[0]
-
-    # Total relationships for percentage calculation (remaining relationships with same filters except ExcessiveLag)
-    total_filters = ["Relationship_Status = 'Incomplete'"]
-    if relationship_type and relationship_type != 'All':
-        total_filters.append(f"RelationshipType = '{relationship_type}'")
-    if driving and driving != 'All':
-        total_filters.append(f"Driving = '{driving}'")
-    if free_float and free_float != 'All':
-        total_filters.append(f"FreeFloat = {free_float}")
-    if project_id and project_id != 'All':
-        total_filters.append(f"Project_ID = '{project_id}'")
-
-    total_where_clause = " AND ".join(total_filters)
-    if total_where_clause:
-        total_where_clause = "WHERE " + total_where_clause
-
-    cursor.execute(f'SELECT COUNT(*) FROM ActivityRelationshipView {total_where_clause}')
-    total_relationships = cursor.fetchone()[0]
-
-    # Calculate percentage
-    lag_percentage = (lag_count / total_relationships * 100) if total_relationships > 0 else 0
-
-    conn.close()
-
-    return jsonify({
-        "Lag_Count": int(lag_count),
-        "Remaining_Relationships": int(total_relationships),
-        "Lag_Percentage": float(round(lag_percentage, 1))
-    })
+    return kpi_response('excessive-lags')
 
 @app.route('/api/excessive-lags-chart-data')
 def excessive_lags_chart_data():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    relationship_type = request.args.get('relationship_type')
-    driving = request.args.get('driving')
-    lag = request.args.get('lag')
-    free_float = request.args.get('free_float')
-    project_id = request.args.get('project_id')
-
-    filters = []
-    filters.append("Relationship_Status = 'Incomplete'")
-    filters.append("ExcessiveLag = 'Excessive Lag'")
-
-    if relationship_type and relationship_type != 'All':
-        filters.append(f"RelationshipType = '{relationship_type}'")
-    if driving and driving != 'All':
-        filters.append(f"Driving = '{driving}'")
-    if lag and lag != 'All':
-        filters.append(f"Lag = {lag}")
-    if free_float and free_float != 'All':
-        filters.append(f"FreeFloat = {free_float}")
-    if project_id and project_id != 'All':
-        filters.append(f"Project_ID = '{project_id}'")
-
-    where_clause = " AND ".join(filters)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
-
-    query = f'''
-        SELECT Lag, RelationshipType, COUNT(*) as count
-        FROM ActivityRelationshipView
-        {where_clause}
-        GROUP BY Lag, RelationshipType
-        ORDER BY CAST(Lag AS REAL), RelationshipType
-    '''
-    
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    conn.close()
-
-    # Structure data for stacked column chart
-    chart_data = {}
-    for row in rows:
-        lag_value = str(row[0])
-        relationship_type = row[1]
-        count = row[2]
-        
-        if lag_value not in chart_data:
-            chart_data[lag_value] = {}
-        chart_data[lag_value][relationship_type] = count
-
-    return jsonify(chart_data)
+    return chart_response('excessive-lags')
 
 @app.route('/api/excessive-lags-percentage-history')
 def excessive_lags_percentage_history():
-    # This is dummy historical data for excessive lags percentage
-    # In a real implementation, this would query historical data from the database
-    return jsonify([
-        {"month": "Jan", "year": 2024, "percentage": 15.2},
-        {"month": "Feb", "year": 2024, "percentage": 14.6},
-        {"month": "Mar", "year": 2024, "percentage": 13.1},
-        {"month": "Apr", "year": 2024, "percentage": 12.4},
-        {"month": "May", "year": 2024, "percentage": 11.7},
-        {"month": "Jun", "year": 2024, "percentage": 10.9}
-    ])
+    return history_response('excessive-lags')
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000) 
\ No newline at end of file
+    # Development server only; serve.py is the production entry point
+    app.run(debug=os.environ.get('METRICS_DEBUG', '0') == '1', port=int(os.environ.get('METRICS_PORT', 5000))) 
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""In-memory NumPy engine for KPIs, charts and table rows.
+
+Loads the relationship table once into column arrays and answers the same
+registry predicates with boolean masks instead of SQL scans.  Every column is
+stored as integer codes into a dictionary of its distinct values (so rows and
+group keys come back as the exact values SQLite returns), and a predicate is
+evaluated once per distinct value and then gathered through the codes.  Lag
+and FreeFloat are also kept as float64 arrays (NaN for blank or NULL), so
+their comparisons run as one vectorized NumPy expression.
+
+Select it with METRICS_ENGINE=numpy.  The functions mirror kpi_engine /
+row_queries and take the same (conn, source, ...) arguments; the connection
+is only used to (re)load the snapshot when the database version changes.
+Predicate semantics and snapshot reloading live in snapshot_store.py.
+"""
+import numpy as np
+
+from kpi_engine import chart_columns, format_kpis, shape_chart
+from metric_registry import (
+    FAMILIES, ROW_COLUMNS, chart_predicates, kpi_predicates, row_predicates,
+)
+from row_queries import sort_column
+from materialize import NUMERIC_COLUMNS
+from snapshot_store import ROW_LOAD_COLUMNS, SnapshotStore, as_number, is_blank, sqlite_rank, value_matches
+
+_NUMERIC_COMPARE = {
+    '=': np.equal,
+    '!=': np.not_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+}
+
+
+class ColumnSnapshot:
+    """Column arrays of one database version, built from batches of rows."""
+
+    def __init__(self, batches):
+        codes = {column: {} for column in ROW_LOAD_COLUMNS}
+        parts = {column: [] for column in ROW_LOAD_COLUMNS}
+        self.length = 0
+        for rows in batches:
+            # Each batch is encoded and dropped; only the int32 codes are kept
+            for index, column in enumerate(ROW_LOAD_COLUMNS):
+                dictionary = codes[column]
+                parts[column].append(np.fromiter(
+                    (dictionary.setdefault(row[index], len(dictionary)) for row in rows),
+                    dtype=np.int32, count=len(rows),
+                ))
+            self.length += len(rows)
+        self.codes = {}
+        for column in ROW_LOAD_COLUMNS:
+            chunks = parts.pop(column)
+            self.codes[column] = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int32)
+        self.dictionaries = {column: list(codes[column]) for column in ROW_LOAD_COLUMNS}
+        self.numbers = {}
+        self.blanks = {}
+        for column in NUMERIC_COLUMNS:
+            dictionary = self.dictionaries[column]
+            blank = np.array([is_blank(stored) for stored in dictionary] or [True])
+            numbers = np.array(
+                [np.nan if is_blank(stored) or as_number(stored) is None else as_number(stored)
+                 for stored in dictionary] or [np.nan],
+                dtype=np.float64,
+            )
+            self.blanks[column] = blank[self.codes[column]]
+            self.numbers[column] = numbers[self.codes[column]]
+
+    # --- predicates -------------------------------------------------------
+
+    def mask(self, predicate):
+        """Rows passing predicate: each distinct value is tested once, then gathered by code."""
+        column, op, value = predicate
+        if op == 'or':
+            result = np.zeros(self.length, dtype=bool)
+            for alternative in value:
+                result |= self.mask(alternative)
+            return result
+        if column in self.numbers:
+            return self._numeric_mask(column, op, value)
+        dictionary = self.dictionaries[column]
+        passing = np.array([value_matches(column, op, value, stored) for stored in dictionary] or [False])
+        return passing[self.codes[column]] if self.length else np.zeros(0, dtype=bool)
+
+    def _numeric_mask(self, column, op, value):
+        # Same semantics as snapshot_store.value_matches: blank is NULL, text that
+        # isn't a number (NaN here) is only != a number, and text operands sort after numbers
+        blank = self.blanks[column]
+        if op == 'is null':
+            return blank.copy()
+        if op == 'is not null':
+            return ~blank
+        if op in ('in', 'not in'):
+            found = np.zeros(self.length, dtype=bool)
+            for number in (as_number(v) for v in value):
+                if number is not None:
+                    found |= self.numbers[column] == number
+            return found if op == 'in' else ~found & ~blank
+        number = as_number(value)
+        if number is None:
+            return ~blank if op in ('!=', '<', '<=') else np.zeros(self.length, dtype=bool)
+        return _NUMERIC_COMPARE[op](self.numbers[column], number) & ~blank
+
+    def where(self, predicates):
+        result = np.ones(self.length, dtype=bool)
+        for predicate in predicates:
+            result &= self.mask(predicate)
+        return result
+
+    # --- queries ----------------------------------------------------------
+
+    def count_many(self, counters):
+        masks = {}
+        counts = {}
+        for name, predicates in counters.items():
+            key = tuple(predicates)
+            if key not in masks:
+                masks[key] = int(np.count_nonzero(self.where(predicates)))
+            counts[name] = masks[key]
+        return counts
+
+    def group_counts(self, predicates, columns):
+        """[(value, ..., count)] like kpi_engine.group_counts, via bincount over combined codes."""
+        selected = self.where(predicates)
+        combined = np.zeros(int(np.count_nonzero(selected)), dtype=np.int64)
+        sizes = []
+        for column in columns:
+            size = len(self.dictionaries[column])
+            combined = combined * size + self.codes[column][selected]
+            sizes.append(size)
+        counts = np.bincount(combined, minlength=0)
+        groups = []
+        for key in np.flatnonzero(counts):
+            values = []
+            remainder = int(key)
+            for column, size in reversed(list(zip(columns, sizes))):
+                remainder, code = divmod(remainder, size)
+                values.append(self.dictionaries[column][code])
+            groups.append(tuple(reversed(values)) + (int(counts[key]),))
+        return groups
+
+    def _ranks(self, column):
+        dictionary = self.dictionaries[column]
+        order = sorted(range(len(dictionary)), key=lambda code: sqlite_rank(dictionary[code]))
+        ranks = np.empty(len(dictionary), dtype=np.int64)
+        ranks[order] = np.arange(len(dictionary))
+        return ranks[self.codes[column]]
+
+    def select_rows(self, predicates, column=None, descending=False):
+        """Row tuples (ROW_COLUMNS order), optionally sorted with load order as tie-break."""
+        positions = np.flatnonzero(self.where(predicates))
+        if column is not None:
+            ranks = self._ranks(column)[positions]
+            if descending:
+                # Both keys descending, like ORDER BY column DESC, <key> DESC
+                positions = positions[np.lexsort((-positions, -ranks))]
+            else:
+                positions = positions[np.lexsort((positions, ranks))]
+        decoded = [
+            [self.dictionaries[name][code] for code in self.codes[name][positions].tolist()]
+            for name, _ in ROW_COLUMNS
+        ]
+        return list(zip(*decoded))
+
+
+snapshots = SnapshotStore(ColumnSnapshot, ROW_LOAD_COLUMNS)
+
+
+def family_kpis(conn, source, family, filters):
+    counts = snapshots.get(conn, source).count_many(kpi_predicates(family, filters))
+    return format_kpis(family, counts)
+
+
+def kpi_summary(conn, source, filters):
+    snapshot = snapshots.get(conn, source)
+    return {
+        family: format_kpis(family, snapshot.count_many(kpi_predicates(family, filters)))
+        for family in FAMILIES
+    }
+
+
+def chart_data(conn, source, family, filters):
+    shape = FAMILIES[family]['chart']['shape']
+    groups = snapshots.get(conn, source).group_counts(
+        chart_predicates(family, filters), chart_columns(shape)
+    )
+    return shape_chart(shape, groups)
+
+
+def fetch_rows(conn, source, family, filters, sort=None, descending=False):
+    return snapshots.get(conn, source).select_rows(
+        row_predicates(family, filters), sort_column(sort), descending
+    )
@@ -0,0 +1,427 @@
+"""Per-request phase timings, as Server-Timing headers and Prometheus metrics.
+
+Every request is split into four phases:
+
+  connect   checking out the pooled connection (get_db)
+  sql       executing statements and fetching their rows (TimedConnection)
+  jsonify   serializing the response body (TimedJSONProvider)
+  build     the rest of the route: dicts, encoders, the in-memory engines
+
+The phases of a request are collected on a RequestTimer held per thread, so
+the query modules need no changes: the pool opens TimedConnections, whose
+cursors add their execute/fetch time and row counts to the current timer.
+Rows read by iterating a cursor directly are counted as build time.  The same
+cursors feed the slow-query log (slow_queries.py).
+
+The breakdown goes into each response's Server-Timing header (shown under
+Timing in the browser's network panel) and is aggregated per route into
+latency, row count and payload size histograms, served in the Prometheus text
+format by /metrics.  Streamed responses (ndjson, exports) are recorded when
+the last chunk has been sent.
+
+With several worker processes, set METRICS_STATS_DIR to a directory shared by
+them: each process writes its totals there at most FLUSH_INTERVAL seconds
+after a request and /metrics adds up the files of the processes still running.
+A worker removes its file when it exits, and /metrics removes the files of
+workers that died without doing so (on POSIX), so the totals cover the live
+workers only and drop when one is recycled, like any restarted exporter.
+"""
+import atexit
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask.json.provider import DefaultJSONProvider
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+BYTE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 104857600)
+# Seconds a process's totals in the stats directory may lag behind
+FLUSH_INTERVAL = 1.0
+
+# name: (help, buckets)
+HISTOGRAMS = {
+    'metrics_api_request_duration_seconds': ("Request latency, through the last byte of the body", LATENCY_BUCKETS),
+    'metrics_api_phase_duration_seconds': ("Time per request phase (connect, sql, build, jsonify)", LATENCY_BUCKETS),
+    'metrics_api_response_rows': ("Rows fetched from SQLite per request", ROW_BUCKETS),
+    'metrics_api_response_bytes': ("Response body size in bytes", BYTE_BUCKETS),
+}
+# name: help
+COUNTERS = {
+    'metrics_api_requests_total': "Requests by route and status code",
+    'metrics_api_sql_statements_total': "SQL statements executed",
+}
+
+_local = threading.local()
+
+
+class RequestTimer:
+    """Phase durations (seconds) and SQL totals of one request."""
+
+    def __init__(self, request=None):
+        self.request = request
+        self.started = time.perf_counter()
+        self.connect = 0.0
+        self.sql = 0.0
+        self.jsonify = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.cache_hit = False
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def phases(self, total):
+        """{phase: seconds}; build is whatever the other phases don't account for."""
+        build = max(0.0, total - self.connect - self.sql - self.jsonify)
+        return {'connect': self.connect, 'sql': self.sql, 'build': build, 'jsonify': self.jsonify}
+
+    def server_timing(self):
+        """Server-Timing header value for the time up to now."""
+        total = self.elapsed()
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases(total).items()]
+        parts[1] += f';desc="{self.statements} statements, {self.rows} rows"'
+        if self.cache_hit:
+            parts.append('cache;desc="hit"')
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ', '.join(parts)
+
+
+def start(request=None):
+    """Begin timing a request (request: its path and query, for the slow-query log)."""
+    timer = _local.timer = RequestTimer(request)
+    return timer
+
+
+def current():
+    return getattr(_local, 'timer', None)
+
+
+def stop():
+    _local.timer = None
+
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the block to the current request's phase.
+
+    Statements run inside the block (e.g. the pool's health check while
+    connecting) count towards that phase only, not towards sql as well.
+    """
+    timer = current()
+    if timer is None:
+        yield
+        return
+    _local.timer = None
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(timer, name, getattr(timer, name) + time.perf_counter() - started)
+        _local.timer = timer
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that adds its statement and fetch time to the current request.
+
+    It also keeps the time and rows of the statement it is reading, and hands
+    it to TimedConnection.slow_log once the statement is done (fetchone or
+    fetchall, fetchmany running dry, close, or the next execute) if it took
+    longer than the log's threshold.
+    """
+
+    _statement = None
+    _elapsed = 0.0
+    _rows = 0
+
+    def _timed(self, call, *args):
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._elapsed += elapsed
+            timer = current()
+            if timer is not None:
+                timer.sql += elapsed
+
+    def _begin(self, sql, parameters):
+        self._finish()
+        self._statement, self._elapsed, self._rows = (sql, parameters), 0.0, 0
+        timer = current()
+        if timer is not None:
+            timer.statements += 1
+
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        slow_log = TimedConnection.slow_log
+        if statement is None or slow_log is None or self._elapsed < slow_log.threshold:
+            return
+        timer = current()
+        slow_log.record(self.connection, *statement, self._elapsed, self._rows,
+                        timer.request if timer is not None else None)
+
+    def _fetch(self, fetch, count, done, *args):
+        result = self._timed(fetch, *args)
+        rows = count(result)
+        self._rows += rows
+        timer = current()
+        if timer is not None:
+            timer.rows += rows
+        if done(result):
+            self._finish()
+        return result
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql, ())
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        # Only used for single-row statements (counts), so one row completes it
+        return self._fetch(super().fetchone, lambda row: row is not None, lambda row: True)
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        return self._fetch(super().fetchmany, len, lambda rows: len(rows) < size, size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall, len, lambda rows: True)
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection factory whose cursors are TimedCursors (for ConnectionPool)."""
+
+    # SlowQueryLog (slow_queries.py) receiving statements over its threshold, or None
+    slow_log = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # The built-in shortcuts would bypass TimedCursor.execute
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that records jsonify() time on the current request."""
+
+    def response(self, *args, **kwargs):
+        with phase('jsonify'):
+            return super().response(*args, **kwargs)
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        return True  # os.kill(pid, 0) would terminate it; rely on the exit hook
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # exists, owned by another user
+    return True
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _bucket_index(buckets, value):
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            return index
+    return len(buckets)
+
+
+class RequestMetrics:
+    """Per-route histograms and counters, rendered in the Prometheus text format."""
+
+    def __init__(self, stats_dir=None):
+        self.stats_dir = stats_dir
+        self._lock = threading.Lock()
+        # name: {labels: [bucket counts..., +Inf count, sum]}
+        self._histograms = {name: {} for name in HISTOGRAMS}
+        # name: {labels: value}
+        self._counters = {name: {} for name in COUNTERS}
+        self._flush_scheduled = False
+        self._pid = None
+        self._stats_file = None
+        if stats_dir:
+            os.makedirs(stats_dir, exist_ok=True)
+
+    def _own_file(self):
+        # Named on first use in each process: with --preload the registry is
+        # created in the master and inherited by every forked worker
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._stats_file = os.path.join(self.stats_dir, f"{self._pid}-{time.time_ns()}.json")
+            atexit.register(self._remove_own_file, self._pid, self._stats_file)
+        return self._stats_file
+
+    def _remove_own_file(self, pid, path):
+        # Registered before a fork is inherited by the children; only the owner removes
+        if os.getpid() == pid:
+            _remove_quietly(path)
+
+    def _observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        series = self._histograms[name].get(labels)
+        if series is None:
+            series = self._histograms[name][labels] = [0] * (len(buckets) + 2)
+        series[_bucket_index(buckets, value)] += 1
+        series[-1] += value
+
+    def observe(self, route, status, timer, total, size):
+        """Record one finished request."""
+        with self._lock:
+            self._observe('metrics_api_request_duration_seconds', (('route', route),), total)
+            for name, seconds in timer.phases(total).items():
+                self._observe('metrics_api_phase_duration_seconds', (('route', route), ('phase', name)), seconds)
+            self._observe('metrics_api_response_rows', (('route', route),), timer.rows)
+            self._observe('metrics_api_response_bytes', (('route', route),), size)
+            requests = self._counters['metrics_api_requests_total']
+            labels = (('route', route), ('status', str(status)))
+            requests[labels] = requests.get(labels, 0) + 1
+            statements = self._counters['metrics_api_sql_statements_total']
+            labels = (('route', route),)
+            statements[labels] = statements.get(labels, 0) + timer.statements
+            schedule = bool(self.stats_dir) and not self._flush_scheduled
+            if schedule:
+                self._flush_scheduled = True
+        if schedule:
+            # One write per interval however many requests finish in it
+            flusher = threading.Timer(FLUSH_INTERVAL, self.flush)
+            flusher.daemon = True
+            flusher.start()
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                'histograms': {
+                    name: [[list(labels), list(series)] for labels, series in values.items()]
+                    for name, values in self._histograms.items()
+                },
+                'counters': {
+                    name: [[list(labels), value] for labels, value in values.items()]
+                    for name, values in self._counters.items()
+                },
+            }
+
+    def flush(self):
+        """Write this process's totals to the stats directory."""
+        if not self.stats_dir:
+            return
+        with self._lock:
+            self._flush_scheduled = False
+        snapshot = self._snapshot()
+        path = self._own_file()
+        temporary = f"{path}.tmp"
+        try:
+            with open(temporary, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(temporary, path)
+        except OSError as e:
+            print(f"Could not write request metrics to {self.stats_dir}: {e}")
+
+    def _merged(self):
+        """Totals of every process sharing the stats directory (or just this one)."""
+        if not self.stats_dir:
+            return self._snapshot()
+        self.flush()
+        merged = {'histograms': {name: {} for name in HISTOGRAMS}, 'counters': {name: {} for name in COUNTERS}}
+        for path in glob.glob(os.path.join(self.stats_dir, '*.json')):
+            pid = os.path.basename(path).split('-', 1)[0]
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                _remove_quietly(path)
+                continue
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, values in snapshot.get('histograms', {}).items():
+                if name not in merged['histograms']:
+                    continue
+                for labels, series in values:
+                    key = tuple(tuple(label) for label in labels)
+                    total = merged['histograms'][name].setdefault(key, [0] * len(series))
+                    if len(total) == len(series):
+                        merged['histograms'][name][key] = [a + b for a, b in zip(total, series)]
+            for name, values in snapshot.get('counters', {}).items():
+                if name not in merged['counters']:
+                    continue
+                for labels, value in values:
+                    key = tuple(tuple(label) for label in labels)
+                    merged['counters'][name][key] = merged['counters'][name].get(key, 0) + value
+        return {
+            kind: {name: [[list(key), value] for key, value in values.items()] for name, values in metrics.items()}
+            for kind, metrics in merged.items()
+        }
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        snapshot = self._merged()
+        lines = []
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, series in sorted(snapshot['histograms'][name], key=lambda item: item[0]):
+                label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), series[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{label_text}}} {series[-1]}")
+                lines.append(f"{name}_count{{{label_text}}} {cumulative}")
+        for name, help_text in COUNTERS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(snapshot['counters'][name], key=lambda item: item[0]):
+                label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+                lines.append(f"{name}{{{label_text}}} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+class CountedBody:
+    """Streamed response body that keeps its request's timer current while the
+    chunks are produced and calls on_done(total bytes) once it is closed."""
+
+    def __init__(self, chunks, timer, on_done):
+        self.chunks = chunks
+        self.timer = timer
+        self.on_done = on_done
+        self.size = 0
+
+    def __iter__(self):
+        _local.timer = self.timer
+        for chunk in self.chunks:
+            self.size += len(chunk)
+            yield chunk
+            _local.timer = self.timer
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+        if current() is self.timer:
+            stop()
+        if self.on_done is not None:
+            on_done, self.on_done = self.on_done, None
+            on_done(self.size)
@@ -0,0 +1,265 @@
+"""Row selection for the relationship tables of each metric family.
+
+Pages are addressed with keyset cursors: the (sort value, Rel_Key) of the last
+row sent.  Keyset paging needs the unique Rel_Key of the materialized table;
+on the plain view the cursor falls back to an offset.
+
+Full result sets can also be streamed straight off the sqlite cursor as
+NDJSON or a chunked JSON array, so memory stays flat however many rows match.
+
+``format=columnar`` sends one array per column instead of one object per row,
+with the low-cardinality columns dictionary-encoded::
+
+    {"columns": ["Pred. ID", ...], "length": 2,
+     "data": [["A1", "A2"], ..., [0, 1], ...],
+     "dictionaries": {"Relationship type": ["PR_FS", "PR_SS"], ...}}
+"""
+import base64
+import json
+
+from materialize import MATERIALIZED_TABLE
+from metric_registry import ROW_COLUMNS, predicate_sql, row_predicates, where_sql
+
+ROW_SELECT = ', '.join(column for column, _ in ROW_COLUMNS)
+ROW_KEYS = [key for _, key in ROW_COLUMNS]
+
+# ?sort= accepts either the JSON key ("Pred. ID") or the column name
+SORT_COLUMNS = {key: column for column, key in ROW_COLUMNS}
+SORT_COLUMNS.update({column: column for column, _ in ROW_COLUMNS})
+
+DEFAULT_PAGE_SIZE = 100
+STREAM_BATCH_SIZE = 1000
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json-stream': 'application/json',
+}
+MAX_PAGE_SIZE = 1000
+KEY_COLUMN = 'Rel_Key'
+# Columns with a handful of distinct values, sent as indexes into a dictionary
+DICTIONARY_KEYS = ('Relationship type', 'Driving', 'Lead', 'ExcessiveLag', 'Relationship_Status')
+# Tie-breakers for a stable order on the view, which has no unique key
+VIEW_TIEBREAK = ('Project_ID', 'Activity_ID', 'Activity_ID2')
+
+
+class InvalidPageRequest(ValueError):
+    pass
+
+
+def encode_cursor(state):
+    raw = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise InvalidPageRequest("Invalid cursor")
+    if not isinstance(state, dict):
+        raise InvalidPageRequest("Invalid cursor")
+    # Values are bound as SQL parameters (k, v) or used as an OFFSET (o)
+    offset = state.get('o', 0)
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        raise InvalidPageRequest("Invalid cursor")
+    for name in ('k', 'v'):
+        value = state.get(name)
+        if value is not None and (not isinstance(value, (str, int, float)) or isinstance(value, bool)):
+            raise InvalidPageRequest("Invalid cursor")
+    return state
+
+
+def sort_column(sort):
+    if sort is None:
+        return None
+    if sort not in SORT_COLUMNS:
+        raise InvalidPageRequest(f"Cannot sort by {sort!r}")
+    return SORT_COLUMNS[sort]
+
+
+def _order_by(source, column, descending):
+    direction = 'DESC' if descending else 'ASC'
+    if source == MATERIALIZED_TABLE:
+        keys = ([column] if column else []) + [KEY_COLUMN]
+    else:
+        keys = ([column] if column else []) + [c for c in VIEW_TIEBREAK if c != column]
+    return 'ORDER BY ' + ', '.join(f"{key} {direction}" for key in keys)
+
+
+def _after_sql(column, descending, state, params):
+    """Keyset condition for rows strictly after the cursor position.
+
+    SQLite sorts NULLs first ascending and last descending, so a NULL sort
+    value needs its own branch.
+    """
+    key = state['k']
+    cmp = '<' if descending else '>'
+    if column is None:
+        params.append(key)
+        return f"{KEY_COLUMN} {cmp} ?"
+    value = state.get('v')
+    if value is None:
+        params.append(key)
+        if descending:
+            return f"({column} IS NULL AND {KEY_COLUMN} < ?)"
+        return f"(({column} IS NULL AND {KEY_COLUMN} > ?) OR {column} IS NOT NULL)"
+    params.extend([value, value, key])
+    condition = f"({column} {cmp} ? OR ({column} = ? AND {KEY_COLUMN} {cmp} ?)"
+    if descending:
+        condition += f" OR {column} IS NULL"
+    return condition + ")"
+
+
+def rows_sql(source, family, filters, sort=None, descending=False):
+    params = []
+    where_clause = where_sql(row_predicates(family, filters), params)
+    sql = f"SELECT {ROW_SELECT} FROM {source} {where_clause}"
+    column = sort_column(sort)
+    if column is not None:
+        sql += ' ' + _order_by(source, column, descending)
+    return sql, params
+
+
+def fetch_rows(conn, source, family, filters, sort=None, descending=False):
+    sql, params = rows_sql(source, family, filters, sort, descending)
+    return conn.execute(sql, params).fetchall()
+
+
+def count_rows(conn, source, family, filters):
+    params = []
+    where_clause = where_sql(row_predicates(family, filters), params)
+    return conn.execute(f"SELECT COUNT(*) FROM {source} {where_clause}", params).fetchone()[0]
+
+
+def fetch_page(conn, source, family, filters, limit=DEFAULT_PAGE_SIZE, sort=None,
+               descending=False, cursor=None, encode=None):
+    """One page of rows plus the cursor for the next one.
+
+    The total row count is only computed for the first page (no cursor);
+    clients keep it for the later pages.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    column = sort_column(sort)
+    state = decode_cursor(cursor) if cursor else None
+    keyset = source == MATERIALIZED_TABLE
+
+    params = []
+    predicates = row_predicates(family, filters)
+    conditions = [predicate_sql(p, params) for p in predicates]
+    if state is not None and keyset:
+        if 'k' not in state:
+            raise InvalidPageRequest("Invalid cursor")
+        conditions.append(_after_sql(column, descending, state, params))
+    where_clause = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+
+    select = ROW_SELECT
+    if keyset:
+        select += f", {KEY_COLUMN}"
+        if column is not None:
+            select += f", {column}"
+    sql = f"SELECT {select} FROM {source} {where_clause} {_order_by(source, column, descending)} LIMIT ?"
+    params.append(limit + 1)
+    offset = 0
+    if state is not None and not keyset:
+        offset = int(state.get('o', 0))
+        sql += " OFFSET ?"
+        params.append(offset)
+
+    rows = conn.execute(sql, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        if keyset:
+            next_state = {'k': last[len(ROW_COLUMNS)]}
+            if column is not None:
+                next_state['v'] = last[len(ROW_COLUMNS) + 1]
+        else:
+            next_state = {'o': offset + limit}
+        next_cursor = encode_cursor(next_state)
+
+    return {
+        "rows": (encode or row_dicts)(rows),
+        "total": count_rows(conn, source, family, filters) if state is None else None,
+        "next_cursor": next_cursor,
+    }
+
+
+def open_cursor(conn, source, family, filters, sort=None, descending=False):
+    """Executed cursor over a family's rows, for callers that read it in batches."""
+    sql, params = rows_sql(source, family, filters, sort, descending)
+    return conn.execute(sql, params)
+
+
+def iter_batches(cursor, batch_size=STREAM_BATCH_SIZE):
+    """Lists of up to batch_size rows until the cursor is exhausted; closes it."""
+    try:
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+    finally:
+        cursor.close()
+
+
+def stream_rows(conn, source, family, filters, fmt, sort=None, descending=False,
+                batch_size=STREAM_BATCH_SIZE):
+    """Chunks of encoded rows, read from the cursor batch_size rows at a time.
+
+    The query is executed before returning, so a bad sort column raises here
+    rather than halfway through the response.
+    """
+    if fmt not in STREAM_FORMATS:
+        raise InvalidPageRequest(f"Unknown format {fmt!r}")
+    cursor = open_cursor(conn, source, family, filters, sort, descending)
+
+    def encode(row):
+        return json.dumps(dict(zip(ROW_KEYS, row)), separators=(',', ':'))
+
+    def generate():
+        if fmt == 'ndjson':
+            for batch in iter_batches(cursor, batch_size):
+                yield ''.join(encode(row) + '\n' for row in batch)
+        else:
+            # A JSON array sent in pieces: '[' + rows joined by ',' + ']'
+            separator = '['
+            for batch in iter_batches(cursor, batch_size):
+                yield separator + ','.join(encode(row) for row in batch)
+                separator = ','
+            yield ']' if separator == ',' else '[]'
+
+    return generate()
+
+
+def row_dicts(rows):
+    # Map to dicts for JSON; zip stops at the table columns, dropping paging keys
+    return [dict(zip(ROW_KEYS, row)) for row in rows]
+
+
+def columnar_rows(rows):
+    """Column arrays for rows, dictionary-encoding the DICTIONARY_KEYS columns."""
+    data = []
+    dictionaries = {}
+    for index, key in enumerate(ROW_KEYS):
+        values = [row[index] for row in rows]
+        if key in DICTIONARY_KEYS:
+            codes = {}
+            values = [codes.setdefault(value, len(codes)) for value in values]
+            dictionaries[key] = list(codes)
+        data.append(values)
+    return {
+        "columns": ROW_KEYS,
+        "length": len(rows),
+        "data": data,
+        "dictionaries": dictionaries,
+    }
+
+
+# Non-streamed response encodings, by ?format= value
+ROW_FORMATS = {
+    'json': row_dicts,
+    'columnar': columnar_rows,
+}
@@ -0,0 +1,167 @@
+"""Production server for the metrics API.
+
+Usage:
+    python serve.py [--host 0.0.0.0] [--port 5000] [--workers N] [--threads T]
+
+On Linux/macOS this runs gunicorn: a master process forks --workers copies of
+metrics_api.app, each serving --threads requests at a time (gthread workers).
+Every worker thread keeps its own read-only connection from db_pool, so all
+of them share mydata.db through SQLite's WAL snapshots and the OS page cache.
+Connections are opened lazily in the workers, never in the master, so
+--preload is safe.
+
+    kill -HUP <master pid>    start new workers (re-importing the code unless
+                              --preload), then stop the old ones once their
+                              in-flight requests finish
+    kill -TERM <master pid>   stop accepting, finish in-flight requests
+                              (up to --graceful-timeout), exit
+
+--max-requests recycles each worker after that many requests (with up to
+--max-requests-jitter more, so they don't all restart at once).
+
+gunicorn does not run on Windows; there (or with --server waitress) the app is
+served by waitress, one process with --threads threads.  It stops on
+Ctrl+C / SIGTERM but has no in-place reload.
+
+--server uvicorn serves the asyncio variant (asgi_app.py): --workers uvicorn
+processes, each holding any number of connections on its event loop and
+running the routes on --threads pool threads, with identical in-flight
+requests coalesced.  SIGTERM finishes in-flight requests for up to
+--graceful-timeout seconds.
+
+Every option falls back to a METRICS_* environment variable (see
+SERVER_DEFAULTS), so the same command works under a process manager.
+
+With more than one worker, /metrics must add up every worker's totals; unless
+METRICS_STATS_DIR is set, a temporary directory is created for them (removed
+when the server exits).
+"""
+import argparse
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+CPU_COUNT = os.cpu_count() or 1
+
+# option: (environment variable, default)
+SERVER_DEFAULTS = {
+    'host': ('METRICS_HOST', '127.0.0.1'),
+    'port': ('METRICS_PORT', 5000),
+    # One process per core runs the CPU-bound SQLite scans in parallel; the
+    # threads overlap each worker's I/O and GIL-free SQLite time
+    'workers': ('METRICS_WORKERS', CPU_COUNT),
+    'threads': ('METRICS_THREADS', 4),
+    'backlog': ('METRICS_BACKLOG', 2048),
+    'timeout': ('METRICS_TIMEOUT', 60),
+    'graceful_timeout': ('METRICS_GRACEFUL_TIMEOUT', 30),
+    'keepalive': ('METRICS_KEEPALIVE', 5),
+    'max_requests': ('METRICS_MAX_REQUESTS', 0),
+    'max_requests_jitter': ('METRICS_MAX_REQUESTS_JITTER', 0),
+    'server': ('METRICS_SERVER', 'gunicorn' if os.name != 'nt' else 'waitress'),
+}
+
+
+def _default(name):
+    variable, default = SERVER_DEFAULTS[name]
+    value = os.environ.get(variable)
+    if value is None:
+        return default
+    return type(default)(value) if isinstance(default, int) else value
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    class MetricsServer(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': f"{args.host}:{args.port}",
+                'workers': args.workers,
+                'threads': args.threads,
+                'worker_class': 'gthread',
+                'backlog': args.backlog,
+                'timeout': args.timeout,
+                'graceful_timeout': args.graceful_timeout,
+                'keepalive': args.keepalive,
+                'max_requests': args.max_requests,
+                'max_requests_jitter': args.max_requests_jitter,
+                'preload_app': args.preload,
+                'accesslog': '-' if args.access_log else None,
+                'proc_name': 'metrics-api',
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from metrics_api import app
+            return app
+
+    MetricsServer().run()
+
+
+def run_waitress(args):
+    from waitress import serve
+    from metrics_api import app
+
+    # Connections beyond the thread count wait in waitress's queue
+    serve(
+        app, host=args.host, port=args.port, threads=args.threads, backlog=args.backlog,
+        channel_timeout=args.timeout, connection_limit=max(100, args.threads * 25),
+    )
+
+
+def run_uvicorn(args):
+    import uvicorn
+
+    # Read by asgi_app at import, also in the worker processes uvicorn spawns
+    os.environ['METRICS_ASGI_THREADS'] = str(args.threads)
+    uvicorn.run(
+        'asgi_app:app', host=args.host, port=args.port, workers=args.workers, backlog=args.backlog,
+        timeout_keep_alive=args.keepalive, timeout_graceful_shutdown=args.graceful_timeout,
+        limit_max_requests=args.max_requests or None, access_log=args.access_log,
+    )
+
+
+SERVERS = {'gunicorn': run_gunicorn, 'uvicorn': run_uvicorn, 'waitress': run_waitress}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=_default('host'))
+    parser.add_argument('--port', type=int, default=_default('port'))
+    parser.add_argument('--workers', type=int, default=_default('workers'),
+                        help="worker processes (gunicorn, uvicorn; default: CPU count)")
+    parser.add_argument('--threads', type=int, default=_default('threads'),
+                        help="threads per worker (uvicorn: query threads per process)")
+    parser.add_argument('--backlog', type=int, default=_default('backlog'), help="pending connections")
+    parser.add_argument('--timeout', type=int, default=_default('timeout'),
+                        help="seconds before a silent worker (gunicorn) or idle connection (waitress) is dropped")
+    parser.add_argument('--graceful-timeout', type=int, default=_default('graceful_timeout'),
+                        help="seconds in-flight requests get on restart/shutdown")
+    parser.add_argument('--keepalive', type=int, default=_default('keepalive'),
+                        help="seconds to hold idle keep-alive connections")
+    parser.add_argument('--max-requests', type=int, default=_default('max_requests'),
+                        help="recycle a worker after this many requests (0: never)")
+    parser.add_argument('--max-requests-jitter', type=int, default=_default('max_requests_jitter'))
+    parser.add_argument('--preload', action='store_true',
+                        help="import the app once in the master (faster forks, no code reload on HUP)")
+    parser.add_argument('--access-log', action='store_true', help="log every request to stdout")
+    parser.add_argument('--server', choices=sorted(SERVERS), default=_default('server'))
+    args = parser.parse_args(argv)
+
+    try:
+        __import__(args.server)
+    except ImportError:
+        sys.exit(f"{args.server} is not installed; run: pip install {args.server}")
+    if args.workers > 1 and args.server != 'waitress' and not os.environ.get('METRICS_STATS_DIR'):
+        # Inherited by the workers; see request_metrics.py
+        stats_dir = os.environ['METRICS_STATS_DIR'] = tempfile.mkdtemp(prefix='metrics-stats-')
+        master = os.getpid()
+        atexit.register(lambda: os.getpid() == master and shutil.rmtree(stats_dir, ignore_errors=True))
+    SERVERS[args.server](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""Slow-query log: statements over a time threshold, with their query plans.
+
+The timed connections of request_metrics.py hand every statement that took
+longer than METRICS_SLOW_QUERY_MS (execute plus fetching its rows) to
+SlowQueryLog.record, which appends one JSON line to slow_queries.log:
+
+  time, pid, request    when, which worker, and the API request that ran it
+  duration_ms, rows     how long the statement took and how many rows it returned
+  sql, params           the statement as executed and its bound values
+  bound_sql             the same with the values inlined (paste into sqlite3)
+  shape                 id of the SQL with IN-lists collapsed, for grouping
+  plan                  EXPLAIN QUERY PLAN output, indented as a tree
+
+The log rotates at max_bytes into slow_queries.log.1 ... .N.  Several worker
+processes may append to it; one of them rotates it at a time.
+
+Summarize the worst query shapes with:
+
+    python slow_queries.py [slow_queries.log] [--top 10] [--sort total|max|count]
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# Plans cached per SQL text; the same shapes tend to be slow over and over
+PLAN_CACHE_SIZE = 256
+# A rotation lock older than this was left by a crashed process
+STALE_LOCK_SECONDS = 60
+
+# (pattern in a plan line, what it suggests)
+PLAN_HINTS = [
+    (re.compile(r'^SCAN (\w+)$'), "full scan of {0}: no index matches the filters"),
+    (re.compile(r'^SCAN (\w+) USING (?:COVERING )?INDEX'), "walks a whole index of {0}"),
+    (re.compile(r'AUTOMATIC (?:COVERING |PARTIAL )*INDEX'), "SQLite builds a temporary index per query"),
+    (re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)'), "{0} sorted in a temp b-tree"),
+]
+
+
+def normalize(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def sql_shape(sql):
+    """SQL with whitespace normalized and IN (?, ?, ...) lists collapsed."""
+    return re.sub(r'\(\?(?:, \?)*\)', '(?...)', normalize(sql))
+
+
+def shape_id(sql):
+    return hashlib.sha1(sql_shape(sql).encode('utf-8')).hexdigest()[:12]
+
+
+def sql_literal(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, bytes):
+        return f"X'{value.hex()}'"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def inline_params(sql, params):
+    """sql with each ? (outside quotes) replaced by its bound value as a literal."""
+    if not params or isinstance(params, dict):
+        return sql
+    values = iter(params)
+    parts = re.split(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")", sql)
+    for index in range(0, len(parts), 2):
+        parts[index] = re.sub(r'\?', lambda _: sql_literal(next(values, None)), parts[index])
+    return ''.join(parts)
+
+
+def query_plan(conn, sql, params):
+    """EXPLAIN QUERY PLAN of a statement as indented lines."""
+    try:
+        rows = conn.cursor(sqlite3.Cursor).execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    except sqlite3.Error as e:
+        return [f"(EXPLAIN QUERY PLAN failed: {e})"]
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return lines
+
+
+def plan_hints(plan):
+    hints = []
+    for line in plan:
+        for pattern, hint in PLAN_HINTS:
+            match = pattern.search(line.strip())
+            if match:
+                hints.append(hint.format(*match.groups()))
+    return list(dict.fromkeys(hints))
+
+
+class SlowQueryLog:
+    """Appends statements slower than threshold_ms to a rotating JSON-lines file."""
+
+    def __init__(self, path, threshold_ms=500, max_bytes=10 * 1024 * 1024, backups=5):
+        self.path = path
+        self.threshold = threshold_ms / 1000
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._plans = {}
+
+    def _plan(self, conn, sql, params):
+        plan = self._plans.get(sql)
+        if plan is None:
+            plan = query_plan(conn, sql, params)
+            with self._lock:
+                if len(self._plans) >= PLAN_CACHE_SIZE:
+                    self._plans.clear()
+                self._plans[sql] = plan
+        return plan
+
+    def record(self, conn, sql, params, seconds, rows, request=None):
+        params = list(params) if not isinstance(params, dict) else params
+        entry = {
+            'time': datetime.datetime.now().isoformat(timespec='milliseconds'),
+            'pid': os.getpid(),
+            'request': request,
+            'duration_ms': round(seconds * 1000, 2),
+            'rows': rows,
+            'shape': shape_id(sql),
+            'sql': normalize(sql),
+            'params': params,
+            'bound_sql': inline_params(normalize(sql), params),
+            'plan': self._plan(conn, sql, params),
+        }
+        line = json.dumps(entry, default=str) + '\n'
+        with self._lock:
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+                if os.path.getsize(self.path) >= self.max_bytes:
+                    self._rotate()
+            except OSError as e:
+                print(f"Could not write slow-query log {self.path}: {e}")
+
+    def _rotate(self):
+        # The lock file keeps two processes from shifting the backups at once
+        lock_path = self.path + '.lock'
+        try:
+            lock = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > STALE_LOCK_SECONDS:
+                    os.remove(lock_path)
+            except OSError:
+                pass
+            return
+        try:
+            if os.path.getsize(self.path) < self.max_bytes:
+                return  # another process rotated it first
+            for number in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{number}"):
+                    os.replace(f"{self.path}.{number}", f"{self.path}.{number + 1}")
+            if self.backups > 0:
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+        finally:
+            os.close(lock)
+            os.remove(lock_path)
+
+
+def read_entries(path):
+    """Entries of a log and its rotated backups, oldest file first."""
+    paths = sorted(
+        (p for p in (f"{path}.{n}" for n in range(1, 100)) if os.path.exists(p)),
+        key=lambda p: -int(p.rsplit('.', 1)[1]),
+    )
+    if os.path.exists(path):
+        paths.append(path)
+    for log_path in paths:
+        with open(log_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+
+
+def summarize(entries, since=None):
+    """Per-shape totals: {shape: {...}}, keeping the slowest occurrence as the example."""
+    shapes = {}
+    for entry in entries:
+        if since and entry['time'] < since:
+            continue
+        summary = shapes.get(entry['shape'])
+        if summary is None:
+            summary = shapes[entry['shape']] = {
+                'shape': entry['shape'], 'sql': sql_shape(entry['sql']), 'count': 0, 'total_ms': 0.0,
+                'max_ms': 0.0, 'durations': [], 'requests': {}, 'slowest': entry,
+            }
+        summary['count'] += 1
+        summary['total_ms'] += entry['duration_ms']
+        summary['durations'].append(entry['duration_ms'])
+        if entry['duration_ms'] >= summary['max_ms']:
+            summary['max_ms'] = entry['duration_ms']
+            summary['slowest'] = entry
+        route = (entry.get('request') or '(no request)').split('?', 1)[0]
+        summary['requests'][route] = summary['requests'].get(route, 0) + 1
+    return shapes
+
+
+def print_report(shapes, sort='total', top=10):
+    key = {'total': 'total_ms', 'max': 'max_ms', 'count': 'count'}[sort]
+    ranked = sorted(shapes.values(), key=lambda s: s[key], reverse=True)
+    print(f"{sum(s['count'] for s in ranked)} slow queries in {len(ranked)} shapes; top {min(top, len(ranked))} by {sort}\n")
+    for rank, summary in enumerate(ranked[:top], 1):
+        durations = sorted(summary['durations'])
+        median = durations[len(durations) // 2]
+        slowest = summary['slowest']
+        print(f"#{rank}  shape {summary['shape']}  {summary['count']}x  total {summary['total_ms'] / 1000:.1f}s  "
+              f"median {median:.0f} ms  max {summary['max_ms']:.0f} ms  rows {slowest['rows']}")
+        routes = sorted(summary['requests'].items(), key=lambda item: -item[1])
+        print("    routes:  " + ', '.join(f"{route} ({count})" for route, count in routes[:5]))
+        print(f"    slowest: {slowest.get('request') or '(no request)'}")
+        print(f"    sql:     {slowest['bound_sql']}")
+        print("    plan:")
+        for line in slowest['plan']:
+            print(f"      {line}")
+        for hint in plan_hints(slowest['plan']):
+            print(f"    hint:    {hint}")
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the slow-query log by query shape")
+    parser.add_argument('log', nargs='?', default=os.environ.get(
+        'METRICS_SLOW_QUERY_LOG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'slow_queries.log')))
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--sort', choices=('total', 'max', 'count'), default='total',
+                        help="rank shapes by total time, slowest run or occurrences")
+    parser.add_argument('--since', default=None, help="only entries from this ISO date/time on")
+    args = parser.parse_args()
+    if not os.path.exists(args.log) and not os.path.exists(args.log + '.1'):
+        sys.exit(f"No slow-query log at {args.log}")
+    print_report(summarize(read_entries(args.log), args.since), args.sort, args.top)
+
+
+if __name__ == '__main__':
+    main()
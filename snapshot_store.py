@@ -0,0 +1,135 @@
+"""Relationship snapshots shared by the in-memory engines.
+
+A SnapshotStore loads the relationship rows once and rebuilds its snapshot
+(numpy_engine's column arrays, bitmap_index's bitmaps) when the database
+version changes.  Rows are streamed to the builder in batches, so a load never
+holds the whole table as Python tuples.  value_matches() tests one stored value
+against a registry predicate, so an engine only evaluates each distinct value
+once.
+
+Lag / FreeFloat predicates follow the materialized table's semantics (numeric,
+blank text is NULL), also when the snapshot is loaded from the plain view.
+"""
+import threading
+
+from materialize import MATERIALIZED_TABLE, NUMERIC_COLUMNS
+from metric_registry import ROW_COLUMNS
+from row_queries import VIEW_TIEBREAK, iter_batches
+
+ROW_LOAD_COLUMNS = [column for column, _ in ROW_COLUMNS] + ['Project_ID']
+LOAD_BATCH_SIZE = 65536
+
+
+def sqlite_rank(value):
+    # NULLs, then numbers, then text, then blobs: SQLite's ORDER BY
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, value)
+
+
+def as_number(value):
+    # Same conversion as materialize.refresh(): CAST(NULLIF(TRIM(x), '') AS REAL)
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _equals(stored, value):
+    # SQLite applies the column's numeric affinity to text like '12'
+    if stored is None or value is None:
+        return False
+    if stored == value:
+        return True
+    if isinstance(stored, (int, float)) and isinstance(value, str):
+        return as_number(value) == stored
+    return False
+
+
+_COMPARE = {
+    '=': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+}
+
+
+def value_matches(column, op, value, stored):
+    """Whether a stored value of column passes the (non-'or') predicate."""
+    if column in NUMERIC_COLUMNS:
+        if op == 'is null':
+            return is_blank(stored)
+        if is_blank(stored):
+            return False
+        if op == 'is not null':
+            return True
+        if op in ('in', 'not in'):
+            found = any(value_matches(column, '=', v, stored) for v in value)
+            return found if op == 'in' else not found
+        number = as_number(value)
+        if number is None:
+            # Numbers sort before text, so a text operand compares as larger
+            return op in ('!=', '<', '<=')
+        stored_number = as_number(stored)
+        if stored_number is None:
+            return op == '!='
+        return _COMPARE[op](stored_number, number)
+
+    if op == 'is null':
+        return stored is None
+    if stored is None:
+        return False
+    if op == 'is not null':
+        return True
+    if op in ('in', 'not in'):
+        found = any(_equals(stored, v) for v in value)
+        return found if op == 'in' else not found
+    if op == '=':
+        return _equals(stored, value)
+    return _COMPARE[op](sqlite_rank(stored), sqlite_rank(value))
+
+
+def load_rows(conn, source, columns, batch_size=LOAD_BATCH_SIZE):
+    """Lists of up to batch_size rows of source, in load order."""
+    # Load order is the tie-break of sorted rows, as in row_queries._order_by
+    order = 'Rel_Key' if source == MATERIALIZED_TABLE else ', '.join(VIEW_TIEBREAK)
+    cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {source} ORDER BY {order}")
+    return iter_batches(cursor, batch_size)
+
+
+class SnapshotStore:
+    """Keeps build(batches of rows) of the current database version, rebuilt when it changes."""
+
+    def __init__(self, build, columns, version=None, batch_size=LOAD_BATCH_SIZE):
+        self.build = build
+        self.columns = columns
+        self.version = version
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._loaded_version = None
+        self._source = None
+
+    def get(self, conn, source):
+        version = self.version() if self.version else None
+        snapshot = self._snapshot
+        if snapshot is not None and version == self._loaded_version and source == self._source:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or version != self._loaded_version or source != self._source:
+                self._snapshot = self.build(load_rows(conn, source, self.columns, self.batch_size))
+                self._loaded_version = version
+                self._source = source
+            return self._snapshot
@@ -0,0 +1,61 @@
+"""Shared fixtures: a small synthetic schedule database and the Flask app over it.
+
+benchmarks/generate_schedule.py builds the database once per test session,
+with the materialized table, rollup cube and KPI snapshots, so every engine,
+source and route can be compared on the same rows.
+"""
+import importlib
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import generate_schedule
+
+RELATIONSHIPS = 6000
+PROJECTS = 5
+SEED = 7
+
+
+@pytest.fixture(scope='session')
+def schedule_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('schedule') / 'mydata.db')
+    generate_schedule.generate(path, RELATIONSHIPS, projects=PROJECTS, seed=SEED)
+    return path
+
+
+@pytest.fixture
+def conn(schedule_db):
+    connection = sqlite3.connect(schedule_db)
+    yield connection
+    connection.close()
+
+
+@pytest.fixture(scope='session')
+def api_db(schedule_db, tmp_path_factory):
+    # A copy the API tests may write to without touching the shared database
+    path = str(tmp_path_factory.mktemp('api') / 'mydata.db')
+    shutil.copy(schedule_db, path)
+    return path
+
+
+@pytest.fixture(scope='session')
+def metrics_api(api_db, tmp_path_factory):
+    # metrics_api reads its configuration from the environment at import
+    os.environ['METRICS_DB_PATH'] = api_db
+    os.environ['METRICS_SLOW_QUERY_LOG'] = str(tmp_path_factory.mktemp('logs') / 'slow_queries.log')
+    os.environ.pop('METRICS_STATS_DIR', None)
+    module = importlib.import_module('metrics_api')
+    assert module.DB_PATH == api_db
+    return module
+
+
+@pytest.fixture
+def client(metrics_api):
+    return metrics_api.app.test_client()
@@ -0,0 +1,121 @@
+"""The ASGI wrapper serves the Flask routes and coalesces identical requests."""
+import asyncio
+import importlib
+import json
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def asgi_app(metrics_api):
+    # asgi_app imports metrics_api, which must see the test configuration first
+    return importlib.import_module('asgi_app')
+
+
+def scope(path, query=b'', headers=()):
+    return {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': query,
+        'headers': list(headers), 'http_version': '1.1', 'scheme': 'http',
+    }
+
+
+async def call(app, request_scope):
+    """(status, headers, body) of one request."""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(request_scope, receive, send)
+    start = messages[0]
+    assert start['type'] == 'http.response.start'
+    assert not messages[-1].get('more_body')
+    return start['status'], dict(start['headers']), b''.join(m.get('body', b'') for m in messages[1:])
+
+
+class BlockingApp:
+    """WSGI app that counts its calls and holds every response until released."""
+
+    def __init__(self, streamed=False):
+        self.calls = 0
+        self.release = threading.Event()
+        self.streamed = streamed
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.calls += 1
+            number = self.calls
+        self.release.wait(5)
+        body = f"{environ['QUERY_STRING']}:{number}".encode()
+        headers = [('Content-Type', 'text/plain')]
+        if not self.streamed:
+            headers.append(('Content-Length', str(len(body))))
+        start_response('200 OK', headers)
+        return [body]
+
+
+async def concurrent(app, wsgi, scopes):
+    """Start every request, release the app once they have all arrived, gather the responses."""
+    tasks = [asyncio.ensure_future(call(app, s)) for s in scopes]
+    while app.stats['requests'] < len(scopes):
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+    wsgi.release.set()
+    return await asyncio.gather(*tasks)
+
+
+def test_identical_requests_share_one_execution(asgi_app):
+    wsgi = BlockingApp()
+    app = asgi_app.MetricsASGI(wsgi, threads=4)
+    responses = asyncio.run(concurrent(app, wsgi, [scope('/api/lags-kpi', b'driving=Y')] * 5))
+    assert wsgi.calls == 1
+    assert {body for _, _, body in responses} == {b'driving=Y:1'}
+    assert app.stats == {'requests': 5, 'executed': 1, 'coalesced': 4}
+    assert app._in_flight == {}
+
+
+def test_requests_differing_in_query_or_headers_run_separately(asgi_app):
+    wsgi = BlockingApp()
+    app = asgi_app.MetricsASGI(wsgi, threads=4)
+    scopes = [
+        scope('/api/lags-kpi', b'driving=Y'),
+        scope('/api/lags-kpi', b'driving=N'),
+        scope('/api/lags-kpi', b'driving=Y', [(b'if-none-match', b'"abc"')]),
+    ]
+    asyncio.run(concurrent(app, wsgi, scopes))
+    assert wsgi.calls == 3
+    assert app.stats['coalesced'] == 0
+
+
+def test_streamed_responses_are_not_shared(asgi_app):
+    wsgi = BlockingApp(streamed=True)
+    app = asgi_app.MetricsASGI(wsgi, threads=4)
+    responses = asyncio.run(concurrent(app, wsgi, [scope('/api/lags', b'format=ndjson')] * 3))
+    assert wsgi.calls == 3
+    assert sorted(body for _, _, body in responses) == [f"format=ndjson:{n}".encode() for n in (1, 2, 3)]
+
+
+def test_coalescing_can_be_disabled(asgi_app):
+    wsgi = BlockingApp()
+    app = asgi_app.MetricsASGI(wsgi, threads=4, coalesce=False)
+    asyncio.run(concurrent(app, wsgi, [scope('/api/lags-kpi')] * 3))
+    assert wsgi.calls == 3
+
+
+def test_serves_the_flask_routes(asgi_app, client, metrics_api):
+    app = asgi_app.MetricsASGI(metrics_api.app, threads=2)
+    status, headers, body = asyncio.run(call(app, scope('/api/lags-kpi', b'driving=N')))
+    assert status == 200
+    assert json.loads(body) == client.get('/api/lags-kpi?driving=N').get_json()
+    assert headers[b'content-type'] == b'application/json'
+
+    status, _, body = asyncio.run(call(app, scope('/api/lags', b'format=ndjson&sort=Lag')))
+    assert status == 200
+    assert [json.loads(line) for line in body.decode().splitlines()] == client.get(
+        '/api/lags?sort=Lag'
+    ).get_json()
@@ -0,0 +1,36 @@
+"""/api/bootstrap equals the individual option routes it replaces."""
+import pytest
+
+from metric_registry import FILTER_OPTIONS
+
+# Route prefix of each family's option routes
+PREFIXES = {'fs0d': '', 'non-fs0d': 'nonfs-', 'leads': 'leads-', 'lags': 'lags-', 'excessive-lags': 'excessive-lags-'}
+
+
+def option_route(family, name):
+    return f"/api/{PREFIXES[family]}{name.replace('_', '-')}-options"
+
+
+@pytest.fixture(scope='module')
+def bootstrap(metrics_api):
+    return metrics_api.app.test_client().get('/api/bootstrap').get_json()
+
+
+def test_projects_match_route(client, bootstrap):
+    assert bootstrap['projects'] == client.get('/api/project-options').get_json()
+    assert len(bootstrap['projects']) > 1
+
+
+@pytest.mark.parametrize('family, name', [
+    (family, name) for family, names in FILTER_OPTIONS.items() for name in names
+])
+def test_options_match_routes(client, bootstrap, family, name):
+    values = bootstrap['options'][family][name]
+    assert values == client.get(option_route(family, name)).get_json()
+    assert values
+
+
+def test_bootstrap_lists_every_option_route(bootstrap):
+    assert {family: set(names) for family, names in bootstrap['options'].items()} == {
+        family: set(names) for family, names in FILTER_OPTIONS.items()
+    }
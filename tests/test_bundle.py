@@ -0,0 +1,43 @@
+"""/api/<family>/bundle returns what the separate tab routes return."""
+import pytest
+
+# family: (rows, kpi, chart, history) routes the dashboard used to fan out to
+TAB_ROUTES = {
+    'fs0d': ('typical-fs0d', 'finalactivitykpi', 'relationship-type-counts', 'relationship-percentage-history'),
+    'non-fs0d': ('typical-non-fs0d', 'non-fs0d-kpi', None, None),
+    'leads': ('leads', 'leads-kpi', 'leads-chart-data', 'leads-percentage-history'),
+    'lags': ('lags', 'lags-kpi', 'lags-chart-data', 'lags-percentage-history'),
+    'excessive-lags': ('excessive-lags', 'excessive-lags-kpi', 'excessive-lags-chart-data',
+                       'excessive-lags-percentage-history'),
+}
+FILTER_SETS = [{}, {'driving': 'N', 'project_id': '1000'}, {'relationship_type': 'PR_SS'}]
+
+
+@pytest.mark.parametrize('raw', FILTER_SETS)
+@pytest.mark.parametrize('family', list(TAB_ROUTES))
+def test_bundle_matches_tab_routes(client, family, raw):
+    bundle = client.get(f"/api/{family}/bundle", query_string=raw).get_json()
+    rows, kpi, chart, history = TAB_ROUTES[family]
+    assert bundle['rows'] == client.get(f"/api/{rows}", query_string=raw).get_json()
+    assert bundle['kpis'] == client.get(f"/api/{kpi}", query_string=raw).get_json()
+    if chart is not None:
+        assert bundle['chart'] == client.get(f"/api/{chart}", query_string=raw).get_json()
+    if history is None:
+        assert bundle['history'] is None
+    else:
+        assert bundle['history'] == client.get(f"/api/{history}", query_string=raw).get_json()
+    assert 'page' not in bundle
+
+
+def test_paged_bundle_sends_first_page(client):
+    query = {'limit': 25, 'sort': 'Lag', 'order': 'desc', 'driving': 'N'}
+    bundle = client.get('/api/lags/bundle', query_string=query).get_json()
+    page = client.get('/api/lags', query_string=query).get_json()
+    assert bundle['rows'] == page['rows']
+    assert bundle['page'] == {'total': page['total'], 'next_cursor': page['next_cursor']}
+    assert bundle['chart'] == client.get('/api/lags-chart-data', query_string={'driving': 'N'}).get_json()
+
+
+def test_bundle_errors(client):
+    assert client.get('/api/nonsense/bundle').status_code == 404
+    assert client.get('/api/lags/bundle?format=ndjson').status_code == 400
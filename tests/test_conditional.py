@@ -0,0 +1,72 @@
+"""ETag / Last-Modified revalidation against the database version."""
+import os
+import sqlite3
+import time
+
+from werkzeug.http import http_date
+
+
+def touch(path, seconds_ago):
+    """Set the database (and WAL) mtime, as if the last write was seconds_ago."""
+    stamp = time.time() - seconds_ago
+    for name in (path, path + '-wal'):
+        if os.path.exists(name):
+            os.utime(name, (stamp, stamp))
+
+
+def write(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS test_touch (x)")
+    conn.execute("INSERT INTO test_touch VALUES (1)")
+    conn.commit()
+    conn.close()
+
+
+def test_etag_answers_304_until_the_database_changes(client, api_db):
+    first = client.get('/api/lags-kpi?driving=Y')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    again = client.get('/api/lags-kpi?driving=Y', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+    assert again.headers['ETag'] == etag
+
+    # The same filters written differently share the ETag; other filters don't
+    assert client.get('/api/lags-kpi?driving=Y&lag=All').headers['ETag'] == etag
+    assert client.get('/api/lags-kpi?driving=N').headers['ETag'] != etag
+
+    write(api_db)
+    changed = client.get('/api/lags-kpi?driving=Y', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json() == first.get_json()
+
+
+def test_if_modified_since(client, api_db):
+    touch(api_db, 60)
+    response = client.get('/api/leads-kpi')
+    last_modified = response.headers['Last-Modified']
+    assert client.get('/api/leads-kpi', headers={'If-Modified-Since': last_modified}).status_code == 304
+    earlier = http_date(time.time() - 3600)
+    assert client.get('/api/leads-kpi', headers={'If-Modified-Since': earlier}).status_code == 200
+    # If-None-Match wins over a current If-Modified-Since
+    assert client.get('/api/leads-kpi', headers={
+        'If-Modified-Since': last_modified, 'If-None-Match': '"other"',
+    }).status_code == 200
+
+
+def test_no_last_modified_within_the_write_second(client, api_db):
+    touch(api_db, 60)
+    last_modified = client.get('/api/leads-kpi').headers['Last-Modified']
+    write(api_db)
+    touch(api_db, 0)
+    response = client.get('/api/leads-kpi', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 200
+    assert "Last-Modified" not in response.headers
+    assert 'ETag' in response.headers
+
+
+def test_health_is_not_conditional(client):
+    assert 'ETag' not in client.get('/api/health').headers
@@ -0,0 +1,87 @@
+"""CSV and XLSX exports carry the same rows as the JSON table."""
+import csv
+import io
+import sqlite3
+import xml.etree.ElementTree as ET
+import zipfile
+
+import pytest
+
+from table_export import EXPORT_HEADERS, xlsx_chunks
+
+SHEET_NS = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+QUERY = {'driving': 'N', 'sort': 'Lag', 'order': 'desc'}
+# Row route of each exported family
+ROW_ROUTES = {'lags': 'lags', 'non-fs0d': 'typical-non-fs0d'}
+
+
+def json_rows(client, family, query):
+    return [
+        [row[key] for key in EXPORT_HEADERS]
+        for row in client.get(f"/api/{ROW_ROUTES[family]}", query_string=query).get_json()
+    ]
+
+
+def sheet_rows(body):
+    """Cell values of the first worksheet; numbers as floats, empty cells as None."""
+    with zipfile.ZipFile(io.BytesIO(body)) as workbook:
+        assert workbook.testzip() is None
+        names = workbook.namelist()
+        assert {'[Content_Types].xml', 'xl/workbook.xml', 'xl/worksheets/sheet1.xml'} <= set(names)
+        sheet = ET.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+    rows = []
+    for row in sheet.iterfind('.//s:sheetData/s:row', SHEET_NS):
+        values = []
+        for cell in row.iterfind('s:c', SHEET_NS):
+            if cell.get('t') == 'inlineStr':
+                values.append(cell.find('s:is/s:t', SHEET_NS).text or '')
+            elif cell.find('s:v', SHEET_NS) is not None:
+                values.append(float(cell.find('s:v', SHEET_NS).text))
+            else:
+                values.append(None)
+        rows.append(values)
+    return rows
+
+
+@pytest.mark.parametrize('family', list(ROW_ROUTES))
+def test_csv_export_matches_json(client, family):
+    response = client.get(f"/api/{family}/export", query_string=dict(QUERY, format='csv'))
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == (
+        f'attachment; filename="{family.replace("-", "_")}_data.csv"'
+    )
+    text = response.get_data().decode('utf-8')
+    assert text.startswith('\ufeff')
+    rows = list(csv.reader(io.StringIO(text[1:])))
+    assert rows[0] == EXPORT_HEADERS
+    expected = [['' if value is None else str(value) for value in row] for row in json_rows(client, family, QUERY)]
+    assert rows[1:] == expected
+
+
+@pytest.mark.parametrize('family', list(ROW_ROUTES))
+def test_xlsx_export_is_a_workbook_of_the_rows(client, family):
+    response = client.get(f"/api/{family}/export", query_string=dict(QUERY, format='xlsx'))
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'].endswith('.xlsx"')
+    rows = sheet_rows(response.get_data())
+    assert rows[0] == EXPORT_HEADERS
+    expected = [
+        [float(value) if isinstance(value, (int, float)) else value for value in row]
+        for row in json_rows(client, family, QUERY)
+    ]
+    assert rows[1:] == expected
+
+
+def test_xlsx_escapes_text():
+    conn = sqlite3.connect(':memory:')
+    cursor = conn.execute(
+        "SELECT ? " + ", NULL" * (len(EXPORT_HEADERS) - 1), ('a < b & "c"\x01\x0b',)
+    )
+    rows = sheet_rows(b''.join(xlsx_chunks(cursor, sheet_name='Lags & <Leads>', batch_size=1)))
+    assert rows[1] == ['a < b & "c"'] + [None] * (len(EXPORT_HEADERS) - 1)
+
+
+def test_export_errors(client):
+    assert client.get('/api/lags/export?format=pdf').status_code == 400
+    assert client.get('/api/nonsense/export').status_code == 404
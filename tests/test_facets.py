@@ -0,0 +1,51 @@
+"""Cross-filtered facet counts equal the row counts of each alternative value."""
+import sqlite3
+
+import pytest
+
+from materialize import MATERIALIZED_TABLE, SOURCE_VIEW
+from filter_options import facet_counts
+from metric_registry import FILTER_COLUMNS, parse_filters
+from row_queries import count_rows
+
+
+@pytest.mark.parametrize('family, raw', [
+    ('fs0d', {}),
+    ('non-fs0d', {'driving': 'N'}),
+    ('lags', {'relationship_type': 'PR_SS', 'project_id': '1000'}),
+    ('leads', {'lag': '-3'}),
+])
+def test_facet_counts_match_row_counts(client, api_db, family, raw):
+    response = client.get(f"/api/{family}/facets", query_string=raw)
+    assert response.status_code == 200
+    facets = response.get_json()
+    filters = parse_filters(raw)
+    conn = sqlite3.connect(api_db)
+    try:
+        assert facets['total'] == count_rows(conn, MATERIALIZED_TABLE, family, filters)
+        for name in FILTER_COLUMNS:
+            others = {key: value for key, value in raw.items() if key != name}
+            assert facets['facets'][name]
+            for entry in facets['facets'][name]:
+                if entry['value'] is None:
+                    continue  # NULL can't be selected as a filter value
+                selected = parse_filters(dict(others, **{name: str(entry['value'])}))
+                assert entry['count'] == count_rows(conn, MATERIALIZED_TABLE, family, selected), (name, entry)
+    finally:
+        conn.close()
+
+
+def test_selection_without_rows_stays_listed(conn):
+    facets = facet_counts(conn, MATERIALIZED_TABLE, 'lags', parse_filters({'lag': '999'}))
+    assert {'value': 999, 'count': 0} in facets['facets']['lag']
+    assert facets['total'] == 0
+
+
+def test_view_and_materialized_facets_agree(conn):
+    filters = parse_filters({'driving': 'Y'})
+    assert facet_counts(conn, SOURCE_VIEW, 'non-fs0d', filters) == facet_counts(
+        conn, MATERIALIZED_TABLE, 'non-fs0d', filters)
+
+
+def test_unknown_family_is_a_404(client):
+    assert client.get('/api/nonsense/facets').status_code == 404
@@ -0,0 +1,59 @@
+"""/api/health and the connection pool's health check."""
+import sqlite3
+
+from db_pool import ConnectionPool
+from materialize import MATERIALIZED_TABLE, SOURCE_VIEW
+
+SOURCES = (MATERIALIZED_TABLE, SOURCE_VIEW)
+
+
+def test_health_reports_source(client, metrics_api, api_db):
+    response = client.get('/api/health')
+    assert response.status_code == 200
+    status = response.get_json()
+    assert status['ok'] is True
+    assert status['source'] == MATERIALIZED_TABLE
+    assert status['db_path'] == api_db
+    assert status['engine'] == metrics_api.ENGINE
+
+
+def test_unhealthy_database_is_a_503(client, metrics_api, tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics_api, 'pool', ConnectionPool(str(tmp_path / 'missing.db')))
+    response = client.get('/api/health')
+    assert response.status_code == 503
+    assert response.get_json()['ok'] is False
+
+
+def test_missing_database_is_not_healthy(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'missing.db'))
+    status = pool.health(sources=SOURCES)
+    assert status['ok'] is False and status['error']
+    assert pool.health()['ok'] is False
+    assert not (tmp_path / 'missing.db').exists()
+
+
+def test_database_without_a_source_is_not_healthy(tmp_path):
+    path = str(tmp_path / 'empty.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE PROJECT (proj_id)")
+    conn.close()
+    pool = ConnectionPool(path)
+    assert pool.health()['ok'] is True
+    status = pool.health(sources=SOURCES)
+    assert status['ok'] is False
+    assert status['source'] is None
+    assert MATERIALIZED_TABLE in status['error']
+
+
+def test_view_only_database_reports_the_view(schedule_db, tmp_path):
+    path = str(tmp_path / 'view_only.db')
+    source = sqlite3.connect(schedule_db)
+    target = sqlite3.connect(path)
+    source.backup(target)
+    source.close()
+    target.execute(f"DROP TABLE {MATERIALIZED_TABLE}")
+    target.commit()
+    target.close()
+    status = ConnectionPool(path).health(sources=SOURCES)
+    assert status['ok'] is True
+    assert status['source'] == SOURCE_VIEW
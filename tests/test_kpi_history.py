@@ -0,0 +1,54 @@
+"""KPI history from the per-import snapshots and the charts built on it."""
+import pytest
+
+from kpi_history import history, percentage_history
+from metric_registry import FAMILIES
+
+HISTORY_FAMILIES = ['fs0d', 'leads', 'lags', 'excessive-lags']
+
+
+def test_history_sums_latest_snapshots(conn):
+    points = history(conn, 'lags')
+    dates = [point['data_date'] for point in points]
+    assert dates == sorted(set(dates))
+    # The last point covers every project's latest snapshot
+    latest = {}
+    for project, value in conn.execute(
+        "SELECT Project_ID, Value FROM KPISnapshot WHERE Family = 'lags' AND Metric = 'Lag_Count' "
+        "ORDER BY Data_Date"
+    ):
+        latest[project] = value
+    assert points[-1]['Lag_Count'] == sum(latest.values())
+
+    one = history(conn, 'lags', project_id=next(iter(latest)), metric='Lag_Percentage')
+    assert all(set(point) == {'Lag_Percentage', 'data_date'} for point in one)
+    assert history(conn, 'lags', start=dates[1], end=dates[-2]) == points[1:-1]
+
+
+@pytest.mark.parametrize('family', HISTORY_FAMILIES)
+def test_one_point_per_month(conn, family):
+    # The generated schedule has two data dates in one month
+    name = FAMILIES[family]['percentage'][0]
+    points = history(conn, family, metric=name)
+    months = {}
+    for point in points:
+        months[point['data_date'][:7]] = point
+    assert len(months) < len(points)
+
+    chart = percentage_history(conn, family)
+    if family == 'fs0d':
+        assert len(chart['labels']) == len(set(chart['labels'])) == len(months)
+        assert chart['data'] == [point[name] for point in months.values()]
+    else:
+        assert [point['data_date'] for point in chart] == [point['data_date'] for point in months.values()]
+        assert [point['percentage'] for point in chart] == [point[name] for point in months.values()]
+        assert len({(point['month'], point['year']) for point in chart}) == len(chart)
+
+
+def test_kpi_history_route(client):
+    points = client.get('/api/kpi-history?family=leads').get_json()
+    assert points and set(points[0]) == set(FAMILIES['leads']['kpis']) | {'Lead_Percentage', 'data_date'}
+    only = client.get('/api/kpi-history?family=leads&metric=Leads_Count').get_json()
+    assert [point['Leads_Count'] for point in only] == [point['Leads_Count'] for point in points]
+    assert client.get('/api/kpi-history?family=nope').status_code == 404
+    assert client.get('/api/kpi-history?family=leads&metric=Lag_Count').status_code == 400
@@ -0,0 +1,101 @@
+"""Keyset paging returns every row exactly once, in the requested order."""
+import pytest
+
+from materialize import MATERIALIZED_TABLE, SOURCE_VIEW
+from metric_registry import FAMILIES, ROW_COLUMNS, parse_filters, row_predicates, where_sql
+from row_queries import InvalidPageRequest, encode_cursor, fetch_page, fetch_rows, sort_column
+from snapshot_store import sqlite_rank
+
+PAGE_SIZE = 37
+SORTS = [None, 'Lag', 'FreeFloat', 'Pred. Name']
+
+
+def _pages(conn, source, family, filters, sort=None, descending=False):
+    pages = []
+    cursor = None
+    while True:
+        page = fetch_page(conn, source, family, filters, limit=PAGE_SIZE, sort=sort,
+                          descending=descending, cursor=cursor, encode=list)
+        pages.append(page)
+        cursor = page['next_cursor']
+        if cursor is None:
+            return pages
+
+
+def _expected_keys(conn, family, filters, column, descending):
+    """Rel_Keys in ORDER BY column, Rel_Key order, sorted in Python."""
+    params = []
+    where_clause = where_sql(row_predicates(family, filters), params)
+    rows = conn.execute(
+        f"SELECT Rel_Key, {column or 'NULL'} FROM {MATERIALIZED_TABLE} {where_clause}", params
+    ).fetchall()
+    rows.sort(key=lambda row: (sqlite_rank(row[1]), row[0]), reverse=descending)
+    return [key for key, _ in rows]
+
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('sort', SORTS)
+@pytest.mark.parametrize('family', list(FAMILIES))
+def test_keyset_pages_cover_rows_in_order(conn, family, sort, descending):
+    filters = {}
+    pages = _pages(conn, MATERIALIZED_TABLE, family, filters, sort, descending)
+    keys = [row[len(ROW_COLUMNS)] for page in pages for row in page['rows']]
+    assert pages[0]['total'] == len(keys)
+    assert all(page['total'] is None for page in pages[1:])
+    assert all(len(page['rows']) == PAGE_SIZE for page in pages[:-1])
+    assert keys == _expected_keys(conn, family, filters, sort_column(sort), descending)
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_keyset_pages_cross_null_lags(conn, descending):
+    # Non FS+0d rows include blank lags: NULLs sort first ascending, last descending
+    pages = _pages(conn, MATERIALIZED_TABLE, 'non-fs0d', {}, 'Lag', descending)
+    lags = [row[5] for page in pages for row in page['rows']]
+    nulls = lags.count(None)
+    assert 0 < nulls < len(lags)
+    if descending:
+        assert lags[-nulls:] == [None] * nulls
+    else:
+        assert lags[:nulls] == [None] * nulls
+    assert len(pages) > 2
+
+
+def test_filtered_pages_match_fetch_rows(conn):
+    filters = parse_filters({'driving': 'N', 'project_id': '1000'})
+    pages = _pages(conn, MATERIALIZED_TABLE, 'lags', filters, 'Lag', True)
+    rows = [tuple(row[:len(ROW_COLUMNS)]) for page in pages for row in page['rows']]
+    assert rows == fetch_rows(conn, MATERIALIZED_TABLE, 'lags', filters, 'Lag', True)
+
+
+@pytest.mark.parametrize('sort', [None, 'Lag'])
+def test_view_offset_pages_cover_rows(conn, sort):
+    pages = _pages(conn, SOURCE_VIEW, 'non-fs0d', {}, sort)
+    rows = [tuple(row) for page in pages for row in page['rows']]
+    assert sorted(rows, key=repr) == sorted(fetch_rows(conn, SOURCE_VIEW, 'non-fs0d', {}), key=repr)
+    assert pages[0]['total'] == len(rows)
+
+
+def test_offset_cursor_rejected_for_keyset_source(conn):
+    with pytest.raises(InvalidPageRequest):
+        fetch_page(conn, MATERIALIZED_TABLE, 'fs0d', {}, cursor=encode_cursor({'o': 100}))
+
+
+@pytest.mark.parametrize('state', [
+    {'k': [1]},
+    {'k': 5, 'v': {'a': 1}},
+    {'k': True},
+    {'o': 'ten'},
+    {'o': -1},
+    {'o': 1.5},
+])
+def test_malformed_cursor_rejected(conn, state):
+    for source in (MATERIALIZED_TABLE, SOURCE_VIEW):
+        with pytest.raises(InvalidPageRequest):
+            fetch_page(conn, source, 'lags', {}, sort='Lag', cursor=encode_cursor(state))
+
+
+@pytest.mark.parametrize('cursor', [encode_cursor({'k': [1]}), encode_cursor({'o': 'x'}), 'not base64!', encode_cursor([1])])
+def test_malformed_cursor_is_a_400(client, cursor):
+    response = client.get('/api/lags', query_string={'limit': 10, 'cursor': cursor})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
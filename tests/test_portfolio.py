@@ -0,0 +1,64 @@
+"""/api/portfolio-kpi returns each project's KPIs as the per-tab KPI routes do."""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from kpi_engine import portfolio_kpis
+from materialize import MATERIALIZED_TABLE
+from metric_registry import FAMILIES, parse_filters
+
+KPI_ROUTES = {
+    'fs0d': 'finalactivitykpi',
+    'non-fs0d': 'non-fs0d-kpi',
+    'leads': 'leads-kpi',
+    'lags': 'lags-kpi',
+    'excessive-lags': 'excessive-lags-kpi',
+}
+
+
+@pytest.mark.parametrize('raw', [{}, {'driving': 'N', 'relationship_type': 'PR_FS'}])
+def test_portfolio_matches_kpi_routes(client, raw):
+    portfolio = client.get('/api/portfolio-kpi', query_string=raw).get_json()
+    projects = client.get('/api/project-options').get_json()
+    assert sorted(str(project['id']) for project in portfolio) == sorted(str(p['id']) for p in projects)
+    for project in portfolio:
+        for family, route in KPI_ROUTES.items():
+            expected = client.get(f"/api/{route}", query_string=dict(raw, project_id=project['id'])).get_json()
+            assert project[family] == expected
+
+
+def test_portfolio_sort_and_project_filter(client):
+    by_name = client.get('/api/portfolio-kpi').get_json()
+    assert [project['name'] for project in by_name] == sorted(project['name'] for project in by_name)
+    by_id = client.get('/api/portfolio-kpi?sort=id&order=desc').get_json()
+    assert [str(p['id']) for p in by_id] == sorted((str(p['id']) for p in by_id), reverse=True)
+
+    by_lags = client.get('/api/portfolio-kpi?sort=lags.Lag_Percentage&order=desc').get_json()
+    values = [project['lags']['Lag_Percentage'] for project in by_lags]
+    assert values == sorted(values, reverse=True)
+    by_count = client.get('/api/portfolio-kpi?sort=leads.Leads_Count').get_json()
+    values = [project['leads']['Leads_Count'] for project in by_count]
+    assert values == sorted(values)
+
+    one = by_name[1]
+    assert client.get('/api/portfolio-kpi', query_string={'project_id': one['id']}).get_json() == [one]
+    assert client.get('/api/portfolio-kpi?project_id=not-a-project').get_json() == []
+
+
+@pytest.mark.parametrize('sort', ['nope', 'lags.nope', 'nope.Lag_Count', 'lags.Leads_Count'])
+def test_unknown_sort_is_a_400(client, sort):
+    assert client.get('/api/portfolio-kpi', query_string={'sort': sort}).status_code == 400
+
+
+def test_threaded_portfolio_matches_inline(metrics_api, monkeypatch):
+    # The workers read the API's database, so the inline reference does too
+    conn = metrics_api.pool.connection()
+    filters = parse_filters({'driving': 'Y'})
+    project_ids = [row[0] for row in conn.execute("SELECT proj_id FROM PROJECT")]
+    inline = portfolio_kpis(conn, MATERIALIZED_TABLE, filters)
+    with ThreadPoolExecutor(2) as executor, metrics_api.app.test_request_context():
+        monkeypatch.setattr(metrics_api, 'portfolio_executor', executor)
+        monkeypatch.setattr(metrics_api, 'PORTFOLIO_WORKERS', 2)
+        threaded = metrics_api.portfolio_counts(conn, MATERIALIZED_TABLE, filters, project_ids)
+    assert threaded == inline
+    assert set(next(iter(inline.values()))) == set(FAMILIES)
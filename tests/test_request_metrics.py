@@ -0,0 +1,102 @@
+"""Server-Timing headers and the /metrics Prometheus exposition."""
+import os
+import re
+
+from request_metrics import COUNTERS, HISTOGRAMS, LATENCY_BUCKETS, RequestMetrics, RequestTimer
+
+SAMPLE = re.compile(r'^([a-z_]+)(?:\{(.*)\})? (\S+)$')
+
+
+def samples(text):
+    """{(name, labels): value} of an exposition, checking every line parses."""
+    values = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            assert re.match(r'^# (HELP|TYPE) [a-z_]+ .+$', line)
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        values[(name, labels or '')] = float(value)
+    return values
+
+
+def scrape(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'text/plain; version=0.0.4; charset=utf-8'
+    return response.get_data(as_text=True)
+
+
+def test_server_timing_header(client):
+    header = client.get('/api/lags-kpi?driving=N').headers['Server-Timing']
+    names = re.findall(r'(?:^|, )([a-z]+);', header)
+    assert names[:4] == ['connect', 'sql', 'build', 'jsonify'] and names[-1] == 'total'
+    assert re.search(r'sql;dur=[\d.]+;desc="\d+ statements, \d+ rows"', header)
+
+
+def test_metrics_count_requests(client):
+    route = 'route="/api/lags-kpi"'
+    before = samples(scrape(client))
+    for _ in range(3):
+        client.get('/api/lags-kpi?driving=Y&lag=-3')
+    streamed = client.get('/api/lags?format=ndjson')
+    streamed.get_data()
+    streamed.close()
+    text = scrape(client)
+    after = samples(text)
+
+    for name in HISTOGRAMS:
+        assert f"# TYPE {name} histogram" in text
+    for name in COUNTERS:
+        assert f"# TYPE {name} counter" in text
+    key = ('metrics_api_requests_total', f'{route},status="200"')
+    assert after[key] - before.get(key, 0) == 3
+    count = ('metrics_api_request_duration_seconds_count', route)
+    assert after[count] - before.get(count, 0) == 3
+    assert after[('metrics_api_request_duration_seconds_bucket', f'{route},le="+Inf"')] == after[count]
+    # Buckets are cumulative
+    series = [after[('metrics_api_request_duration_seconds_bucket', f'{route},le="{bound}"')]
+              for bound in LATENCY_BUCKETS]
+    assert series == sorted(series)
+    assert after[('metrics_api_phase_duration_seconds_count', f'{route},phase="sql"')] == after[count]
+    # Streamed responses are recorded once their body has been sent and closed
+    key = ('metrics_api_requests_total', 'route="/api/lags",status="200"')
+    assert after[key] - before.get(key, 0) == 1
+
+
+def test_observe_and_render():
+    metrics = RequestMetrics()
+    timer = RequestTimer()
+    timer.sql, timer.statements, timer.rows = 0.004, 2, 10
+    metrics.observe('/api/x', 200, timer, 0.005, 2048)
+    metrics.observe('/api/x', 500, timer, 20.0, 0)
+    values = samples(metrics.render())
+    route = 'route="/api/x"'
+    # A value on a bucket bound counts in that bucket
+    assert values[('metrics_api_request_duration_seconds_bucket', f'{route},le="0.005"')] == 1
+    assert values[('metrics_api_request_duration_seconds_bucket', f'{route},le="10.0"')] == 1
+    assert values[('metrics_api_request_duration_seconds_bucket', f'{route},le="+Inf"')] == 2
+    assert values[('metrics_api_request_duration_seconds_sum', route)] == 20.005
+    assert values[('metrics_api_response_rows_bucket', f'{route},le="10"')] == 2
+    assert values[('metrics_api_response_bytes_bucket', f'{route},le="1024"')] == 1
+    assert values[('metrics_api_requests_total', f'{route},status="500"')] == 1
+    assert values[('metrics_api_sql_statements_total', route)] == 4
+
+
+def test_stats_dir_adds_up_live_processes(tmp_path):
+    stats_dir = str(tmp_path / 'stats')
+    first, second = RequestMetrics(stats_dir), RequestMetrics(stats_dir)
+    for metrics in (first, second):
+        metrics.observe('/api/x', 200, RequestTimer(), 0.01, 0)
+        metrics.flush()
+    # A file left behind by a process that no longer exists is dropped (POSIX only)
+    dead = os.path.join(stats_dir, '999999999-1.json')
+    if os.name != 'nt':
+        with open(dead, 'w') as f:
+            f.write('{"histograms": {}, "counters": {"metrics_api_requests_total": '
+                    '[[[["route", "/api/x"], ["status", "200"]], 5]]}}')
+    values = samples(first.render())
+    assert values[('metrics_api_requests_total', 'route="/api/x",status="200"')] == 2
+    assert values[('metrics_api_request_duration_seconds_count', 'route="/api/x"')] == 2
+    assert not os.path.exists(dead)
@@ -0,0 +1,62 @@
+"""ResultCache eviction and invalidation, and the API's use of it."""
+import result_cache
+from result_cache import ResultCache
+
+
+def test_version_change_drops_entries():
+    cache = ResultCache()
+    cache.set('a', 1, 10, 'v1')
+    assert cache.get('a', 'v1') == 1
+    assert cache.get('a', 'v2') is None
+    assert cache.stats()['invalidations'] == 1
+    assert cache.stats()['entries'] == 0
+
+
+def test_stale_set_keeps_new_entries():
+    cache = ResultCache()
+    cache.set('a', 'old', 10, 'v1')
+    assert cache.get('b', 'v2') is None  # the database changed
+    cache.set('b', 'new', 10, 'v2')
+    # A request that started before the change finishes late
+    cache.set('a', 'stale', 10, 'v1')
+    assert cache.get('b', 'v2') == 'new'
+    assert cache.get('a', 'v2') is None
+    assert cache.get('a', 'v1') is None
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = ResultCache(max_entries=2, max_bytes=100)
+    cache.set('a', 1, 10, 'v')
+    cache.set('b', 2, 10, 'v')
+    cache.get('a', 'v')
+    cache.set('c', 3, 10, 'v')
+    assert cache.get('b', 'v') is None
+    assert cache.get('a', 'v') == 1
+    cache.set('d', 4, 95, 'v')
+    assert cache.stats()['bytes'] == 95
+    cache.set('huge', 5, 101, 'v')
+    assert cache.get('huge', 'v') is None
+    assert cache.stats()['evictions'] == 3
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    cache = ResultCache(ttl=5)
+    cache.set('a', 1, 10, 'v')
+    now[0] += 4.9
+    assert cache.get('a', 'v') == 1
+    now[0] += 0.2
+    assert cache.get('a', 'v') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_api_serves_repeats_from_cache(client):
+    before = client.get('/api/cache-stats').get_json()
+    first = client.get('/api/leads-kpi?driving=N&lag=-3')
+    # Same filters, normalized: 'All' is dropped, '-3.0' parses as -3
+    second = client.get('/api/leads-kpi?lag=-3.0&driving=N&project_id=All')
+    after = client.get('/api/cache-stats').get_json()
+    assert second.get_data() == first.get_data()
+    assert after['hits'] == before['hits'] + 1
+    assert after['misses'] == before['misses'] + 1
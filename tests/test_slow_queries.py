@@ -0,0 +1,84 @@
+"""The slow-query log: entries from timed connections, rotation and the summary."""
+import os
+import sqlite3
+
+import request_metrics
+import slow_queries
+from materialize import MATERIALIZED_TABLE
+from slow_queries import SlowQueryLog, inline_params, read_entries, sql_shape, summarize
+
+
+def test_sql_shape_and_inline_params():
+    assert sql_shape("SELECT *\n  FROM t WHERE a IN (?, ?, ?)") == sql_shape("SELECT * FROM t WHERE a IN (?)")
+    assert sql_shape("SELECT * FROM t WHERE a IN (?, ?)") == "SELECT * FROM t WHERE a IN (?...)"
+    assert inline_params(
+        "SELECT '?' FROM t WHERE a = ? AND b IN (?, ?) AND c = ?", ["it's", 2, None, 1.5]
+    ) == "SELECT '?' FROM t WHERE a = 'it''s' AND b IN (2, NULL) AND c = 1.5"
+    assert inline_params("SELECT :a", {'a': 1}) == "SELECT :a"
+
+
+def test_timed_connection_logs_statements(schedule_db, tmp_path, monkeypatch):
+    path = str(tmp_path / 'slow.log')
+    monkeypatch.setattr(request_metrics.TimedConnection, 'slow_log', SlowQueryLog(path, threshold_ms=0))
+    conn = sqlite3.connect(schedule_db, factory=request_metrics.TimedConnection)
+    request_metrics.start('/api/lags?driving=Y')
+    try:
+        rows = conn.execute(
+            f"SELECT Lag FROM {MATERIALIZED_TABLE} WHERE Driving = ? AND RelationshipType IN (?, ?)",
+            ('Y', 'PR_FS', 'PR_SS'),
+        ).fetchall()
+    finally:
+        request_metrics.stop()
+        conn.close()
+    entries = list(read_entries(path))
+    assert len(entries) == 1
+    entry = entries[0]
+    assert entry['request'] == '/api/lags?driving=Y'
+    assert entry['rows'] == len(rows) > 0
+    assert entry['params'] == ['Y', 'PR_FS', 'PR_SS']
+    assert "Driving = 'Y' AND RelationshipType IN ('PR_FS', 'PR_SS')" in entry['bound_sql']
+    assert entry['plan'] and entry['shape'] == slow_queries.shape_id(entry['sql'])
+
+
+def test_rotation_keeps_backups(schedule_db, tmp_path):
+    path = str(tmp_path / 'slow.log')
+    log = SlowQueryLog(path, threshold_ms=0, max_bytes=2000, backups=2)
+    conn = sqlite3.connect(schedule_db)
+    try:
+        for number in range(40):
+            sql = f"SELECT {number} FROM {MATERIALIZED_TABLE} WHERE Lag > ?"
+            log.record(conn, sql, [number], 0.01 * number, 1)
+    finally:
+        conn.close()
+    assert os.path.exists(path + '.1') and os.path.exists(path + '.2')
+    assert not os.path.exists(path + '.3') and not os.path.exists(path + '.lock')
+    assert all(os.path.getsize(p) < 2000 + 1000 for p in (path + '.1', path + '.2'))
+    # Oldest file first; the entries dropped with the third backup are the earliest
+    numbers = [entry['params'][0] for entry in read_entries(path)]
+    assert numbers == sorted(numbers) and numbers[-1] == 39 and numbers[0] > 0
+
+
+def test_summary_groups_shapes(tmp_path, capsys):
+    path = str(tmp_path / 'slow.log')
+    log = SlowQueryLog(path, threshold_ms=0)
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE t (a)")
+    in_list = "SELECT * FROM t WHERE a IN ({})"
+    log.record(conn, in_list.format('?, ?'), [1, 2], 0.3, 5, '/api/lags?x=1')
+    log.record(conn, in_list.format('?'), [1], 0.9, 7, '/api/leads')
+    log.record(conn, "SELECT count(*) FROM t", [], 1.0, 1)
+    conn.close()
+
+    shapes = summarize(read_entries(path))
+    assert len(shapes) == 2
+    summary = shapes[slow_queries.shape_id(in_list.format('?'))]
+    assert (summary['count'], summary['total_ms'], summary['max_ms']) == (2, 1200.0, 900.0)
+    assert summary['requests'] == {'/api/lags': 1, '/api/leads': 1}
+    assert summary['slowest']['rows'] == 7
+
+    slow_queries.print_report(shapes, sort='count', top=1)
+    report = capsys.readouterr().out
+    assert report.startswith('3 slow queries in 2 shapes; top 1 by count')
+    assert 'SELECT * FROM t WHERE a IN (1)' in report
+    assert 'hint:    full scan of t' in report
+    assert summarize(read_entries(path), since='9999') == {}
@@ -0,0 +1,42 @@
+"""Streamed NDJSON and chunked JSON rows equal the plain JSON response."""
+import json
+
+import pytest
+
+from materialize import MATERIALIZED_TABLE
+from row_queries import stream_rows
+
+QUERIES = [
+    {},
+    {'sort': 'Lag', 'order': 'desc'},
+    {'driving': 'N', 'sort': 'Pred. Name'},
+    {'project_id': 'not-a-project'},
+]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+@pytest.mark.parametrize('route', ['typical-non-fs0d', 'lags'])
+def test_streams_match_json(client, route, query):
+    expected = client.get(f"/api/{route}", query_string=query).get_json()
+
+    ndjson = client.get(f"/api/{route}", query_string=dict(query, format='ndjson'))
+    assert ndjson.mimetype == 'application/x-ndjson'
+    assert ndjson.is_streamed
+    assert [json.loads(line) for line in ndjson.get_data(as_text=True).splitlines()] == expected
+
+    array = client.get(f"/api/{route}", query_string=dict(query, format='json-stream'))
+    assert array.mimetype == 'application/json'
+    assert json.loads(array.get_data(as_text=True)) == expected
+
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'json-stream'])
+def test_batches_split_rows(conn, fmt):
+    # Small batches: the joined chunks must not depend on where a batch ends
+    whole = ''.join(stream_rows(conn, MATERIALIZED_TABLE, 'lags', {}, fmt, 'Lag'))
+    chunks = list(stream_rows(conn, MATERIALIZED_TABLE, 'lags', {}, fmt, 'Lag', batch_size=7))
+    assert len(chunks) > 2
+    assert ''.join(chunks) == whole
+
+
+def test_bad_stream_sort_is_a_400(client):
+    assert client.get('/api/lags?format=ndjson&sort=nope').status_code == 400
@@ -0,0 +1,143 @@
+"""XER imports load every file's rows.
+
+Incremental re-imports must leave the same database as a full import.
+"""
+import os
+import random
+import sqlite3
+
+import generate_schedule
+import materialize
+from materialize import MATERIALIZED_TABLE, ROLLUP_TABLE
+from xer_to_sqlite import import_xer
+
+XER_TABLES = list(generate_schedule.TABLES)
+
+
+def schedule_tables(projects, seed=3, relationships=300):
+    """{project index: {table: [rows]}} of generated schedules."""
+    rng = random.Random(seed)
+    next_ids = {'wbs': 1, 'task': 1, 'pred': 1}
+    schedules = {}
+    for index in range(projects):
+        tables = schedules[index] = {table: [] for table in XER_TABLES}
+        for table, row in generate_schedule.project_rows(index, relationships, rng, next_ids):
+            tables[table].append(list(row))
+    return schedules
+
+
+def write_xer(path, tables):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='cp1252', newline='') as xer:
+        xer.write('ERMHDR\t19.12\t2024-03-31\tProject\tadmin\r\n')
+        for table, rows in tables.items():
+            xer.write(f"%T\t{table}\r\n")
+            xer.write('%F\t' + '\t'.join(generate_schedule.TABLES[table]) + '\r\n')
+            for row in rows:
+                xer.write('%R\t' + '\t'.join('' if value is None else str(value) for value in row) + '\r\n')
+        xer.write('%E\r\n')
+
+
+def new_database(path):
+    """Empty database with the relationship view, as the dashboard expects it."""
+    conn = sqlite3.connect(path)
+    conn.execute(generate_schedule.VIEW_SQL)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def dump(path):
+    """Every XER table, the materialized rows (less Rel_Key) and the cube, sorted."""
+    conn = sqlite3.connect(path)
+    try:
+        columns = [
+            row[1] for row in conn.execute(f"PRAGMA table_info({MATERIALIZED_TABLE})") if row[1] != 'Rel_Key'
+        ]
+        queries = {table: f"SELECT * FROM {table}" for table in XER_TABLES}
+        queries[MATERIALIZED_TABLE] = f"SELECT {', '.join(columns)} FROM {MATERIALIZED_TABLE}"
+        queries[ROLLUP_TABLE] = f"SELECT * FROM {ROLLUP_TABLE}"
+        return {name: sorted(conn.execute(sql).fetchall(), key=repr) for name, sql in queries.items()}
+    finally:
+        conn.close()
+
+
+def test_full_import_loads_every_file(tmp_path):
+    folder = str(tmp_path / 'Xer')
+    schedules = schedule_tables(3)
+    for index in range(3):
+        write_xer(os.path.join(folder, f"proj{index}.xer"), schedules[index])
+    db = new_database(str(tmp_path / 'mydata.db'))
+    reports = import_xer([folder], db, workers=2)
+    assert len(reports) == 3
+    assert all(report['seconds'] >= 0 and report['peak_mb'] > 0 for report in reports)
+
+    conn = sqlite3.connect(db)
+    try:
+        for table in XER_TABLES:
+            written = [
+                tuple(None if value in (None, '') else str(value) for value in row)
+                for schedule in schedules.values() for row in schedule[table]
+            ]
+            stored = conn.execute(f"SELECT * FROM {table}").fetchall()
+            assert sorted(stored, key=repr) == sorted(written, key=repr)
+        assert sum(report['rows'] for report in reports) == sum(
+            len(rows) for schedule in schedules.values() for rows in schedule.values()
+        )
+        view = conn.execute("SELECT COUNT(*) FROM ActivityRelationshipView").fetchone()
+        assert conn.execute(f"SELECT COUNT(*) FROM {MATERIALIZED_TABLE}").fetchone() == view
+    finally:
+        conn.close()
+
+
+def imported_names(reports):
+    return sorted(os.path.relpath(report['file'], os.path.dirname(os.path.dirname(report['file'])))
+                  for report in reports)
+
+
+def test_incremental_import_matches_full(tmp_path):
+    folder = str(tmp_path / 'Xer')
+    schedules = schedule_tables(4)
+    for index in range(3):
+        write_xer(os.path.join(folder, f"proj{index}.xer"), schedules[index])
+    db = new_database(str(tmp_path / 'incremental.db'))
+    assert len(import_xer([folder], db, workers=2)) == 3
+    assert materialize.table_exists(sqlite3.connect(db), MATERIALIZED_TABLE)
+
+    # proj0: a lag changed and a relationship removed; proj1: untouched;
+    # proj2: an activity completed; proj3: a new file
+    taskpred = schedules[0]['TASKPRED']
+    taskpred[0][-1] = '96'
+    del taskpred[5]
+    task = schedules[2]['TASK']
+    task[-1][6] = 'TK_Complete'
+    for index in (0, 2, 3):
+        write_xer(os.path.join(folder, f"proj{index}.xer"), schedules[index])
+
+    reports = import_xer([folder], db, workers=2)
+    assert imported_names(reports) == [os.path.join('Xer', f"proj{index}.xer") for index in (0, 2, 3)]
+    assert import_xer([folder], db, workers=2) == []
+
+    full = new_database(str(tmp_path / 'full.db'))
+    import_xer([folder], full, workers=2, full=True)
+    assert dump(db) == dump(full)
+
+
+def test_same_named_files_in_other_folders(tmp_path):
+    schedules = schedule_tables(2, seed=5)
+    first = str(tmp_path / 'site-a' / 'schedule.xer')
+    second = str(tmp_path / 'site-b' / 'schedule.xer')
+    write_xer(first, schedules[0])
+    write_xer(second, schedules[1])
+    db = new_database(str(tmp_path / 'incremental.db'))
+    import_xer([first, second], db, workers=2)
+    assert import_xer([first, second], db, workers=2) == []
+
+    schedules[1]['TASKPRED'][0][-1] = '-16'
+    write_xer(second, schedules[1])
+    reports = import_xer([first, second], db, workers=2)
+    assert imported_names(reports) == [os.path.join('site-b', 'schedule.xer')]
+
+    full = new_database(str(tmp_path / 'full.db'))
+    import_xer([first, second], full, workers=2, full=True)
+    assert dump(db) == dump(full)
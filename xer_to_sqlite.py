@@ -0,0 +1,461 @@
+"""Load Primavera XER files into mydata.db.
+
+Every XER file is parsed in its own worker process: the %T / %F / %R records
+are read line by line and bulk-inserted with executemany into a scratch SQLite
+file, so memory stays flat whatever the file size.  The main process copies
+the scratch files into staging tables with INSERT ... SELECT, then swaps them
+in and builds the indexes in one transaction (readers keep the previous data
+until it commits), and finally refreshes the materialized tables
+(materialize.py) when ActivityRelationshipView exists.
+
+Re-imports are incremental.  The SHA-256 of every file and of every table
+section in it is kept in XerImportFile / XerImportSection, keyed by the file's
+absolute path so same-named files in other folders don't collide: unchanged
+files are not parsed at all, and in a changed file only the sections whose
+hash changed are rewritten, one transaction per file.  A rewritten section
+first deletes the rows of the file's projects (proj_id, including projects the
+file held last time) and the rows whose key (the first field, e.g. task_id) it
+brings again, then inserts its rows.  Only the affected projects are re-materialized
+(materialize.refresh_projects()); a change to rows without a proj_id
+(resources, global calendars, ...) re-materializes everything.  --full, or a
+database without import history, replaces the tables from the given files.
+
+Rows of XER files that are removed from the folder stay in the database until
+the next --full import.
+
+Usage:
+    python xer_to_sqlite.py [XER files or folders ...] [--db mydata.db] [--workers N] [--full]
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import materialize
+
+# Defaults when no paths are given on the command line
+xer_folder = os.environ.get('METRICS_XER_FOLDER', 'Xer')
+db_path = os.environ.get('METRICS_DB_PATH', 'mydata.db')
+
+XER_ENCODING = 'cp1252'
+BATCH_SIZE = 5000
+STAGING_PREFIX = 'xer_import_'
+FILE_HASH_TABLE = 'XerImportFile'
+SECTION_HASH_TABLE = 'XerImportSection'
+PROJECT_COLUMN = 'proj_id'
+
+# Join columns of the XER tables, indexed once the rows are loaded (the key
+# column, the first field of every table, is indexed too for re-import deletes)
+XER_INDEXES = {
+    'PROJECT': ('proj_id',),
+    'PROJWBS': ('wbs_id', 'proj_id'),
+    'TASK': ('task_id', 'proj_id', 'wbs_id'),
+    'TASKPRED': ('task_id', 'pred_task_id', 'proj_id'),
+    'CALENDAR': ('clndr_id',),
+}
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process in MB, or None where it can't be read."""
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_memory_mb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _windows_peak_memory_mb():
+    try:
+        import ctypes
+        from ctypes import wintypes
+        psapi = ctypes.windll.psapi
+        kernel32 = ctypes.windll.kernel32
+    except (ImportError, AttributeError, OSError):
+        return None
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize / (1024 * 1024)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as xer:
+        for block in iter(lambda: xer.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_xer(xer_path, scratch_path, encoding=XER_ENCODING):
+    """Worker: stream one XER file into scratch_path.  Returns a report dict.
+
+    Empty fields become NULL and short %R records are padded to the %F width.
+    The report carries each table section's hash and the file's proj_ids.
+    """
+    started = time.perf_counter()
+    conn = sqlite3.connect(scratch_path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("BEGIN")
+    tables = {}
+    hashes = {}
+    table = insert = digest = None
+    width = 0
+    batch = []
+    row_count = 0
+
+    def flush():
+        nonlocal batch, row_count
+        if batch:
+            conn.executemany(insert, batch)
+            row_count += len(batch)
+            batch = []
+
+    with open(xer_path, encoding=encoding, errors='replace', newline='') as xer:
+        for line in xer:
+            kind, _, rest = line.rstrip('\r\n').partition('\t')
+            if kind == '%R':
+                if insert is None:
+                    continue
+                digest.update(line.encode('utf-8'))
+                values = [value if value != '' else None for value in rest.split('\t')]
+                if len(values) != width:
+                    values = (values + [None] * width)[:width]
+                batch.append(values)
+                if len(batch) >= BATCH_SIZE:
+                    flush()
+            elif kind == '%T':
+                flush()
+                table, insert, digest = rest.strip(), None, None
+            elif kind == '%F' and table:
+                if table in tables:
+                    print(f"{xer_path}: duplicate %T {table}, keeping the first section")
+                    continue
+                fields = rest.split('\t')
+                tables[table] = fields
+                digest = hashes[table] = hashlib.sha256(line.encode('utf-8'))
+                width = len(fields)
+                columns = ', '.join(f"{_quote(field)} TEXT" for field in fields)
+                conn.execute(f"CREATE TABLE {_quote(table)} ({columns})")
+                insert = f"INSERT INTO {_quote(table)} VALUES ({', '.join('?' for _ in fields)})"
+            elif kind == '%E':
+                break
+        flush()
+    conn.execute("COMMIT")
+    projects = set()
+    for table, fields in tables.items():
+        if PROJECT_COLUMN in fields:
+            projects.update(
+                project_id for project_id, in conn.execute(
+                    f"SELECT DISTINCT {PROJECT_COLUMN} FROM {_quote(table)} "
+                    f"WHERE {PROJECT_COLUMN} IS NOT NULL"
+                )
+            )
+    conn.close()
+    return {
+        "file": xer_path,
+        "scratch": scratch_path,
+        "tables": tables,
+        "hashes": {table: digest.hexdigest() for table, digest in hashes.items()},
+        "projects": sorted(projects),
+        "rows": row_count,
+        "seconds": time.perf_counter() - started,
+        "peak_mb": peak_memory_mb(),
+    }
+
+
+def _parse_job(job):
+    return parse_xer(*job)
+
+
+def _load_staging(conn, reports):
+    """Create xer_import_<table> with every file's columns and copy the scratch files in."""
+    columns = {}
+    for report in reports:
+        for table, fields in report['tables'].items():
+            known = columns.setdefault(table, [])
+            known.extend(field for field in fields if field not in known)
+    for table, fields in columns.items():
+        staging = _quote(STAGING_PREFIX + table)
+        conn.execute(f"DROP TABLE IF EXISTS {staging}")
+        conn.execute(f"CREATE TABLE {staging} ({', '.join(f'{_quote(f)} TEXT' for f in fields)})")
+    for report in reports:
+        conn.execute("ATTACH DATABASE ? AS xer", (report['scratch'],))
+        try:
+            conn.execute("BEGIN")
+            for table, fields in report['tables'].items():
+                names = ', '.join(_quote(field) for field in fields)
+                conn.execute(
+                    f"INSERT INTO main.{_quote(STAGING_PREFIX + table)} ({names}) "
+                    f"SELECT {names} FROM xer.{_quote(table)}"
+                )
+            conn.execute("COMMIT")
+        finally:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            conn.execute("DETACH DATABASE xer")
+    return columns
+
+
+def _create_indexes(conn, table, fields):
+    for column in dict.fromkeys(fields[:1] + list(XER_INDEXES.get(table, ()))):
+        if column in fields:
+            index = _quote(f"idx_{table.lower()}_{column.lower()}")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {index} ON {_quote(table)} ({_quote(column)})")
+
+
+def _swap_in(conn, columns):
+    """Replace each table by its staging copy and index it, in one transaction."""
+    # Views (ActivityRelationshipView) reference the tables by name; legacy
+    # rename skips re-validating them while the old table is gone
+    conn.execute("PRAGMA legacy_alter_table=ON")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table, fields in columns.items():
+            conn.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+            conn.execute(f"ALTER TABLE {_quote(STAGING_PREFIX + table)} RENAME TO {_quote(table)}")
+            _create_indexes(conn, table, fields)
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.execute("PRAGMA legacy_alter_table=OFF")
+    conn.execute("ANALYZE")
+
+
+def _ensure_tracking(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {FILE_HASH_TABLE} ("
+        f"File TEXT PRIMARY KEY, Hash TEXT NOT NULL, Projects TEXT NOT NULL, Imported_At TEXT NOT NULL)"
+    )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {SECTION_HASH_TABLE} ("
+        f"File TEXT NOT NULL, Table_Name TEXT NOT NULL, Hash TEXT NOT NULL, "
+        f"PRIMARY KEY (File, Table_Name)) WITHOUT ROWID"
+    )
+
+
+def file_key(path):
+    """Key of a file in the import history: its normalized absolute path."""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _record_file(conn, report, digest):
+    """Store report's file and section hashes; runs inside the caller's transaction."""
+    name = file_key(report['file'])
+    conn.execute(
+        f"INSERT OR REPLACE INTO {FILE_HASH_TABLE} VALUES (?, ?, ?, ?)",
+        (name, digest, json.dumps(report['projects']),
+         datetime.datetime.now().isoformat(timespec='seconds'))
+    )
+    conn.execute(f"DELETE FROM {SECTION_HASH_TABLE} WHERE File = ?", (name,))
+    conn.executemany(
+        f"INSERT INTO {SECTION_HASH_TABLE} VALUES (?, ?, ?)",
+        [(name, table, section_hash) for table, section_hash in report['hashes'].items()]
+    )
+
+
+def _ensure_columns(conn, table, fields):
+    """Create table (or add the fields it lacks) in main, with its indexes."""
+    existing = [row[1] for row in conn.execute(f"PRAGMA main.table_info({_quote(table)})")]
+    if not existing:
+        conn.execute(f"CREATE TABLE main.{_quote(table)} ({', '.join(f'{_quote(f)} TEXT' for f in fields)})")
+    for field in fields:
+        if existing and field not in existing:
+            conn.execute(f"ALTER TABLE main.{_quote(table)} ADD COLUMN {_quote(field)} TEXT")
+    _create_indexes(conn, table, existing + [f for f in fields if f not in existing])
+
+
+def _apply_changes(conn, report, digest):
+    """Rewrite the sections of report whose hash changed, in one transaction.
+
+    Returns (changed tables, affected proj_ids, whether rows without a proj_id changed).
+    """
+    name = file_key(report['file'])
+    recorded = dict(conn.execute(
+        f"SELECT Table_Name, Hash FROM {SECTION_HASH_TABLE} WHERE File = ?", (name,)
+    ).fetchall())
+    previous = conn.execute(f"SELECT Projects FROM {FILE_HASH_TABLE} WHERE File = ?", (name,)).fetchone()
+    projects = sorted(set(report['projects']) | set(json.loads(previous[0]) if previous else ()))
+
+    changed = []
+    unowned = False
+    conn.execute("ATTACH DATABASE ? AS xer", (report['scratch'],))
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for table, fields in report['tables'].items():
+            if recorded.get(table) == report['hashes'][table]:
+                continue
+            _ensure_columns(conn, table, fields)
+            target, names, key = f"main.{_quote(table)}", ', '.join(_quote(f) for f in fields), _quote(fields[0])
+            conditions = [f"{key} IN (SELECT {key} FROM xer.{_quote(table)})"]
+            params = []
+            if PROJECT_COLUMN in fields and projects:
+                conditions.append(f"{PROJECT_COLUMN} IN ({', '.join('?' for _ in projects)})")
+                params = projects
+            if PROJECT_COLUMN not in fields or conn.execute(
+                    f"SELECT 1 FROM xer.{_quote(table)} WHERE {PROJECT_COLUMN} IS NULL LIMIT 1").fetchone():
+                unowned = True
+            conn.execute(f"DELETE FROM {target} WHERE {' OR '.join(conditions)}", params)
+            conn.execute(f"INSERT INTO {target} ({names}) SELECT {names} FROM xer.{_quote(table)}")
+            changed.append(table)
+        _record_file(conn, report, digest)
+        conn.execute("COMMIT")
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        conn.execute("DETACH DATABASE xer")
+    return changed, projects, unowned
+
+
+def xer_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith('.xer')
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def _parse_all(files, scratch_dir, workers, encoding):
+    jobs = [
+        (path, os.path.join(scratch_dir, f"{index}.db"), encoding)
+        for index, path in enumerate(files)
+    ]
+    reports = []
+    # One process per file, so each report's peak memory is that file's alone
+    with multiprocessing.Pool(workers, maxtasksperchild=1) as pool:
+        for report in pool.imap_unordered(_parse_job, jobs):
+            peak = f"{report['peak_mb']:.1f} MB" if report['peak_mb'] is not None else "n/a"
+            print(f"Parsed {os.path.basename(report['file'])}: {report['rows']} rows in "
+                  f"{len(report['tables'])} tables in {report['seconds']:.2f}s, peak memory {peak}")
+            reports.append(report)
+    reports.sort(key=lambda report: files.index(report['file']))
+    return reports
+
+
+def _refresh_materialized(target_db, projects=None):
+    """materialize.refresh(), or refresh_projects() for just projects."""
+    conn = sqlite3.connect(target_db)
+    try:
+        has_view = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = ?", (materialize.SOURCE_VIEW,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not has_view:
+        print(f"{materialize.SOURCE_VIEW} not found; skipped materialize.refresh()")
+    elif projects is None:
+        materialize.refresh(target_db)
+    elif projects:
+        materialize.refresh_projects(target_db, projects)
+
+
+def import_xer(paths, target_db, workers=None, encoding=XER_ENCODING, full=False):
+    """Import the new and changed files of paths into target_db and refresh the materialized tables.
+
+    full (or a database without import history) replaces the tables from every file.
+    """
+    started = time.perf_counter()
+    files = xer_files(paths)
+    if not files:
+        print("No XER files found")
+        return []
+
+    conn = sqlite3.connect(target_db, isolation_level=None, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        _ensure_tracking(conn)
+        recorded = dict(conn.execute(f"SELECT File, Hash FROM {FILE_HASH_TABLE}").fetchall())
+    finally:
+        conn.close()
+    full = full or not recorded
+    digests = {path: file_hash(path) for path in files}
+    if not full:
+        unchanged = [path for path in files if recorded.get(file_key(path)) == digests[path]]
+        for path in unchanged:
+            print(f"Unchanged {os.path.basename(path)}, skipped")
+        files = [path for path in files if path not in unchanged]
+        if not files:
+            print(f"No changed XER files; import finished in {time.perf_counter() - started:.2f}s")
+            return []
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(files)))
+    scratch_dir = tempfile.mkdtemp(prefix='xer_import_', dir=os.path.dirname(os.path.abspath(target_db)))
+    try:
+        reports = _parse_all(files, scratch_dir, workers, encoding)
+
+        loaded = time.perf_counter()
+        affected = set()
+        unowned = False
+        conn = sqlite3.connect(target_db, isolation_level=None, timeout=30)
+        try:
+            if full:
+                columns = _load_staging(conn, reports)
+                _swap_in(conn, columns)
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(f"DELETE FROM {FILE_HASH_TABLE}")
+                conn.execute(f"DELETE FROM {SECTION_HASH_TABLE}")
+                for report in reports:
+                    _record_file(conn, report, digests[report['file']])
+                conn.execute("COMMIT")
+            else:
+                for report in reports:
+                    changed, projects, file_unowned = _apply_changes(conn, report, digests[report['file']])
+                    print(f"Updated {os.path.basename(report['file'])}: "
+                          f"{', '.join(changed) or 'no changed tables'} "
+                          f"({len(projects)} projects)")
+                    if changed:
+                        affected.update(projects)
+                        unowned = unowned or file_unowned
+        finally:
+            conn.close()
+        print(f"Loaded {sum(r['rows'] for r in reports)} rows from {len(files)} files into "
+              f"{target_db} in {time.perf_counter() - loaded:.2f}s")
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    _refresh_materialized(target_db, None if full or unowned else affected)
+    print(f"Import finished in {time.perf_counter() - started:.2f}s")
+    return reports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='*', help=f"XER files or folders (default: {xer_folder})")
+    parser.add_argument('--db', default=db_path, help=f"SQLite database (default: {db_path})")
+    parser.add_argument('--workers', type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument('--encoding', default=XER_ENCODING)
+    parser.add_argument('--full', action='store_true', help="replace the tables from every file, changed or not")
+    args = parser.parse_args()
+    import_xer(args.paths or [xer_folder], args.db, args.workers, args.encoding, args.full)